@@ -1,19 +1,23 @@
 import streamlit as st
-from PIL import Image
 import folium
 from streamlit_folium import st_folium
 import pandas as pd
 from datetime import datetime, timedelta
-import requests
 import json
-from utils.config import CSV_REGISTROS
+from utils.config import CSV_REGISTROS, RUTA_MODELO, COORDENADAS_POR_DEFECTO, URL_UBICACION_IP, TTL_UBICACION_IP_S
+from src.data.location import get_ip_locator
+from src.detection.preprocessing import PreparedImage
 from utils.helpers import asegurar_archivo_registros, calcular_impacto_ambiental, obtener_centros_reciclaje_panama
-from utils.detection import ejecutar_deteccion_analisis_gemini
+from utils.detection import detectar_residuos, ejecutar_deteccion_analisis_gemini, mostrar_analisis, mostrar_detecciones
 from utils.dashboard import mostrar_dashboard
+from src.detection.model_registry import registro_modelos
 
 # Asegurar que el archivo de registros exista
 asegurar_archivo_registros(CSV_REGISTROS)
 
+# Precargar y calentar el modelo al arrancar; es idempotente entre reruns
+registro_modelos.preload(RUTA_MODELO)
+
 # Configuración de página mejorada
 st.set_page_config(
     page_title='Sistema de Gestión de Residuos',
@@ -69,15 +73,9 @@ st.markdown("""
 """, unsafe_allow_html=True)
 
 # Función para obtener ubicación actual
+# Respaldo aproximado por IP (la consulta corre en segundo plano y se cachea); el GPS del EXIF de la foto tiene prioridad
 def obtener_ubicacion_actual():
-    try:
-        response = requests.get('http://ip-api.com/json/', timeout=5)
-        if response.status_code == 200:
-            data = response.json()
-            return f"{data.get('lat', 8.98)}, {data.get('lon', -79.52)}"
-    except:
-        pass
-    return "8.98, -79.52"
+    return get_ip_locator(URL_UBICACION_IP, TTL_UBICACION_IP_S).get()
 
 
 # Función para mostrar mapa interactivo
@@ -152,8 +150,12 @@ if pagina == "Registro de Residuos":
         # Ubicación automática
         if st.button("Obtener Ubicación Actual"):
             ubicacion_actual = obtener_ubicacion_actual()
-            st.session_state.ubicacion_actual = ubicacion_actual
-            st.success(f"Ubicación obtenida: {ubicacion_actual}")
+            if ubicacion_actual:
+                st.session_state.ubicacion_actual = ubicacion_actual
+                st.session_state.gps_in = ubicacion_actual
+                st.success(f"Ubicación obtenida: {ubicacion_actual}")
+            else:
+                st.info("Consultando la ubicación aproximada en segundo plano; presiona de nuevo en unos segundos.")
 
         entrada_sector = st.text_input(
             "Sector / Corregimiento:",
@@ -162,11 +164,13 @@ if pagina == "Registro de Residuos":
             help="Ingresa el sector o corregimiento donde se encuentra el residuo"
         )
 
+        # El valor del campo vive solo en session_state (el botón de ubicación lo actualiza antes de dibujarlo)
+        if 'gps_in' not in st.session_state:
+            st.session_state.gps_in = COORDENADAS_POR_DEFECTO
         entrada_coordenadas = st.text_input(
             "Coordenadas GPS (Lat, Long):",
             key='gps_in',
-            value=st.session_state.get('ubicacion_actual', '8.98, -79.52'),
-            help="Formato: latitud, longitud (ej: 8.98, -79.52)"
+            help="Formato: latitud, longitud (ej: 8.98, -79.52). Si la foto trae GPS en su EXIF, se usa ese en su lugar"
         )
 
         # Tipo de reporte
@@ -192,10 +196,10 @@ if pagina == "Registro de Residuos":
                 type=["jpg", "jpeg", "png"],
                 help="Sube una foto clara del área con residuos"
             )
-            img = Image.open(uploaded).convert("RGB") if uploaded else None
+            imagen_preparada = PreparedImage(uploaded) if uploaded else None
         else:
             camera_image = st.camera_input("Captura con la cámara del dispositivo")
-            img = Image.open(camera_image).convert("RGB") if camera_image else None
+            imagen_preparada = PreparedImage(camera_image) if camera_image else None
 
         # Barra lateral para configuración de detección
         st.sidebar.header("Configuración de Detección")
@@ -203,7 +207,7 @@ if pagina == "Registro de Residuos":
             "Umbral de Confianza Mínima:",
             0.0, 1.0, 0.5, 0.05,
             key='conf_threshold',
-            help="Solo se registrarán residuos detectados con certeza superior a este valor"
+            help="Solo se registrarán residuos detectados con certeza superior a este valor; cambiarlo no repite el análisis"
         )
         modelo_ia = st.sidebar.selectbox(
             "Modelo de IA preferido:",
@@ -213,50 +217,80 @@ if pagina == "Registro de Residuos":
         )
 
         # Procesar imagen si está disponible
-        if img is not None:
-            imagen_mostrar = img
-            procesada = False
+        # La foto se decodifica recién al analizarla, al tamaño del modelo (modo draft en JPEG)
+        if imagen_preparada is not None:
+            archivo_actual = uploaded if metodo_captura == "Subir archivo" else camera_image
+            fuente = "upload" if metodo_captura == "Subir archivo" else "webcam"
+            nombre_archivo = getattr(uploaded, "name", "captura_camara") if metodo_captura == "Subir archivo" else "captura_webcam"
+            clave_imagen = getattr(archivo_actual, "file_id", nombre_archivo)
+
+            # GPS y fecha de captura leídos del encabezado EXIF; tienen prioridad sobre el formulario
+            metadatos_exif = imagen_preparada.exif()
+            coordenadas_foto = metadatos_exif['coordenadas'] or entrada_coordenadas
+            if metadatos_exif['coordenadas'] or metadatos_exif['timestamp']:
+                st.caption(
+                    f"EXIF de la foto: GPS {metadatos_exif['coordenadas'] or 'no disponible'}, "
+                    f"capturada {metadatos_exif['timestamp'] or 'sin fecha'}. Estos datos se usarán en el registro."
+                )
 
             if st.button("Analizar Residuos", type="primary", use_container_width=True):
                 with st.spinner("Analizando imagen con IA..."):
                     try:
-                        fuente = "upload" if metodo_captura == "Subir archivo" else "webcam"
-                        nombre_archivo = getattr(uploaded, "name", "captura_camara") if metodo_captura == "Subir archivo" else "captura_webcam"
-
-                        usar_gemini = modelo_ia == "YOLOv8 + Gemini"
-                        resultado = ejecutar_deteccion_analisis_gemini(
-                            img, fuente, nombre_archivo,
-                            entrada_sector, entrada_coordenadas, umbral_confianza, usar_gemini
-                        )
-
-                        if resultado:
-                            total_items = resultado.get('total_items', 0)
-                            st.success(f"✅ Análisis completado exitosamente! Se detectaron {total_items} ítems.")
-
-                            # Mostrar imagen procesada si está disponible
-                            if 'imagen_procesada' in resultado:
-                                imagen_mostrar = resultado['imagen_procesada']
-                                procesada = True
-
-                            # Mostrar resultados
-                            st.subheader("Resultados del Análisis")
-                            col_res1, col_res2, col_res3 = st.columns(3)
-
-                            with col_res1:
-                                peso_estimado = resultado.get('peso_total', 0)
-                                st.metric("Peso Estimado Total", f"{peso_estimado:.1f} kg")
-                            with col_res2:
-                                impacto_co2 = calcular_impacto_ambiental(pd.DataFrame([resultado]))
-                                st.metric("CO₂ Ahorrado", f"{impacto_co2:.1f} kg")
-                            with col_res3:
-                                st.metric("Confianza Mínima", f"{umbral_confianza*100:.0f}%")
-
+                        deteccion = detectar_residuos(imagen_preparada)
+                        if deteccion is not None:
+                            st.session_state.deteccion_cruda = deteccion
+                            st.session_state.clave_deteccion = clave_imagen
                         else:
                             st.error("❌ Error: El modelo de detección YOLO no se pudo cargar. Verifica que el archivo 'models/best.pt' exista y sea válido.")
-
                     except Exception as e:
                         st.error(f"❌ Error durante el análisis: {str(e)}")
 
+            # Las cajas crudas quedan en la sesión: mover el umbral solo las vuelve a filtrar
+            deteccion = st.session_state.get('deteccion_cruda') if st.session_state.get('clave_deteccion') == clave_imagen else None
+
+            if deteccion is not None:
+                registrar = st.button("Registrar Detección", use_container_width=True)
+
+                if not registrar:
+                    mostrar_detecciones(deteccion, umbral_confianza)
+                else:
+                    with st.spinner("Registrando detección y generando análisis..."):
+                        try:
+                            usar_gemini = modelo_ia == "YOLOv8 + Gemini"
+                            resultado = ejecutar_deteccion_analisis_gemini(
+                                imagen_preparada, fuente, nombre_archivo,
+                                entrada_sector, coordenadas_foto, umbral_confianza, usar_gemini,
+                                marca_tiempo=metadatos_exif['timestamp'], crudo=deteccion
+                            )
+
+                            if resultado:
+                                total_items = resultado.get('total_items', 0)
+                                st.success(f"✅ Detección registrada exitosamente! Se detectaron {total_items} ítems.")
+                                st.session_state.analisis_id = resultado.get('analisis_id')
+
+                                # Mostrar resultados
+                                st.subheader("Resultados del Análisis")
+                                col_res1, col_res2, col_res3 = st.columns(3)
+
+                                with col_res1:
+                                    peso_estimado = resultado.get('peso_total', 0)
+                                    st.metric("Peso Estimado Total", f"{peso_estimado:.1f} kg")
+                                with col_res2:
+                                    impacto_co2 = calcular_impacto_ambiental(pd.DataFrame([resultado]))
+                                    st.metric("CO₂ Ahorrado", f"{impacto_co2:.1f} kg")
+                                with col_res3:
+                                    st.metric("Confianza Mínima", f"{umbral_confianza*100:.0f}%")
+
+                        except Exception as e:
+                            st.error(f"❌ Error durante el análisis: {str(e)}")
+
+            # El análisis de Gemini corre en segundo plano; se consulta sin bloquear la detección
+            if st.session_state.get('analisis_id'):
+                st.markdown("---")
+                trabajo = mostrar_analisis(st.session_state.analisis_id)
+                if trabajo is not None and trabajo['estado'] in ('pendiente', 'procesando'):
+                    st.button("Actualizar análisis", use_container_width=True)
+
 
 elif pagina == "Dashboard Analítico":
     mostrar_dashboard()
@@ -10,22 +10,27 @@ os.environ['OPENCV_VIDEOIO_PRIORITY_MSMF'] = '0'
 sys.path.insert(0, os.path.join(os.path.dirname(__file__), 'src'))
 
 import streamlit as st
-from PIL import Image
 import folium
 from streamlit_folium import st_folium
 import pandas as pd
 from datetime import datetime, timedelta
-import requests
 import json
-from src.config.settings import CSV_REGISTROS
+import tempfile
+from pathlib import Path
+from src.config.settings import CSV_REGISTROS, TAMANO_DECODIFICACION, COORDENADAS_POR_DEFECTO, URL_UBICACION_IP, TTL_UBICACION_IP_S
 from src.data.manager import DataManager
+from src.data.location import get_ip_locator
 from src.detection.detector import WasteDetector
+from src.detection.preprocessing import PreparedImage
 from src.ui.dashboard import mostrar_dashboard
 
 # Inicializar componentes
 data_manager = DataManager(CSV_REGISTROS)
 waste_detector = WasteDetector()
 
+# Precargar y calentar el modelo al arrancar; es idempotente entre reruns
+waste_detector.warm_up()
+
 # Configuración de página mejorada
 st.set_page_config(
     page_title='Sistema de Gestión de Residuos',
@@ -81,15 +86,9 @@ st.markdown("""
 """, unsafe_allow_html=True)
 
 # Función para obtener ubicación actual
+# Respaldo aproximado por IP (la consulta corre en segundo plano y se cachea); el GPS del EXIF de la foto tiene prioridad
 def obtener_ubicacion_actual():
-    try:
-        response = requests.get('http://ip-api.com/json/', timeout=5)
-        if response.status_code == 200:
-            data = response.json()
-            return f"{data.get('lat', 8.98)}, {data.get('lon', -79.52)}"
-    except:
-        pass
-    return "8.98, -79.52"
+    return get_ip_locator(URL_UBICACION_IP, TTL_UBICACION_IP_S).get()
 
 # Función para mostrar mapa interactivo
 def mostrar_mapa_residuos(df_filtrado):
@@ -163,8 +162,12 @@ if pagina == "Registro de Residuos":
         # Ubicación automática
         if st.button("Obtener Ubicación Actual"):
             ubicacion_actual = obtener_ubicacion_actual()
-            st.session_state.ubicacion_actual = ubicacion_actual
-            st.success(f"Ubicación obtenida: {ubicacion_actual}")
+            if ubicacion_actual:
+                st.session_state.ubicacion_actual = ubicacion_actual
+                st.session_state.gps_in = ubicacion_actual
+                st.success(f"Ubicación obtenida: {ubicacion_actual}")
+            else:
+                st.info("Consultando la ubicación aproximada en segundo plano; presiona de nuevo en unos segundos.")
 
         entrada_sector = st.text_input(
             "Sector / Corregimiento:",
@@ -173,11 +176,13 @@ if pagina == "Registro de Residuos":
             help="Ingresa el sector o corregimiento donde se encuentra el residuo"
         )
 
+        # El valor del campo vive solo en session_state (el botón de ubicación lo actualiza antes de dibujarlo)
+        if 'gps_in' not in st.session_state:
+            st.session_state.gps_in = COORDENADAS_POR_DEFECTO
         entrada_coordenadas = st.text_input(
             "Coordenadas GPS (Lat, Long):",
             key='gps_in',
-            value=st.session_state.get('ubicacion_actual', '8.98, -79.52'),
-            help="Formato: latitud, longitud (ej: 8.98, -79.52)"
+            help="Formato: latitud, longitud (ej: 8.98, -79.52). Si la foto trae GPS en su EXIF, se usa ese en su lugar"
         )
 
         # Tipo de reporte
@@ -193,66 +198,170 @@ if pagina == "Registro de Residuos":
         # Opciones de captura
         metodo_captura = st.radio(
             "Método de captura:",
-            ["Subir archivo", "Usar cámara"],
+            ["Subir archivo", "Usar cámara", "Subir lote", "Subir video"],
             horizontal=True
         )
 
+        modo_tiles = st.checkbox(
+            "Modo alta resolución (tiles)",
+            help="Divide las fotos grandes en secciones solapadas para detectar residuos pequeños (tapas, latas). Tarda más."
+        )
+        # Las fotos se decodifican a escala reducida, salvo en modo tiles que necesita la resolución completa
+        tamano_decodificacion = None if modo_tiles else TAMANO_DECODIFICACION
+
         if metodo_captura == "Subir archivo":
             uploaded = st.file_uploader(
                 "Selecciona una imagen del residuo",
                 type=["jpg", "jpeg", "png"],
                 help="Sube una foto clara del área con residuos"
             )
-            img = Image.open(uploaded).convert("RGB") if uploaded else None
+            img = PreparedImage(uploaded, tamano_decodificacion) if uploaded else None
+        elif metodo_captura == "Subir lote":
+            img = None
+            lote = st.file_uploader(
+                "Selecciona las fotos de la ruta",
+                type=["jpg", "jpeg", "png"],
+                accept_multiple_files=True,
+                help="Sube todas las fotos de una ruta de limpieza para procesarlas en lote"
+            )
+
+            if lote and st.button("Analizar Lote", type="primary", use_container_width=True):
+                with st.spinner(f"Analizando {len(lote)} imágenes con IA..."):
+                    try:
+                        # Las imágenes se decodifican recién en el detector, mini-lote por mini-lote
+                        # El GPS y la fecha del EXIF de cada foto reemplazan a los ingresados en el formulario
+                        imagenes = [PreparedImage(archivo, tamano_decodificacion) for archivo in lote]
+                        metadatos = [{
+                            'source': 'upload', 'file_name': archivo.name,
+                            'sector': entrada_sector, 'coordenadas': entrada_coordenadas
+                        } for archivo in lote]
+                        resultados_lote = waste_detector.detect_batch(imagenes, metadatos, 0.5, tiled=modo_tiles, thumbnails=True)
+
+                        if resultados_lote is not None:
+                            waste_detector.render_batch_summary(resultados_lote)
+                        else:
+                            st.error("❌ Error: El modelo de detección YOLO no se pudo cargar. Verifica que el archivo 'models/best.pt' exista y sea válido.")
+                    except Exception as e:
+                        st.error(f"❌ Error durante el análisis del lote: {str(e)}")
+        elif metodo_captura == "Subir video":
+            img = None
+            video = st.file_uploader(
+                "Selecciona el video de la ruta",
+                type=["mp4", "avi", "mov", "mkv"],
+                help="Video de cámara de camión o recorrido; se analizan cuadros muestreados y cada objeto se cuenta una sola vez"
+            )
+
+            if video and st.button("Analizar Video", type="primary", use_container_width=True):
+                barra_progreso = st.progress(0.0, text="Analizando video...")
+                try:
+                    # OpenCV necesita una ruta en disco para leer el video en streaming
+                    with tempfile.NamedTemporaryFile(suffix=Path(video.name).suffix, delete=False) as archivo_temporal:
+                        archivo_temporal.write(video.getbuffer())
+                    resultado_video = waste_detector.detect_video(
+                        archivo_temporal.name,
+                        {'source': 'video', 'file_name': video.name, 'sector': entrada_sector, 'coordenadas': entrada_coordenadas},
+                        0.5,
+                        progress_callback=lambda avance: barra_progreso.progress(avance, text="Analizando video...")
+                    )
+                    barra_progreso.empty()
+
+                    if resultado_video is not None:
+                        st.success(
+                            f"✅ Video analizado: {resultado_video['total_items']} ítems únicos en "
+                            f"{resultado_video['cuadros_procesados']} cuadros muestreados "
+                            f"({resultado_video['factor_tiempo_real']:.1f}x tiempo real)."
+                        )
+                        conteo_df = pd.Series(resultado_video['conteo']).rename_axis('class').to_frame('count').sort_values('count', ascending=False)
+                        st.dataframe(conteo_df, width='stretch')
+                    else:
+                        st.error("❌ Error: El modelo de detección YOLO no se pudo cargar. Verifica que el archivo 'models/best.pt' exista y sea válido.")
+                except Exception as e:
+                    st.error(f"❌ Error durante el análisis del video: {str(e)}")
+                finally:
+                    if 'archivo_temporal' in locals():
+                        Path(archivo_temporal.name).unlink(missing_ok=True)
         else:
             camera_image = st.camera_input("Captura con la cámara del dispositivo")
-            img = Image.open(camera_image).convert("RGB") if camera_image else None
+            img = PreparedImage(camera_image, tamano_decodificacion) if camera_image else None
 
         # Procesar imagen si está disponible
         if img is not None:
-            imagen_mostrar = img
-            procesada = False
+            fuente = "upload" if metodo_captura == "Subir archivo" else "webcam"
+            archivo_actual = uploaded if metodo_captura == "Subir archivo" else camera_image
+            nombre_archivo = getattr(uploaded, "name", "captura_camara") if metodo_captura == "Subir archivo" else "captura_webcam"
+            clave_imagen = (getattr(archivo_actual, "file_id", nombre_archivo), modo_tiles)
+
+            # GPS y fecha de captura leídos del encabezado EXIF, sin decodificar la imagen
+            metadatos_exif = img.exif()
+            if metadatos_exif['coordenadas'] or metadatos_exif['timestamp']:
+                st.caption(
+                    f"EXIF de la foto: GPS {metadatos_exif['coordenadas'] or 'no disponible'}, "
+                    f"capturada {metadatos_exif['timestamp'] or 'sin fecha'}. Estos datos se usarán en el registro."
+                )
+
+            umbral_confianza = st.slider(
+                "Umbral de Confianza Mínima",
+                min_value=0.05, max_value=0.95, value=0.5, step=0.05,
+                help="Cambiar el umbral solo vuelve a filtrar las detecciones ya calculadas; no repite el análisis"
+            )
 
             if st.button("Analizar Residuos", type="primary", use_container_width=True):
                 with st.spinner("Analizando imagen con IA..."):
                     try:
-                        fuente = "upload" if metodo_captura == "Subir archivo" else "webcam"
-                        nombre_archivo = getattr(uploaded, "name", "captura_camara") if metodo_captura == "Subir archivo" else "captura_webcam"
-
-                        usar_gemini = True  # Siempre usar Gemini
-                        resultado = waste_detector.detect_and_analyze(
-                            img, fuente, nombre_archivo,
-                            entrada_sector, entrada_coordenadas, 0.5, usar_gemini
-                        )
-
-                        if resultado:
-                            total_items = resultado.get('total_items', 0)
-                            st.success(f"✅ Análisis completado exitosamente! Se detectaron {total_items} ítems.")
-
-                            # Mostrar imagen procesada si está disponible
-                            if 'imagen_procesada' in resultado:
-                                imagen_mostrar = resultado['imagen_procesada']
-                                procesada = True
-
-                            # Mostrar resultados
-                            st.subheader("Resultados del Análisis")
-                            col_res1, col_res2, col_res3 = st.columns(3)
-
-                            with col_res1:
-                                peso_estimado = resultado.get('peso_total', 0)
-                                st.metric("Peso Estimado Total", f"{peso_estimado:.1f} kg")
-                            with col_res2:
-                                impacto_co2 = data_manager.calculate_environmental_impact(pd.DataFrame([resultado]))
-                                st.metric("CO₂ Ahorrado", f"{impacto_co2:.1f} kg")
-                            with col_res3:
-                                st.metric("Confianza Mínima", "50%")
-
+                        deteccion = waste_detector.detect_raw(img, tiled=modo_tiles)
+                        if deteccion is not None:
+                            st.session_state.deteccion_cruda = deteccion
+                            st.session_state.clave_deteccion = clave_imagen
                         else:
                             st.error("❌ Error: El modelo de detección YOLO no se pudo cargar. Verifica que el archivo 'models/best.pt' exista y sea válido.")
-
                     except Exception as e:
                         st.error(f"❌ Error durante el análisis: {str(e)}")
 
+            # Las cajas crudas quedan en la sesión: mover el umbral solo las vuelve a filtrar
+            deteccion = st.session_state.get('deteccion_cruda') if st.session_state.get('clave_deteccion') == clave_imagen else None
+
+            if deteccion is not None:
+                registrar = st.button("Registrar Detección", use_container_width=True)
+
+                if not registrar:
+                    waste_detector.render_preview(deteccion, umbral_confianza)
+                else:
+                    with st.spinner("Registrando detección y generando análisis..."):
+                        try:
+                            usar_gemini = True  # Siempre usar Gemini
+                            resultado = waste_detector.detect_and_analyze(
+                                img, fuente, nombre_archivo,
+                                entrada_sector, entrada_coordenadas, umbral_confianza, usar_gemini,
+                                tiled=modo_tiles, raw=deteccion
+                            )
+
+                            if resultado:
+                                total_items = resultado.get('total_items', 0)
+                                st.success(f"✅ Detección registrada exitosamente! Se detectaron {total_items} ítems.")
+                                st.session_state.analisis_id = resultado.get('analisis_id')
+
+                                # Mostrar resultados
+                                st.subheader("Resultados del Análisis")
+                                col_res1, col_res2, col_res3 = st.columns(3)
+
+                                with col_res1:
+                                    peso_estimado = resultado.get('peso_total', 0)
+                                    st.metric("Peso Estimado Total", f"{peso_estimado:.1f} kg")
+                                with col_res2:
+                                    impacto_co2 = data_manager.calculate_environmental_impact(pd.DataFrame([resultado]))
+                                    st.metric("CO₂ Ahorrado", f"{impacto_co2:.1f} kg")
+                                with col_res3:
+                                    st.metric("Confianza Mínima", f"{umbral_confianza*100:.0f}%")
+
+                        except Exception as e:
+                            st.error(f"❌ Error durante el análisis: {str(e)}")
+
+            # El análisis de Gemini corre en segundo plano; se consulta sin bloquear la detección
+            if st.session_state.get('analisis_id'):
+                st.markdown("---")
+                trabajo = waste_detector.render_analysis(st.session_state.analisis_id)
+                if trabajo is not None and trabajo['estado'] in ('pendiente', 'procesando'):
+                    st.button("Actualizar análisis", use_container_width=True)
 
 elif pagina == "Dashboard Analítico":
     mostrar_dashboard()
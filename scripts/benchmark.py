@@ -0,0 +1,267 @@
+import argparse
+import io
+import json
+import os
+import platform
+import sys
+import tempfile
+import threading
+import time
+from pathlib import Path
+
+# Agregar la raíz del proyecto al path para importar src
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import numpy as np
+import pandas as pd
+import torch
+from PIL import Image, ImageDraw
+from google import genai
+from google.genai import types
+
+from fake_gemini_server import make_server
+from src.config.settings import TAMANO_DECODIFICACION, UMBRAL_MINIMO_INFERENCIA
+from src.data.manager import DataManager
+from src.detection.detector import WasteDetector, inference_tuner, renderer
+from src.detection.model_registry import registro_modelos
+from src.detection.gemini_client import ResilientGeminiClient
+from src.detection.preprocessing import PreparedImage
+
+EXTENSIONES = {'.jpg', '.jpeg', '.png'}
+ETAPAS = ['decode', 'preprocess', 'forward', 'nms', 'plot', 'gemini', 'persist']
+RESOLUCIONES = [(640, 480), (1920, 1080), (4032, 3024)]
+DENSIDADES = [0, 10, 50]
+
+
+def synthetic_images(seed=0):
+    # Conjunto reproducible: cada resolución con varias densidades de objetos (rectángulos y elipses de colores)
+    rng = np.random.default_rng(seed)
+    images = []
+    for width, height in RESOLUCIONES:
+        for density in DENSIDADES:
+            background = rng.integers(60, 200, size=(height // 8, width // 8, 3), dtype=np.uint8)
+            image = Image.fromarray(background).resize((width, height), Image.BILINEAR)
+            draw = ImageDraw.Draw(image)
+            for _ in range(density):
+                w, h = rng.integers(width // 30, width // 6), rng.integers(height // 30, height // 6)
+                x, y = rng.integers(0, width - w), rng.integers(0, height - h)
+                fill = tuple(int(c) for c in rng.integers(0, 256, size=3))
+                shape = draw.rectangle if rng.random() < 0.5 else draw.ellipse
+                shape([x, y, x + w, y + h], fill=fill)
+            buffer = io.BytesIO()
+            image.save(buffer, 'JPEG', quality=90)
+            images.append({'name': f'{width}x{height}_d{density}', 'bytes': buffer.getvalue(), 'resolution': f'{width}x{height}', 'density': density})
+    return images
+
+
+def folder_images(folder, limit=None):
+    paths = sorted(p for p in Path(folder).rglob('*') if p.suffix.lower() in EXTENSIONES)[:limit]
+    images = []
+    for path in paths:
+        with Image.open(path) as image:
+            resolution = f'{image.size[0]}x{image.size[1]}'
+        images.append({'name': path.name, 'bytes': path.read_bytes(), 'resolution': resolution, 'density': None})
+    return images
+
+
+def percentiles(values):
+    if not values:
+        return None
+    values = np.asarray(values, dtype=np.float64)
+    return {
+        'p50': float(np.percentile(values, 50)), 'p95': float(np.percentile(values, 95)),
+        'p99': float(np.percentile(values, 99)), 'mean': float(values.mean()), 'n': int(len(values))
+    }
+
+
+def start_gemini_stub(latency):
+    # Servidor falso de Gemini en un puerto libre y cliente con la misma capa de resiliencia que la app
+    server = make_server(port=0, latency=latency, quiet=True)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    base_url = f'http://127.0.0.1:{server.server_address[1]}'
+    client = genai.Client(api_key='benchmark', http_options=types.HttpOptions(base_url=base_url, timeout=10000))
+    return server, ResilientGeminiClient(client, rate_per_minute=1e6)
+
+
+def run_single(detector, item, confidence, gemini_client, stage_times):
+    # Recorre la ruta de una foto etapa por etapa (como detect_raw + detect_and_analyze, sin Streamlit)
+    start = time.perf_counter()
+
+    t = time.perf_counter()
+    image_array = PreparedImage(io.BytesIO(item['bytes']), max_side=TAMANO_DECODIFICACION).decode()
+    stage_times['decode'].append((time.perf_counter() - t) * 1000)
+
+    raw, speed = detector.predict([image_array], UMBRAL_MINIMO_INFERENCIA)[0]
+    # speed de ultralytics: preprocess, inference y postprocess (NMS), en ms
+    stage_times['preprocess'].append(speed.get('preprocess', 0.0))
+    stage_times['forward'].append(speed.get('inference', 0.0))
+    stage_times['nms'].append(speed.get('postprocess', 0.0))
+
+    names = detector.get_class_names()
+    detections = detector.filter_detections(raw, confidence)
+
+    t = time.perf_counter()
+    renderer.render(image_array, detections, names)
+    stage_times['plot'].append((time.perf_counter() - t) * 1000)
+
+    if gemini_client is not None:
+        count_series = detector.count_classes(detections, names)
+        t = time.perf_counter()
+        prompt = detector.build_analysis_prompt('benchmark', pd.Series(count_series))
+        gemini_client.models.generate_content(model='gemini-2.5-flash', contents=prompt)
+        stage_times['gemini'].append((time.perf_counter() - t) * 1000)
+
+    t = time.perf_counter()
+    records = detector.build_records(detections, names, {
+        'source': 'benchmark', 'file_name': item['name'], 'sector': 'benchmark', 'coordenadas': ''
+    })
+    detector.assign_weights(records, detections, names, image_array.shape)
+    detector.data_manager.add_records(records)
+    stage_times['persist'].append((time.perf_counter() - t) * 1000)
+
+    return (time.perf_counter() - start) * 1000, len(detections)
+
+
+def run_throughput(detector, images, confidence, batch_size):
+    # Imágenes por segundo de la ruta por lotes (decodificación incluida, sin escribir en el CSV)
+    prepared = [PreparedImage(io.BytesIO(item['bytes']), max_side=TAMANO_DECODIFICACION, name=item['name']) for item in images]
+    metadata = [{'source': 'benchmark', 'file_name': item['name'], 'sector': 'benchmark', 'coordenadas': ''} for item in images]
+    start = time.perf_counter()
+    detector.detect_batch(prepared, metadata, confidence, batch_size=batch_size, save=False)
+    elapsed = time.perf_counter() - start
+    return len(images) / elapsed if elapsed > 0 else 0.0
+
+
+def run_concurrency(detector, images, levels, calls_per_client):
+    # Simula N sesiones que infieren a la vez en el mismo proceso: imágenes/s agregadas y latencia por llamada
+    arrays = [PreparedImage(io.BytesIO(item['bytes']), max_side=TAMANO_DECODIFICACION).decode() for item in images]
+    results = {}
+    for clients in levels:
+        latencies, settings = [], []
+        lock = threading.Lock()
+
+        def client(offset):
+            for call in range(calls_per_client):
+                # La latencia incluye la espera de turno mientras otra sesión está infiriendo
+                t = time.perf_counter()
+                _, timings = detector.predict([arrays[(offset + call) % len(arrays)]], UMBRAL_MINIMO_INFERENCIA)[0]
+                with lock:
+                    latencies.append((time.perf_counter() - t) * 1000)
+                    settings.append(timings)
+
+        workers = [threading.Thread(target=client, args=(i,)) for i in range(clients)]
+        start = time.perf_counter()
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join()
+        elapsed = time.perf_counter() - start
+        queued = [s['en_cola'] for s in settings if s.get('en_cola') is not None]
+        results[clients] = {
+            'images_per_second': len(latencies) / elapsed if elapsed > 0 else 0.0,
+            'latency_ms': percentiles(latencies),
+            'mean_queued': float(np.mean(queued)) if queued else None,
+            'threads': sorted({s['hilos'] for s in settings if s.get('hilos') is not None}),
+            'imgsz': sorted({s['imgsz'] for s in settings})
+        }
+    return results
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Latencia por etapa (p50/p95/p99) e imágenes/segundo del pipeline de detección.')
+    parser.add_argument('--folder', default=None, help='Carpeta con fotos; por defecto se genera un conjunto sintético reproducible')
+    parser.add_argument('--limit', type=int, default=None, help='Número máximo de imágenes de la carpeta')
+    parser.add_argument('--weights', default=None, help='Pesos .pt a medir (por defecto los de la app)')
+    parser.add_argument('--backend', default=None, help='torch, onnx, onnx-int8 u openvino (por defecto BACKEND_INFERENCIA)')
+    parser.add_argument('--threads', type=int, default=None, help='Hilos de PyTorch (torch.set_num_threads)')
+    parser.add_argument('--batch-sizes', default='1,4,8', help='Tamaños de lote para la medición de throughput')
+    parser.add_argument('--concurrency', default=None, help='Sesiones simultáneas a simular, por ejemplo 1,2,4,8,16,20')
+    parser.add_argument('--calls-per-client', type=int, default=5, help='Inferencias por sesión en la medición de concurrencia')
+    parser.add_argument('--no-tuner', action='store_true', help='Desactiva el ajuste de hilos e imgsz (para comparar)')
+    parser.add_argument('--max-concurrent', type=int, default=None, help='Inferencias simultáneas del ajuste (por defecto INFERENCIAS_SIMULTANEAS)')
+    parser.add_argument('--runs', type=int, default=3, help='Repeticiones de cada imagen en la medición por etapa')
+    parser.add_argument('--conf', type=float, default=0.5, help='Umbral de confianza')
+    parser.add_argument('--seed', type=int, default=0, help='Semilla del conjunto sintético')
+    parser.add_argument('--no-gemini', action='store_true', help='No medir la etapa de Gemini')
+    parser.add_argument('--gemini-latency', type=float, default=0.0, help='Latencia artificial del stub de Gemini (s)')
+    parser.add_argument('--output', default=None, help='Archivo JSON de salida (por defecto se imprime)')
+    parser.add_argument('--label', default='', help='Etiqueta libre para comparar corridas (versión, máquina, etc.)')
+    args = parser.parse_args()
+
+    if args.threads:
+        torch.set_num_threads(args.threads)
+        inference_tuner.total_threads = args.threads
+    if args.max_concurrent:
+        inference_tuner.max_concurrent = registro_modelos.replicas = args.max_concurrent
+    inference_tuner.enabled = not args.no_tuner
+
+    images = folder_images(args.folder, args.limit) if args.folder else synthetic_images(args.seed)
+    if not images:
+        print('No images found in', args.folder)
+        sys.exit(1)
+
+    detector = WasteDetector(backend=args.backend) if args.backend else WasteDetector()
+    if args.weights:
+        detector.weights_path = Path(args.weights)
+    if detector.get_class_names() is None:
+        print('Model could not be loaded')
+        sys.exit(1)
+
+    # Los registros de la medición van a un CSV temporal, nunca al historial real
+    tmp_dir = tempfile.mkdtemp(prefix='benchmark_')
+    detector.data_manager = DataManager(os.path.join(tmp_dir, 'records.csv'))
+
+    server, gemini_client = (None, None) if args.no_gemini else start_gemini_stub(args.gemini_latency)
+
+    # Calentamiento para no medir la primera carga del modelo
+    run_single(detector, images[0], args.conf, gemini_client, {stage: [] for stage in ETAPAS})
+
+    stage_times = {stage: [] for stage in ETAPAS}
+    totals, by_resolution = [], {}
+    for _ in range(args.runs):
+        for item in images:
+            total_ms, _ = run_single(detector, item, args.conf, gemini_client, stage_times)
+            totals.append(total_ms)
+            by_resolution.setdefault(item['resolution'], []).append(total_ms)
+
+    throughput = {int(b): run_throughput(detector, images, args.conf, int(b)) for b in args.batch_sizes.split(',')}
+    concurrency = run_concurrency(detector, images, [int(c) for c in args.concurrency.split(',')], args.calls_per_client) if args.concurrency else None
+
+    if server is not None:
+        server.shutdown()
+
+    report = {
+        'label': args.label,
+        'config': {
+            'backend': detector.backend,
+            'model': str(detector.model_path),
+            'threads': torch.get_num_threads(),
+            'tuner': {
+                'enabled': inference_tuner.enabled, 'total_threads': inference_tuner.total_threads,
+                'max_concurrent': inference_tuner.max_concurrent, 'latency_slo_ms': inference_tuner.latency_slo_ms
+            },
+            'cpu_count': os.cpu_count(),
+            'decode_side': TAMANO_DECODIFICACION,
+            'images': len(images),
+            'runs': args.runs,
+            'dataset': args.folder or f'synthetic(seed={args.seed})',
+            'python': platform.python_version(),
+            'torch': torch.__version__,
+            'platform': platform.platform()
+        },
+        'latency_ms': percentiles(totals),
+        'stages_ms': {stage: percentiles(values) for stage, values in stage_times.items()},
+        'by_resolution_ms': {resolution: percentiles(values) for resolution, values in by_resolution.items()},
+        'images_per_second': {
+            'single': 1000 * len(totals) / sum(totals) if totals else 0.0,
+            'batch': throughput
+        },
+        'concurrency': concurrency
+    }
+
+    output = json.dumps(report, indent=2)
+    if args.output:
+        Path(args.output).write_text(output, encoding='utf-8')
+        print('Report written to', args.output)
+    else:
+        print(output)
@@ -0,0 +1,58 @@
+import argparse
+import os
+import sys
+import time
+from pathlib import Path
+
+# Agregar la raíz del proyecto al path para importar src
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from PIL import Image
+from src.detection.detector import WasteDetector
+
+EXTENSIONES = {'.jpg', '.jpeg', '.png'}
+
+def load_images(folder, limit=None):
+    paths = sorted(p for p in Path(folder).rglob('*') if p.suffix.lower() in EXTENSIONES)
+    if limit:
+        paths = paths[:limit]
+    images = [Image.open(p).convert('RGB') for p in paths]
+    metadata = [{'source': 'benchmark', 'file_name': p.name, 'sector': 'benchmark', 'coordenadas': ''} for p in paths]
+    return images, metadata
+
+def measure(detector, images, metadata, batch_size, confidence):
+    # Devuelve imágenes por segundo para un tamaño de lote dado (sin escribir en el CSV)
+    start = time.perf_counter()
+    detector.detect_batch(images, metadata, confidence, batch_size=batch_size, save=False)
+    elapsed = time.perf_counter() - start
+    return len(images) / elapsed if elapsed > 0 else 0.0
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Compara imágenes/segundo entre la ruta de una imagen y la ruta por lotes.')
+    parser.add_argument('folder', help='Carpeta con fotos de referencia')
+    parser.add_argument('--batch-sizes', default='1,4,8,16', help='Tamaños de lote separados por coma')
+    parser.add_argument('--limit', type=int, default=None, help='Número máximo de imágenes')
+    parser.add_argument('--conf', type=float, default=0.5, help='Umbral de confianza')
+    args = parser.parse_args()
+
+    if not Path(args.folder).exists():
+        print('Folder not found:', args.folder)
+        sys.exit(1)
+
+    images, metadata = load_images(args.folder, args.limit)
+    if not images:
+        print('No images found in', args.folder)
+        sys.exit(1)
+
+    detector = WasteDetector()
+    if detector.load_model() is None:
+        print('Model could not be loaded')
+        sys.exit(1)
+
+    # Calentamiento para no medir la primera carga del modelo
+    detector.detect_batch(images[:1], metadata[:1], args.conf, batch_size=1, save=False)
+
+    print(f'images={len(images)} cpu_count={os.cpu_count()}')
+    print('batch_size,images_per_second')
+    for batch_size in [int(b) for b in args.batch_sizes.split(',')]:
+        print(f'{batch_size},{measure(detector, images, metadata, batch_size, args.conf):.2f}')
@@ -0,0 +1,124 @@
+import argparse
+import json
+import multiprocessing
+import os
+import sys
+import tempfile
+import time
+import uuid
+from datetime import datetime
+from pathlib import Path
+
+# Agregar la raíz del proyecto al path para importar src
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import numpy as np
+import pandas as pd
+
+from src.data.manager import DataManager
+from src.data.writer import COLUMNAS_REGISTROS, RecordWriter
+
+CLASES = ['BIODEGRADABLE', 'CARDBOARD', 'GLASS', 'METAL', 'PAPER', 'PLASTIC']
+
+
+def synthetic_photos(photos, items_per_photo, seed=0):
+    # Registros de detección reproducibles: items_per_photo detecciones por foto
+    rng = np.random.default_rng(seed)
+    return [[{
+        'source': 'benchmark', 'file_name': f'foto_{p}.jpg', 'sector': f'Sector {p % 7}',
+        'coordenadas': f'{8.9 + rng.random() / 10:.5f}, {-79.5 - rng.random() / 10:.5f}',
+        'class': CLASES[int(rng.integers(len(CLASES)))], 'confidence': float(rng.random()),
+        'peso_total_foto_kg': float(rng.random())
+    } for _ in range(items_per_photo)] for p in range(photos)]
+
+
+def fresh_csv(tmp_dir, name):
+    path = os.path.join(tmp_dir, name)
+    pd.DataFrame(columns=COLUMNAS_REGISTROS).to_csv(path, index=False)
+    return path
+
+
+def per_row_dataframe(path, photos):
+    # Ruta anterior: un DataFrame y un to_csv(mode='a') por cada detección
+    for registros in photos:
+        for registro in registros:
+            fila = dict(registro, id=str(uuid.uuid4()), timestamp=datetime.now().isoformat())
+            pd.DataFrame([fila], columns=COLUMNAS_REGISTROS).to_csv(path, mode='a', header=False, index=False)
+
+
+def record_writer(path, photos, fsync):
+    # Ruta nueva: una escritura con un solo flush/fsync por foto
+    writer = RecordWriter(path, fsync=fsync)
+    for registros in photos:
+        writer.append(registros)
+
+
+def data_manager(path, photos):
+    # DataManager.add_records por foto (incluye el lock del proceso y los contadores incrementales)
+    manager = DataManager(path, backend='csv')
+    for registros in photos:
+        manager.add_records(registros)
+
+
+def concurrent_managers(path, photos, processes):
+    # Varios procesos agregando a la vez al mismo CSV (sesiones de Streamlit + un trabajo por lotes)
+    workers = [multiprocessing.Process(target=data_manager, args=(path, photos[k::processes])) for k in range(processes)]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+
+
+def measure(function, rows, repeats):
+    # Mejor tiempo de varias repeticiones, en filas por segundo
+    best = min(function() for _ in range(repeats))
+    return rows / best if best > 0 else 0.0
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Filas/segundo al guardar detecciones: append por fila vs escritura en bloque.')
+    parser.add_argument('--photos', type=int, default=50, help='Fotos por corrida')
+    parser.add_argument('--items', type=int, default=80, help='Detecciones por foto')
+    parser.add_argument('--repeats', type=int, default=3, help='Repeticiones (se toma la mejor)')
+    parser.add_argument('--processes', type=int, default=4, help='Procesos escribiendo a la vez en la prueba concurrente')
+    parser.add_argument('--output', default=None, help='Archivo JSON de salida (por defecto se imprime)')
+    args = parser.parse_args()
+
+    photos = synthetic_photos(args.photos, args.items)
+    rows = args.photos * args.items
+    tmp_dir = tempfile.mkdtemp(prefix='benchmark_writer_')
+
+    def timed(name, run):
+        def function():
+            path = fresh_csv(tmp_dir, f'{name}.csv')
+            start = time.perf_counter()
+            run(path)
+            return time.perf_counter() - start
+        return function
+
+    report = {
+        'photos': args.photos,
+        'items_per_photo': args.items,
+        'rows': rows,
+        'rows_per_second': {
+            'per_row_dataframe': measure(timed('per_row', lambda path: per_row_dataframe(path, photos)), rows, args.repeats),
+            'record_writer': measure(timed('writer', lambda path: record_writer(path, photos, True)), rows, args.repeats),
+            'record_writer_no_fsync': measure(timed('writer_no_fsync', lambda path: record_writer(path, photos, False)), rows, args.repeats),
+            'data_manager_add_records': measure(timed('manager', lambda path: data_manager(path, photos)), rows, args.repeats),
+            f'data_manager_{args.processes}_processes': measure(timed('concurrent', lambda path: concurrent_managers(path, photos, args.processes)), rows, args.repeats)
+        }
+    }
+    # Las rutas deben producir el mismo esquema y la misma cantidad de filas
+    for name in ('per_row', 'writer', 'manager', 'concurrent'):
+        df = pd.read_csv(os.path.join(tmp_dir, f'{name}.csv'))
+        assert list(df.columns) == COLUMNAS_REGISTROS and len(df) == rows, name
+    # Con escritores concurrentes, las filas de cada foto deben quedar contiguas (lotes atómicos)
+    df = pd.read_csv(os.path.join(tmp_dir, 'concurrent.csv'))
+    assert (df['file_name'] != df['file_name'].shift()).sum() == args.photos, 'interleaved batches'
+
+    output = json.dumps(report, indent=2)
+    if args.output:
+        Path(args.output).write_text(output, encoding='utf-8')
+        print('Report written to', args.output)
+    else:
+        print(output)
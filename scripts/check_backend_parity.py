@@ -0,0 +1,44 @@
+import argparse
+import json
+import sys
+from pathlib import Path
+
+# Agregar la raíz del proyecto al path para importar src
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from src.detection.backends import BACKENDS, class_count_parity, export_model, list_images, per_class_summary
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Verifica que el conteo de clases de un backend coincida con el de PyTorch.')
+    parser.add_argument('folder', help='Carpeta con el conjunto de imágenes de referencia')
+    parser.add_argument('--weights', default=str(Path(__file__).resolve().parent.parent / 'models' / 'best.pt'), help='Pesos .pt de referencia (detector o clasificador)')
+    parser.add_argument('--backend', default='onnx', choices=[b for b in BACKENDS if b != 'torch'])
+    parser.add_argument('--conf', type=float, default=0.5, help='Umbral de confianza')
+    parser.add_argument('--calibracion', default=None, help='Carpeta de fotos para la cuantización INT8 estática (solo onnx-int8)')
+    parser.add_argument('--json', default=None, help='Guarda el reporte completo (por imagen y por clase) en este archivo')
+    args = parser.parse_args()
+
+    image_paths = list_images(args.folder)
+    if not image_paths:
+        print('No images found in', args.folder)
+        sys.exit(1)
+
+    artifact = export_model(args.weights, args.backend, calibration_dir=args.calibracion)
+    report, timing = class_count_parity(args.weights, artifact, image_paths, args.conf)
+    summary = per_class_summary(report)
+
+    mismatches = [row for row in report if not row['match']]
+    for row in mismatches:
+        print(f"MISMATCH {row['image']}: torch={row['reference']} {args.backend}={row['candidate']}")
+
+    # Precisión por clase: totales de cada modelo y fracción de imágenes con el mismo conteo
+    print(f"\n{'class':<20}{'torch':>8}{args.backend:>12}{'diff':>8}{'match':>9}")
+    for name, row in summary.items():
+        print(f"{name:<20}{row['reference']:>8}{row['candidate']:>12}{row['difference']:>+8}{row['match_rate']:>9.1%}")
+    print(f"\nimages/s: torch={timing['reference_images_per_s']:.2f} {args.backend}={timing['candidate_images_per_s']:.2f}")
+    print(f'{len(report) - len(mismatches)}/{len(report)} images with identical class counts ({args.backend} vs torch)')
+
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump({'backend': args.backend, 'model': str(artifact), 'timing': timing, 'per_class': summary, 'images': report}, f, ensure_ascii=False, indent=2)
+    sys.exit(1 if mismatches else 0)
@@ -0,0 +1,195 @@
+import argparse
+import hashlib
+import multiprocessing as mp
+import os
+import sys
+import time
+from pathlib import Path
+
+# Agregar la raíz del proyecto al path para importar src
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+# El paralelismo lo dan los procesos de este script: cada uno infiere en su propio proceso, sin pool de trabajadores
+os.environ['NUM_TRABAJADORES_INFERENCIA'] = '0'
+
+import pandas as pd
+
+from src.config.settings import (
+    RUTA_MODELO, CSV_REGISTROS, DIRECTORIO_CACHE, BACKEND_INFERENCIA, TAMANO_DECODIFICACION, CLASIFICACION_SEGUNDA_ETAPA
+)
+from src.data.manager import DataManager
+
+# Script sin Streamlit: recorre una carpeta de fotos, las detecta en procesos paralelos y guarda los registros por bloques.
+# Un archivo de checkpoint guarda las fotos ya registradas; al relanzar con los mismos argumentos se continúa donde quedó.
+
+EXTENSIONES = {'.jpg', '.jpeg', '.png'}
+
+_detector = None
+_settings = {}
+
+
+def _init_worker(weights, backend, classify, tiled, confidence, decode_side, threads):
+    # Cada proceso crea su WasteDetector; el modelo (y el clasificador, si se pidió) se carga una sola vez
+    global _detector
+    from src.detection.detector import WasteDetector, inference_tuner
+    # Los núcleos se reparten entre los procesos del script
+    inference_tuner.total_threads = threads
+    _detector = WasteDetector(backend=backend, classify=classify)
+    _detector.weights_path = Path(weights)
+    # En modo tiles la foto se decodifica a resolución completa, como en run.py: reducirla anularía los tiles
+    _settings.update(tiled=tiled, confidence=confidence, decode_side=None if tiled else decode_side)
+
+
+def _detect(tasks):
+    # Mismo camino que la aplicación: tiles, clasificador de segunda etapa, EXIF y peso por caja
+    from src.detection.preprocessing import PreparedImage
+    images = [PreparedImage(absolute, max_side=_settings['decode_side']) for _, absolute, _ in tasks]
+    metadata = [dict(meta, file_name=relative) for relative, _, meta in tasks]
+    results = _detector.detect_batch(
+        images, metadata, _settings['confidence'], batch_size=len(tasks), save=False, tiled=_settings['tiled']
+    )
+    if results is None:
+        raise RuntimeError("No se pudo cargar el modelo YOLO.")
+    return [(relative, result['registros'], None) for (relative, _, _), result in zip(tasks, results)]
+
+
+def _detect_chunk(tasks):
+    # tasks: [(ruta relativa, ruta absoluta, metadatos)]; se infieren juntas como un mini-lote
+    # Si el mini-lote falla (p. ej. una foto ilegible) se reintenta foto por foto para aislar el error
+    try:
+        return _detect(tasks)
+    except Exception as e:
+        if len(tasks) == 1:
+            return [(tasks[0][0], None, str(e))]
+    results = []
+    for task in tasks:
+        results.extend(_detect_chunk([task]))
+    return results
+
+
+def load_manifest(path):
+    # Manifiesto CSV con columnas file_name, sector y coordenadas (o lat y lon); file_name relativo a la carpeta
+    if not path or not Path(path).exists():
+        return {}
+    df = pd.read_csv(path, dtype=str).fillna('')
+    if 'coordenadas' not in df.columns and {'lat', 'lon'} <= set(df.columns):
+        df['coordenadas'] = df['lat'] + ', ' + df['lon']
+    manifest = {}
+    for row in df.to_dict('records'):
+        manifest[row['file_name'].replace('\\', '/')] = {
+            'sector': row.get('sector', ''), 'coordenadas': row.get('coordenadas', '')
+        }
+    return manifest
+
+
+def resolve_metadata(relative, manifest, source, default_sector, sector_from_dir):
+    # Sector y coordenadas del manifiesto (ruta relativa o nombre) o valores por defecto
+    # Como en la aplicación, el GPS y la fecha de captura del EXIF tienen prioridad (los aplica detect_batch)
+    entry = manifest.get(relative) or manifest.get(Path(relative).name) or {}
+    sector = entry.get('sector') or (Path(relative).parent.name if sector_from_dir and Path(relative).parent.name else default_sector)
+    return {'source': source, 'sector': sector, 'coordenadas': entry.get('coordenadas', '')}
+
+
+def load_checkpoint(path):
+    if not path.exists():
+        return set()
+    with open(path, 'r', encoding='utf-8') as f:
+        return {line.rstrip('\n') for line in f if line.strip()}
+
+
+def append_checkpoint(path, relatives):
+    # Se escribe después de guardar los registros del bloque y se fuerza a disco
+    with open(path, 'a', encoding='utf-8') as f:
+        f.writelines(f"{relative}\n" for relative in relatives)
+        f.flush()
+        os.fsync(f.fileno())
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Detecta residuos en todas las fotos de una carpeta usando procesos paralelos.')
+    parser.add_argument('folder', help='Carpeta raíz de las fotos (se recorre recursivamente)')
+    parser.add_argument('--csv', default=str(CSV_REGISTROS), help='CSV de registros de salida')
+    parser.add_argument('--manifest', default=None, help='Manifiesto CSV (por defecto <carpeta>/manifest.csv si existe)')
+    parser.add_argument('--sector', default='Sin sector', help='Sector para fotos sin manifiesto')
+    parser.add_argument('--sector-from-dir', action='store_true', help='Usar el nombre de la subcarpeta como sector')
+    parser.add_argument('--source', default='lote_nocturno', help='Valor de la columna source de los registros')
+    parser.add_argument('--weights', default=str(RUTA_MODELO), help='Pesos .pt del modelo')
+    parser.add_argument('--backend', default=BACKEND_INFERENCIA, help='torch, onnx, onnx-int8 u openvino')
+    parser.add_argument('--conf', type=float, default=0.5, help='Umbral de confianza')
+    parser.add_argument('--classify', action='store_true', default=CLASIFICACION_SEGUNDA_ETAPA, help='Reclasificar cada caja con models/best-classify.pt')
+    parser.add_argument('--tiled', action='store_true', help='Procesar cada foto por tiles (fotos grandes con objetos pequeños)')
+    parser.add_argument('--workers', type=int, default=max(1, (os.cpu_count() or 2) // 2), help='Procesos de inferencia')
+    parser.add_argument('--batch-size', type=int, default=8, help='Fotos por mini-lote de cada proceso')
+    parser.add_argument('--flush-every', type=int, default=500, help='Fotos por escritura en bloque al CSV')
+    parser.add_argument('--checkpoint', default=None, help='Archivo de progreso (por defecto uno por carpeta en data/cache)')
+    parser.add_argument('--restart', action='store_true', help='Ignorar el checkpoint y procesar todo de nuevo')
+    args = parser.parse_args()
+
+    root = Path(args.folder).resolve()
+    if not root.is_dir():
+        print('Folder not found:', root)
+        sys.exit(1)
+
+    checkpoint = Path(args.checkpoint) if args.checkpoint else (
+        DIRECTORIO_CACHE / f"detect_folder_{hashlib.sha1(str(root).encode()).hexdigest()[:12]}.txt"
+    )
+    checkpoint.parent.mkdir(parents=True, exist_ok=True)
+    if args.restart:
+        checkpoint.unlink(missing_ok=True)
+    done = load_checkpoint(checkpoint)
+
+    paths = sorted(p for p in root.rglob('*') if p.suffix.lower() in EXTENSIONES)
+    pending = [p for p in paths if p.relative_to(root).as_posix() not in done]
+    print(f'images={len(paths)} done={len(paths) - len(pending)} pending={len(pending)} workers={args.workers}')
+    if not pending:
+        sys.exit(0)
+
+    manifest = load_manifest(args.manifest or root / 'manifest.csv')
+    data_manager = DataManager(args.csv)
+
+    def tasks():
+        # Los metadatos del manifiesto se resuelven en el proceso principal y viajan con cada foto
+        for start in range(0, len(pending), args.batch_size):
+            chunk = []
+            for path in pending[start:start + args.batch_size]:
+                relative = path.relative_to(root).as_posix()
+                chunk.append((relative, str(path), resolve_metadata(relative, manifest, args.source, args.sector, args.sector_from_dir)))
+            yield chunk
+
+    threads = max(1, (os.cpu_count() or 1) // args.workers)
+    context = mp.get_context('spawn')
+    buffer_records, buffer_done, errors, processed = [], [], 0, 0
+    start_time = time.perf_counter()
+
+    def flush():
+        # Una escritura al CSV por bloque y luego el checkpoint; si se corta entre ambos, solo ese bloque se repite
+        if buffer_records:
+            data_manager.add_records(buffer_records)
+        if buffer_done:
+            append_checkpoint(checkpoint, buffer_done)
+        buffer_records.clear()
+        buffer_done.clear()
+
+    with context.Pool(args.workers, initializer=_init_worker,
+                      initargs=(args.weights, args.backend, args.classify, args.tiled, args.conf,
+                                TAMANO_DECODIFICACION, threads)) as pool:
+        try:
+            for results in pool.imap_unordered(_detect_chunk, tasks()):
+                for relative, records, error in results:
+                    processed += 1
+                    if error:
+                        errors += 1
+                        print(f'ERROR {relative}: {error}')
+                        continue
+                    buffer_records.extend(records)
+                    buffer_done.append(relative)
+                if len(buffer_done) >= args.flush_every:
+                    flush()
+                    elapsed = time.perf_counter() - start_time
+                    print(f'{processed}/{len(pending)} images ({processed / elapsed:.1f} img/s)')
+        finally:
+            flush()
+
+    elapsed = time.perf_counter() - start_time
+    print(f'processed={processed} errors={errors} seconds={elapsed:.1f} images_per_second={processed / elapsed if elapsed else 0:.2f}')
+    sys.exit(1 if errors else 0)
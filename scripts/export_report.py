@@ -2,15 +2,31 @@ import pandas as pd
 import sys
 from pathlib import Path
 
+# Agregar la raíz del proyecto al path para importar src
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from src.data.sqlite_store import SQLiteRecordStore
+
 def aggregate(csv_path):
-    df = pd.read_csv(csv_path)
+    # Una base SQLite (.db) se resume con una consulta agregada, sin cargar las filas
+    if Path(csv_path).suffix == '.db':
+        counts = SQLiteRecordStore(csv_path).class_counts().reset_index()
+        counts.columns = ['class', 'count']
+        return counts
+    # Un directorio Parquet (.parquet) se resume leyendo solo la columna 'class'
+    if Path(csv_path).suffix == '.parquet':
+        from src.data.parquet_store import ParquetRecordStore
+        counts = ParquetRecordStore(csv_path).class_counts().reset_index()
+        counts.columns = ['class', 'count']
+        return counts
+    df = pd.read_csv(csv_path, usecols=['class'])
     counts = df['class'].value_counts().reset_index()
     counts.columns = ['class', 'count']
     return counts
 
 if __name__ == '__main__':
     if len(sys.argv) < 2:
-        print('Usage: python export_report.py path/to/records.csv')
+        print('Usage: python export_report.py path/to/records.csv|records.db|records.parquet')
         sys.exit(1)
     csv_path = sys.argv[1]
     if not Path(csv_path).exists():
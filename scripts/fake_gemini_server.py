@@ -0,0 +1,75 @@
+import argparse
+import json
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# Servidor local que imita el endpoint generateContent de Gemini para probar la capa de resiliencia
+# Uso: python scripts/fake_gemini_server.py --fallas 0.5 y luego GEMINI_BASE_URL=http://127.0.0.1:8765 GEMINI_API_KEY=falsa
+
+RESPUESTA = "**Peso Total Estimado (kg)**: Peso Total Estimado: {peso:.1f} kg\n\n**Prioridad de Reciclaje Inmediato**: PLASTIC, METAL.\n\n**Riesgo Ambiental Clave**: Bajo."
+
+
+class FakeGeminiHandler(BaseHTTPRequestHandler):
+    server_version = "FakeGemini/1.0"
+
+    def log_message(self, format, *args):
+        if not self.server.quiet:
+            super().log_message(format, *args)
+
+    def _send(self, status, payload):
+        body = json.dumps(payload).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_POST(self):
+        length = int(self.headers.get("Content-Length", 0))
+        self.rfile.read(length)
+        with self.server.lock:
+            self.server.requests += 1
+            caido = time.monotonic() < self.server.down_until
+        if ":generateContent" not in self.path:
+            self._send(404, {"error": {"code": 404, "message": "Not found", "status": "NOT_FOUND"}})
+            return
+        time.sleep(self.server.latency)
+        if caido or random.random() < self.server.failure_rate:
+            self._send(503, {"error": {"code": 503, "message": "The model is overloaded.", "status": "UNAVAILABLE"}})
+            return
+        text = RESPUESTA.format(peso=random.uniform(0.5, 5.0))
+        self._send(200, {
+            "candidates": [{"content": {"role": "model", "parts": [{"text": text}]}, "finishReason": "STOP"}],
+            "modelVersion": "fake-gemini"
+        })
+
+
+def make_server(host="127.0.0.1", port=8765, failure_rate=0.0, latency=0.05, down_for=0.0, quiet=False):
+    # down_for: segundos iniciales en que todas las solicitudes responden 503
+    server = ThreadingHTTPServer((host, port), FakeGeminiHandler)
+    server.failure_rate = failure_rate
+    server.latency = latency
+    server.down_until = time.monotonic() + down_for
+    server.quiet = quiet
+    server.requests = 0
+    server.lock = threading.Lock()
+    return server
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Servidor falso de Gemini para pruebas locales")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--fallas", type=float, default=0.0, help="Probabilidad de responder 503")
+    parser.add_argument("--latencia", type=float, default=0.05, help="Segundos de latencia por solicitud")
+    parser.add_argument("--caido", type=float, default=0.0, help="Segundos iniciales respondiendo siempre 503")
+    args = parser.parse_args()
+
+    server = make_server(args.host, args.port, args.fallas, args.latencia, args.caido)
+    print(f"Gemini falso escuchando en http://{args.host}:{args.port}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
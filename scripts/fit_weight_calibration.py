@@ -0,0 +1,50 @@
+import argparse
+import sys
+from pathlib import Path
+
+# Agregar la raíz del proyecto al path para importar src
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import json
+import pandas as pd
+from src.data.legacy_weights import VENTANA_FOTO_S, legacy_photos, photo_groups
+from src.detection.weights import WeightEstimator, save_calibration
+
+RAIZ = Path(__file__).resolve().parent.parent
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Ajusta los factores por clase del estimador local de peso con el historial del CSV.')
+    parser.add_argument('--csv', default=str(RAIZ / 'data' / 'records_scm.csv'), help='CSV de registros con pesos observados')
+    parser.add_argument('--categorias', default=str(RAIZ / 'data' / 'categories.json'))
+    parser.add_argument('--salida', default=str(RAIZ / 'data' / 'weight_calibration.json'))
+    parser.add_argument('--hasta', required=True,
+                        help='Fecha ISO en que empezó a usarse el estimador local; sus pesos no se usan para calibrarlo')
+    parser.add_argument('--filas', choices=['total', 'reparto'], required=True,
+                        help="Qué guarda cada fila con peso de Gemini: 'total' (app.py sin migrar) o 'reparto' (run.py / src, o ya migrado)")
+    parser.add_argument('--ventana-s', type=float, default=VENTANA_FOTO_S, help='Separación máxima entre filas de una misma foto')
+    args = parser.parse_args()
+
+    with open(args.categorias, 'r', encoding='utf-8') as f:
+        categorias = json.load(f)
+    # Solo pesos observados por Gemini en el historial: los del estimador local (posteriores a --hasta)
+    # o el respaldo de 0.1 kg por ítem harían la calibración circular
+    df = pd.read_csv(args.csv)
+    df = df[pd.to_datetime(df['timestamp'], format='ISO8601') < pd.Timestamp(args.hasta)]
+    fotos = legacy_photos(df, args.ventana_s)
+    fotos = fotos[fotos['origen'] == 'observado']
+    if fotos.empty:
+        print('No hay registros con peso observado para calibrar.')
+        sys.exit(1)
+
+    grupos = photo_groups(df, args.ventana_s)
+    df = df[grupos.isin(fotos.index)]
+    conteos = df.groupby(grupos.loc[df.index])['class'].value_counts().unstack(fill_value=0)
+    observado = fotos['peso'] * fotos['filas'] if args.filas == 'reparto' else fotos['peso']
+
+    estimator = WeightEstimator(categorias)
+    factores = estimator.fit_calibration(conteos.values, observado.loc[conteos.index].values, list(conteos.columns))
+    save_calibration(args.salida, factores, len(conteos))
+
+    for nombre, factor in factores.items():
+        print(f'{nombre}: x{factor:.2f}')
+    print(f'Calibración con {len(conteos)} fotos guardada en {args.salida}')
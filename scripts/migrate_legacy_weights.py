@@ -0,0 +1,90 @@
+import argparse
+import csv
+import io
+import json
+import os
+import shutil
+import sys
+import uuid
+from datetime import datetime
+from pathlib import Path
+
+# Agregar la raíz del proyecto al path para importar src
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import pandas as pd
+
+from src.config.settings import CSV_REGISTROS
+from src.data.legacy_weights import VENTANA_FOTO_S, legacy_photos, photo_groups
+from src.data.writer import RecordWriter
+
+# Migración opcional del historial: app.py guardaba en peso_total_foto_kg el total de la foto repetido en cada fila,
+# mientras que hoy cada fila guarda el peso de su ítem. Solo se reparten las fotos que vienen de app.py; por defecto
+# solo muestra lo que cambiaría y con --aplicar reescribe el CSV (con una copia .bak y una marca para no repetirla).
+
+
+def plan(df, hasta, filas, window_s):
+    # Nuevo peso por fila (Serie indexada como df) para las fotos anteriores a 'hasta' que hay que repartir
+    timestamps = pd.to_datetime(df['timestamp'], format='ISO8601')
+    legacy = df[timestamps < pd.Timestamp(hasta)]
+    photos = legacy_photos(legacy, window_s)
+    # El respaldo de 0.1 kg por ítem solo lo escribía app.py; una respuesta de Gemini es un total por fila
+    # únicamente si el historial viene de app.py (--filas total)
+    split = photos['origen'].eq('respaldo') & photos['filas'].gt(1)
+    if filas == 'total':
+        split |= photos['origen'].eq('observado') & photos['filas'].gt(1)
+    photos = photos[split]
+    groups = photo_groups(legacy, window_s)
+    rows = groups[groups.isin(photos.index)]
+    shares = photos['peso'] / photos['filas']
+    return rows.map(shares), photos
+
+
+def write(csv_path, df, weights):
+    # Reescribe el CSV con los pesos nuevos; el resto de los campos se copian tal cual
+    temporary = f"{csv_path}.{uuid.uuid4().hex}.tmp"
+    df = df.copy()
+    df.loc[weights.index, 'peso_total_foto_kg'] = weights.map(repr)
+    buffer = io.StringIO()
+    writer = csv.writer(buffer, lineterminator=os.linesep)
+    writer.writerow(df.columns)
+    writer.writerows(df.itertuples(index=False, name=None))
+    with open(temporary, 'w', encoding='utf-8', newline='') as f:
+        f.write(buffer.getvalue())
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(temporary, csv_path)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Reparte entre sus ítems el peso total por foto que guardaba app.py en el historial.')
+    parser.add_argument('--csv', default=str(CSV_REGISTROS), help='CSV de registros')
+    parser.add_argument('--hasta', required=True,
+                        help='Fecha ISO en que empezó a usarse el estimador local; las filas posteriores no se tocan')
+    parser.add_argument('--filas', choices=['total', 'reparto'], required=True,
+                        help="Qué guardaba cada fila del historial con peso de Gemini: 'total' (app.py) o 'reparto' (run.py / src)")
+    parser.add_argument('--ventana-s', type=float, default=VENTANA_FOTO_S, help='Separación máxima entre filas de una misma foto')
+    parser.add_argument('--aplicar', action='store_true', help='Reescribir el CSV (sin esto solo se muestra el resultado)')
+    parser.add_argument('--forzar', action='store_true', help='Migrar aunque el CSV ya tenga la marca de migración')
+    args = parser.parse_args()
+
+    marker = Path(f"{args.csv}.pesos_migrados")
+    if marker.exists() and not args.forzar:
+        print('Weights already migrated:', marker.read_text(encoding='utf-8'))
+        sys.exit(1)
+
+    writer = RecordWriter(args.csv)
+    with writer.locked():
+        df = pd.read_csv(args.csv, dtype=str, keep_default_na=False)
+        weights, photos = plan(df, args.hasta, args.filas, args.ventana_s)
+        before = pd.to_numeric(df['peso_total_foto_kg'], errors='coerce').sum()
+        after = before - pd.to_numeric(df.loc[weights.index, 'peso_total_foto_kg'], errors='coerce').sum() + weights.sum()
+        print(photos['origen'].value_counts().to_string())
+        print(f'photos={len(photos)} rows={len(weights)} total_kg_before={before:.3f} total_kg_after={after:.3f}')
+        if not args.aplicar or weights.empty:
+            sys.exit(0)
+        backup = f"{args.csv}.{datetime.now():%Y%m%d%H%M%S}.bak"
+        shutil.copy2(args.csv, backup)
+        write(args.csv, df, weights)
+        marker.write_text(json.dumps({'fecha': datetime.now().isoformat(), 'hasta': args.hasta, 'filas': args.filas, 'registros': len(weights)}), encoding='utf-8')
+    print(f'{len(weights)} rows rewritten; original kept in {backup}')
@@ -0,0 +1,51 @@
+import argparse
+import sys
+import time
+from pathlib import Path
+
+# Agregar la raíz del proyecto al path para importar src
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import pandas as pd
+
+from src.config.settings import CSV_REGISTROS, COMPACTACION_PARQUET_ARCHIVOS
+from src.data.parquet_store import ParquetRecordStore
+
+
+def directory_size(path):
+    return sum(f.stat().st_size for f in Path(path).rglob('*') if f.is_file())
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Convierte el historial de detecciones del CSV a Parquet particionado (ALMACENAMIENTO_REGISTROS=parquet).')
+    parser.add_argument('--csv', default=str(CSV_REGISTROS), help='CSV de registros de origen')
+    parser.add_argument('--output', default=None, help='Directorio Parquet de destino (por defecto el CSV con extensión .parquet)')
+    parser.add_argument('--chunksize', type=int, default=50000, help='Filas leídas del CSV por bloque')
+    args = parser.parse_args()
+
+    if not Path(args.csv).exists():
+        print('CSV not found:', args.csv)
+        sys.exit(1)
+    output = args.output or str(Path(args.csv).with_suffix('.parquet'))
+    if Path(output).exists() and any(Path(output).rglob('*.parquet')):
+        # A diferencia de SQLite no hay clave primaria: repetir la conversión duplicaría filas
+        print('Output already contains Parquet files:', output)
+        sys.exit(1)
+
+    start = time.perf_counter()
+    store = ParquetRecordStore(output, COMPACTACION_PARQUET_ARCHIVOS)
+    imported = store.import_csv(args.csv, args.chunksize)
+    # La compactación en segundo plano se completa aquí, antes de medir
+    store.compact()
+    print(f'{imported} rows written to {output} in {time.perf_counter() - start:.1f}s')
+
+    # Tamaño en disco y tiempo de carga de las columnas del dashboard, CSV vs Parquet
+    columns = ['class', 'confidence', 'peso_total_foto_kg']
+    start = time.perf_counter()
+    pd.read_csv(args.csv, usecols=columns)
+    csv_seconds = time.perf_counter() - start
+    start = time.perf_counter()
+    store.load(columns)
+    parquet_seconds = time.perf_counter() - start
+    print(f'size: csv {Path(args.csv).stat().st_size / 1e6:.2f} MB, parquet {directory_size(output) / 1e6:.2f} MB')
+    print(f'load {columns}: csv {csv_seconds * 1000:.1f} ms, parquet {parquet_seconds * 1000:.1f} ms')
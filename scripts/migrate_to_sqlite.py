@@ -0,0 +1,29 @@
+import argparse
+import sys
+import time
+from pathlib import Path
+
+# Agregar la raíz del proyecto al path para importar src
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from src.config.settings import CSV_REGISTROS
+from src.data.sqlite_store import SQLiteRecordStore
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Migra el historial de detecciones del CSV a SQLite (ALMACENAMIENTO_REGISTROS=sqlite).')
+    parser.add_argument('--csv', default=str(CSV_REGISTROS), help='CSV de registros de origen')
+    parser.add_argument('--db', default=None, help='Base SQLite de destino (por defecto el CSV con extensión .db)')
+    parser.add_argument('--chunksize', type=int, default=50000, help='Filas leídas del CSV por bloque')
+    args = parser.parse_args()
+
+    if not Path(args.csv).exists():
+        print('CSV not found:', args.csv)
+        sys.exit(1)
+    db_path = args.db or str(Path(args.csv).with_suffix('.db'))
+
+    start = time.perf_counter()
+    store = SQLiteRecordStore(db_path)
+    # Los ids ya presentes se ignoran: la migración puede repetirse sin duplicar filas
+    imported = store.import_csv(args.csv, args.chunksize)
+    print(f'{imported} rows imported into {db_path} ({store.total()} total) in {time.perf_counter() - start:.1f}s')
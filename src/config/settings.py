@@ -1,30 +1,141 @@
 import os
+import sys
+import logging
 from pathlib import Path
 from dotenv import load_dotenv
 import json
-import streamlit as st
 from ultralytics import YOLO
 from google import genai
+from google.genai import types
+from src.detection.gemini_client import ResilientGeminiClient
 
 # Cargar variables de entorno
 load_dotenv()
 
+def _mostrar_error(mensaje):
+    # En la app se muestra con Streamlit; los scripts (sin Streamlit cargado) solo lo registran
+    st = sys.modules.get("streamlit")
+    if st is not None:
+        st.error(mensaje)
+    else:
+        logging.getLogger(__name__).error(mensaje)
+
 # Configuración de rutas
 DIRECTORIO_BASE = Path(__file__).resolve().parent.parent.parent
 RUTA_MODELO = DIRECTORIO_BASE / "models" / "best.pt"
 JSON_CATEGORIAS = DIRECTORIO_BASE / "data" / "categories.json"
 CSV_REGISTROS = DIRECTORIO_BASE / "data" / "records_scm.csv"
+# Almacenamiento del historial: "csv", "sqlite" (base records_scm.db junto al CSV; ver scripts/migrate_to_sqlite.py)
+# o "parquet" (directorio records_scm.parquet particionado por fecha y sector; ver scripts/migrate_to_parquet.py)
+ALMACENAMIENTO_REGISTROS = os.environ.get("ALMACENAMIENTO_REGISTROS", "csv").lower()
+# Con Parquet, cantidad de archivos pequeños por partición que dispara la compactación en segundo plano
+COMPACTACION_PARQUET_ARCHIVOS = int(os.environ.get("COMPACTACION_PARQUET_ARCHIVOS", "8"))
+# Máximo de marcadores en el mapa del dashboard (los registros más recientes con coordenadas)
+MAX_PUNTOS_MAPA = int(os.environ.get("MAX_PUNTOS_MAPA", "2000"))
+DIRECTORIO_CACHE = DIRECTORIO_BASE / "data" / "cache"
+
+# Estimación local de peso: masa típica por clase (categories.json) escalada por el área de la caja
+RUTA_CALIBRACION_PESO = DIRECTORIO_BASE / "data" / "weight_calibration.json"
+PESO_POR_DEFECTO_KG = float(os.environ.get("PESO_POR_DEFECTO_KG", "0.1"))
+
+# Ubicación: el GPS del EXIF de cada foto tiene prioridad; la consulta por IP es solo un respaldo en caché
+COORDENADAS_POR_DEFECTO = os.environ.get("COORDENADAS_POR_DEFECTO", "8.98, -79.52")
+URL_UBICACION_IP = os.environ.get("URL_UBICACION_IP", "http://ip-api.com/json/")
+TTL_UBICACION_IP_S = float(os.environ.get("TTL_UBICACION_IP_S", "3600"))
+
+# Configuración de inferencia
+TAMANO_LOTE = int(os.environ.get("TAMANO_LOTE", "8"))
+# Lado máximo al decodificar las fotos (tamaño de entrada del modelo); los tiles usan la resolución completa
+TAMANO_DECODIFICACION = int(os.environ.get("TAMANO_DECODIFICACION", "640"))
+# Umbral mínimo con el que se ejecuta YOLO; el umbral elegido por el usuario solo filtra esas cajas
+UMBRAL_MINIMO_INFERENCIA = float(os.environ.get("UMBRAL_MINIMO_INFERENCIA", "0.05"))
+
+# Segunda etapa opcional: el clasificador revisa el recorte de cada caja y corrige la clase si está más seguro
+CLASIFICACION_SEGUNDA_ETAPA = os.environ.get("CLASIFICACION_SEGUNDA_ETAPA", "0") == "1"
+RUTA_CLASIFICADOR = DIRECTORIO_BASE / "models" / "best-classify.pt"
+# Solo se reclasifican las cajas con al menos esta confianza del detector
+UMBRAL_CLASIFICADOR = float(os.environ.get("UMBRAL_CLASIFICADOR", "0.25"))
+
+# Pool de procesos de inferencia (0 = inferencia en el mismo proceso de Streamlit)
+NUM_TRABAJADORES_INFERENCIA = int(os.environ.get("NUM_TRABAJADORES_INFERENCIA", "0"))
+MAX_TRABAJOS_PENDIENTES = int(os.environ.get("MAX_TRABAJOS_PENDIENTES", "32"))
+TIEMPO_LIMITE_INFERENCIA = float(os.environ.get("TIEMPO_LIMITE_INFERENCIA", "60"))
+# Caídas seguidas de un trabajador (con espera creciente entre reinicios) antes de reportar el error
+MAX_REINICIOS_TRABAJADOR = int(os.environ.get("MAX_REINICIOS_TRABAJADOR", "5"))
+
+# Ajuste de hilos e imgsz para la inferencia en el mismo proceso (varias sesiones a la vez)
+AJUSTE_INFERENCIA = os.environ.get("AJUSTE_INFERENCIA", "1") != "0"
+HILOS_INFERENCIA = int(os.environ.get("HILOS_INFERENCIA", "0"))  # 0 = todos los núcleos
+SLO_LATENCIA_MS = float(os.environ.get("SLO_LATENCIA_MS", "0"))  # 0 = imgsz fijo
+# Inferencias simultáneas en el proceso, cada una con su copia del modelo y su parte de los hilos (0 = según los núcleos)
+INFERENCIAS_SIMULTANEAS = int(os.environ.get("INFERENCIAS_SIMULTANEAS", "0"))
+TAMANOS_ENTRADA = tuple(int(s) for s in os.environ.get("TAMANOS_ENTRADA", "640,512,416,320").split(","))
+
+# Backend de inferencia: "torch", "onnx" (ONNX Runtime), "onnx-int8" (ONNX cuantizado) u "openvino"
+BACKEND_INFERENCIA = os.environ.get("BACKEND_INFERENCIA", "torch").lower()
+# Carpeta de fotos guardadas para calibrar la cuantización INT8 estática (vacío = cuantización dinámica)
+DIRECTORIO_CALIBRACION_INT8 = os.environ.get("DIRECTORIO_CALIBRACION_INT8") or None
+
+# Inferencia por tiles para fotos de alta resolución (opcional)
+TAMANO_TILE = int(os.environ.get("TAMANO_TILE", "640"))
+SOLAPAMIENTO_TILE = float(os.environ.get("SOLAPAMIENTO_TILE", "0.2"))
+PRESUPUESTO_LATENCIA_MS = float(os.environ.get("PRESUPUESTO_LATENCIA_MS", "4000"))
+LATENCIA_TILE_MS_INICIAL = float(os.environ.get("LATENCIA_TILE_MS_INICIAL", "250"))
+
+# Caché de resultados por contenido (hash exacto + hash perceptual)
+MAX_ENTRADAS_CACHE = int(os.environ.get("MAX_ENTRADAS_CACHE", "256"))
+MAX_ENTRADAS_CACHE_DISCO = int(os.environ.get("MAX_ENTRADAS_CACHE_DISCO", "5000"))
+DISTANCIA_CASI_DUPLICADO = int(os.environ.get("DISTANCIA_CASI_DUPLICADO", "5"))
+
+# Visualización: las cajas se dibujan al tamaño de pantalla y la imagen se codifica una sola vez
+LADO_VISUALIZACION = int(os.environ.get("LADO_VISUALIZACION", "1024"))
+LADO_MINIATURA = int(os.environ.get("LADO_MINIATURA", "256"))
+FORMATO_IMAGEN_SALIDA = os.environ.get("FORMATO_IMAGEN_SALIDA", "JPEG").upper()
+CALIDAD_IMAGEN_SALIDA = int(os.environ.get("CALIDAD_IMAGEN_SALIDA", "85"))
+MAX_BYTES_CACHE_IMAGENES = int(os.environ.get("MAX_BYTES_CACHE_IMAGENES", str(64 * 1024 * 1024)))
+
+# Ingesta de video: muestreo de cuadros y seguimiento de objetos
+VIDEO_CADA_N_CUADROS = int(os.environ.get("VIDEO_CADA_N_CUADROS", "10"))
+VIDEO_UMBRAL_ESCENA = float(os.environ.get("VIDEO_UMBRAL_ESCENA", "0"))
+TRACKER_IOU = float(os.environ.get("TRACKER_IOU", "0.3"))
+TRACKER_MAX_PERDIDOS = int(os.environ.get("TRACKER_MAX_PERDIDOS", "3"))
+TRACKER_MIN_DETECCIONES = int(os.environ.get("TRACKER_MIN_DETECCIONES", "2"))
 
 # Configuración de Gemini
+MODELO_GEMINI = os.environ.get("MODELO_GEMINI", "gemini-2.5-flash")
+# El análisis corre en segundo plano; se limita la cantidad de llamadas simultáneas
+MAX_CONCURRENCIA_GEMINI = int(os.environ.get("MAX_CONCURRENCIA_GEMINI", "2"))
+DIRECTORIO_ANALISIS = DIRECTORIO_BASE / "data" / "analisis"
+# Los análisis terminados se conservan TTL_ANALISIS_S; MAX_TRABAJOS_ANALISIS en memoria y MAX_ARCHIVOS_ANALISIS en disco
+TTL_ANALISIS_S = float(os.environ.get("TTL_ANALISIS_S", "86400"))
+MAX_TRABAJOS_ANALISIS = int(os.environ.get("MAX_TRABAJOS_ANALISIS", "256"))
+MAX_ARCHIVOS_ANALISIS = int(os.environ.get("MAX_ARCHIVOS_ANALISIS", "2000"))
+# Caché de respuestas por (sector, conteo por clase, versión del prompt); subir la versión al cambiar el prompt
+VERSION_PROMPT_GEMINI = "2"
+TTL_CACHE_GEMINI_S = float(os.environ.get("TTL_CACHE_GEMINI_S", "86400"))
+MAX_ENTRADAS_CACHE_GEMINI = int(os.environ.get("MAX_ENTRADAS_CACHE_GEMINI", "512"))
+# Capa de resiliencia: cuota local (solicitudes/minuto), reintentos y enfriamiento tras fallas seguidas
+# GEMINI_BASE_URL permite apuntar a un servidor falso local (scripts/fake_gemini_server.py)
+GEMINI_BASE_URL = os.environ.get("GEMINI_BASE_URL")
+TIEMPO_LIMITE_GEMINI_S = float(os.environ.get("TIEMPO_LIMITE_GEMINI_S", "30"))
+GEMINI_SOLICITUDES_POR_MINUTO = float(os.environ.get("GEMINI_SOLICITUDES_POR_MINUTO", "10"))
+GEMINI_MAX_REINTENTOS = int(os.environ.get("GEMINI_MAX_REINTENTOS", "3"))
+GEMINI_FALLAS_PARA_ABRIR = int(os.environ.get("GEMINI_FALLAS_PARA_ABRIR", "3"))
+GEMINI_ENFRIAMIENTO_S = float(os.environ.get("GEMINI_ENFRIAMIENTO_S", "60"))
 cliente = None
 try:
     api_key = os.environ.get("GEMINI_API_KEY")
     if api_key:
-        cliente = genai.Client(api_key=api_key)
+        opciones_http = types.HttpOptions(base_url=GEMINI_BASE_URL, timeout=int(TIEMPO_LIMITE_GEMINI_S * 1000))
+        cliente = ResilientGeminiClient(
+            genai.Client(api_key=api_key, http_options=opciones_http),
+            rate_per_minute=GEMINI_SOLICITUDES_POR_MINUTO, max_retries=GEMINI_MAX_REINTENTOS,
+            failure_threshold=GEMINI_FALLAS_PARA_ABRIR, cooldown_s=GEMINI_ENFRIAMIENTO_S
+        )
     else:
         pass
 except Exception as e:
-    st.error(f"Error al inicializar Gemini: {e}")
+    _mostrar_error(f"Error al inicializar Gemini: {e}")
 
 # Cargar categorías
 try:
@@ -32,7 +143,7 @@ try:
         categorias = json.load(f)
     nombres = categorias.get("names", [])
 except FileNotFoundError:
-    st.error(f"Error: No se encontró el archivo de categorías en {JSON_CATEGORIAS}.")
+    _mostrar_error(f"Error: No se encontró el archivo de categorías en {JSON_CATEGORIAS}.")
     nombres = []
     categorias = {}
 
@@ -0,0 +1,116 @@
+import json
+import os
+import threading
+from collections import Counter
+from pathlib import Path
+
+import pandas as pd
+
+
+class AggregateStore:
+    # Contadores por clase y por sector mantenidos en cada append y guardados en un archivo pequeño junto al CSV
+    # Si el CSV cambió por fuera (otro proceso, edición manual) se reconstruyen una sola vez leyéndolo por partes
+    def __init__(self, csv_path, sidecar_path=None):
+        self.csv_path = Path(csv_path)
+        self.sidecar_path = Path(sidecar_path) if sidecar_path else self.csv_path.with_suffix(".resumen.json")
+        self._lock = threading.Lock()
+        self._state = None
+
+    def _csv_size(self):
+        try:
+            return os.path.getsize(self.csv_path)
+        except FileNotFoundError:
+            return 0
+
+    def _empty_state(self):
+        return {'total': 0, 'clases': Counter(), 'sectores': Counter(), 'bytes_csv': 0}
+
+    def _load(self):
+        try:
+            with open(self.sidecar_path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+            return {
+                'total': data['total'], 'clases': Counter(data['clases']),
+                'sectores': Counter(data['sectores']), 'bytes_csv': data['bytes_csv']
+            }
+        except (FileNotFoundError, json.JSONDecodeError, KeyError):
+            return None
+
+    def _save(self):
+        # Temporal propio de cada proceso: dos procesos no se pisan el archivo a medio escribir
+        tmp_path = self.sidecar_path.with_suffix(f".{os.getpid()}.tmp")
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(self._state, f, ensure_ascii=False)
+        os.replace(tmp_path, self.sidecar_path)
+
+    def rebuild(self):
+        # Recorre el CSV completo por bloques; solo se usa cuando el archivo auxiliar no coincide con el CSV
+        with self._lock:
+            self._rebuild()
+
+    def _rebuild(self):
+        state = self._empty_state()
+        if self._csv_size() > 0:
+            for chunk in pd.read_csv(self.csv_path, usecols=['class', 'sector'], chunksize=50000):
+                state['total'] += len(chunk)
+                state['clases'].update(chunk['class'].dropna().astype(str).value_counts().to_dict())
+                state['sectores'].update(chunk['sector'].dropna().astype(str).value_counts().to_dict())
+        state['bytes_csv'] = self._csv_size()
+        self._state = state
+        self._save()
+
+    def _ensure_current(self):
+        if self._state is None:
+            self._state = self._load()
+        if self._state is None or self._state['bytes_csv'] != self._csv_size():
+            self._rebuild()
+
+    def _sync(self, size_before):
+        # Si otro proceso escribió después de nuestra última escritura, su versión del archivo auxiliar
+        # (guardada bajo el mismo bloqueo del CSV) ya incluye esas filas: se recarga en vez de reconstruir
+        if self._state is None or self._state['bytes_csv'] != size_before:
+            self._state = self._load() or self._state
+
+    def record_appended(self, rows, size_before, size_after=None):
+        # Suma las filas recién escritas; size_before/size_after: tamaño del CSV justo antes y después del append
+        # (size_after evita contar como propias filas que otro proceso agregó inmediatamente después)
+        with self._lock:
+            self._sync(size_before)
+            if self._state is None or self._state['bytes_csv'] != size_before:
+                # Los contadores ya no correspondían al CSV: se reconstruyen (incluye las filas nuevas)
+                self._rebuild()
+                return
+            self._state['total'] += len(rows)
+            self._state['clases'].update(str(row['class']) for row in rows)
+            self._state['sectores'].update(str(row['sector']) for row in rows)
+            self._state['bytes_csv'] = size_after if size_after is not None else self._csv_size()
+            self._save()
+
+    def top_classes(self, n=5):
+        # Clases más frecuentes del historial, como Serie (mismo formato que value_counts)
+        with self._lock:
+            self._ensure_current()
+            top = self._state['clases'].most_common(n)
+        return pd.Series(dict(top), name='count', dtype='int64').rename_axis('class')
+
+    def sector_counts(self):
+        with self._lock:
+            self._ensure_current()
+            return dict(self._state['sectores'])
+
+    def total(self):
+        with self._lock:
+            self._ensure_current()
+            return self._state['total']
+
+
+_stores = {}
+_stores_lock = threading.Lock()
+
+def get_aggregate_store(csv_path):
+    # Un almacén por CSV, compartido por todos los DataManager del proceso
+    key = str(Path(csv_path).resolve())
+    with _stores_lock:
+        if key not in _stores:
+            _stores[key] = AggregateStore(csv_path)
+        return _stores[key]
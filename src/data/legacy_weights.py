@@ -0,0 +1,42 @@
+import numpy as np
+import pandas as pd
+
+# Estimación de respaldo del app.py anterior: 100 g por ítem, con el total repetido en cada fila de la foto
+PESO_RESPALDO_KG = 0.1
+# El historial anterior se escribía fila por fila: las filas de una foto quedan a milisegundos entre sí
+VENTANA_FOTO_S = 2.0
+TOLERANCIA_KG = 1e-6
+
+
+def photo_groups(df, window_s=VENTANA_FOTO_S):
+    # Id de foto de cada fila: filas seguidas del mismo archivo con menos de window_s entre timestamps
+    # (dos subidas de la misma foto, aunque sean seguidas, quedan en fotos distintas)
+    timestamps = pd.to_datetime(df['timestamp'], format='ISO8601')
+    gap = timestamps.diff().dt.total_seconds().abs()
+    new_photo = (df['file_name'] != df['file_name'].shift()) | ~(gap <= window_s)
+    return new_photo.cumsum().rename('foto')
+
+
+def legacy_photos(df, window_s=VENTANA_FOTO_S):
+    # Una fila por foto con sus filas ('filas'), el peso que comparten ('peso', NaN si difieren) y su origen ('origen'):
+    # 'respaldo': el total de 0.1 kg por ítem de app.py repetido en cada fila
+    # 'respaldo_item': 0.1 kg en cada fila (el respaldo ya repartido)
+    # 'observado': todas las filas con un mismo peso > 0 tomado de la respuesta de Gemini
+    #   (app.py repetía el total en cada fila; el flujo de src guardaba la parte de cada ítem)
+    # 'estimado': pesos distintos por fila (estimador local); 'sin_peso': todo 0
+    weights = pd.to_numeric(df['peso_total_foto_kg'], errors='coerce').fillna(0.0)
+    grouped = weights.groupby(photo_groups(df, window_s))
+    photos = pd.DataFrame({'filas': grouped.size(), 'minimo': grouped.min(), 'maximo': grouped.max()})
+    shared = (photos['maximo'] - photos['minimo']).abs() <= TOLERANCIA_KG
+    photos['peso'] = photos['minimo'].where(shared)
+    photos['origen'] = np.select(
+        [
+            ~shared,
+            photos['peso'] <= TOLERANCIA_KG,
+            (photos['peso'] - PESO_RESPALDO_KG * photos['filas']).abs() <= TOLERANCIA_KG,
+            (photos['peso'] - PESO_RESPALDO_KG).abs() <= TOLERANCIA_KG
+        ],
+        ['estimado', 'sin_peso', 'respaldo', 'respaldo_item'],
+        default='observado'
+    )
+    return photos.drop(columns=['minimo', 'maximo'])
@@ -0,0 +1,56 @@
+import threading
+import time
+
+import requests
+
+
+class IPLocator:
+    # Ubicación aproximada por IP, solo como último recurso cuando la foto no trae GPS en el EXIF
+    # La consulta corre en segundo plano y su resultado se cachea; get() nunca bloquea la interfaz
+    def __init__(self, url='http://ip-api.com/json/', ttl_seconds=3600, timeout=5):
+        self.url = url
+        self.ttl_seconds = ttl_seconds
+        self.timeout = timeout
+        self._coordinates = None
+        self._fetched_at = None
+        self._fetching = False
+        self._lock = threading.Lock()
+
+    def get(self):
+        # Retorna "lat, lon" de la última consulta, o None si todavía no hay resultado
+        # Si no hay dato o está vencido, lanza una consulta en segundo plano para la próxima vez
+        with self._lock:
+            stale = self._fetched_at is None or time.time() - self._fetched_at > self.ttl_seconds
+            if stale and not self._fetching:
+                self._fetching = True
+                threading.Thread(target=self._fetch, daemon=True).start()
+            return self._coordinates
+
+    def _fetch(self):
+        coordinates = None
+        try:
+            response = requests.get(self.url, timeout=self.timeout)
+            if response.status_code == 200:
+                data = response.json()
+                if data.get('lat') is not None and data.get('lon') is not None:
+                    coordinates = f"{data['lat']}, {data['lon']}"
+        except (requests.RequestException, ValueError):
+            pass
+        with self._lock:
+            # Un fallo conserva la última ubicación conocida y se reintenta tras el TTL
+            if coordinates is not None:
+                self._coordinates = coordinates
+            self._fetched_at = time.time()
+            self._fetching = False
+
+
+_locator = None
+_locator_lock = threading.Lock()
+
+def get_ip_locator(url='http://ip-api.com/json/', ttl_seconds=3600):
+    # Localizador compartido por todas las sesiones del proceso
+    global _locator
+    with _locator_lock:
+        if _locator is None:
+            _locator = IPLocator(url, ttl_seconds)
+        return _locator
@@ -0,0 +1,50 @@
+from contextlib import contextmanager
+
+try:
+    import fcntl
+except ImportError:
+    # Windows: bloqueo de un byte del archivo de bloqueo con msvcrt (solo exclusivo)
+    fcntl = None
+    import msvcrt
+
+
+def _acquire(f, shared, blocking):
+    if fcntl is not None:
+        flags = (fcntl.LOCK_SH if shared else fcntl.LOCK_EX) | (0 if blocking else fcntl.LOCK_NB)
+        try:
+            fcntl.flock(f.fileno(), flags)
+        except BlockingIOError:
+            return False
+        return True
+    f.seek(0)
+    while True:
+        try:
+            # LK_LOCK reintenta durante ~10 s antes de fallar; si se pidió esperar, se sigue esperando
+            msvcrt.locking(f.fileno(), msvcrt.LK_LOCK if blocking else msvcrt.LK_NBLCK, 1)
+            return True
+        except OSError:
+            if not blocking:
+                return False
+
+
+def _release(f):
+    if fcntl is not None:
+        fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+    else:
+        f.seek(0)
+        msvcrt.locking(f.fileno(), msvcrt.LK_UNLCK, 1)
+
+
+@contextmanager
+def file_lock(path, shared=False, blocking=True):
+    # Bloqueo entre hilos y procesos sobre un archivo auxiliar; entrega el archivo abierto (a+b)
+    # shared: varios lectores a la vez (en Windows el bloqueo es siempre exclusivo)
+    # blocking=False: entrega None en lugar de esperar si otro lo tiene
+    with open(path, 'a+b') as f:
+        if not _acquire(f, shared, blocking):
+            yield None
+            return
+        try:
+            yield f
+        finally:
+            _release(f)
@@ -1,37 +1,182 @@
 import os
-import csv
-from datetime import datetime
 from pathlib import Path
 import pandas as pd
-import uuid
+import threading
+
+from src.config.settings import ALMACENAMIENTO_REGISTROS, COMPACTACION_PARQUET_ARCHIVOS
+from src.data.aggregates import get_aggregate_store
+from src.data.sqlite_store import get_sqlite_store, parse_coordinates
+from src.data.writer import COLUMNAS_REGISTROS, RecordWriter
+
+# Factores de CO₂ ahorrado por kg de cada material
+FACTORES_CO2 = {
+    'PLASTIC': 0.8,
+    'METAL': 0.6,
+    'PAPER': 0.3,
+    'GLASS': 0.4,
+    'CARDBOARD': 0.3,
+    'BIODEGRADABLE': 0.1
+}
+FACTOR_CO2_POR_DEFECTO = 0.2
+
+# Serializa las escrituras del proceso (el bloqueo de archivo del writer coordina con otros procesos)
+_lock_escritura = threading.Lock()
+
+# Backend CSV: historial ya leído por archivo, {ruta: ((mtime_ns, tamaño), DataFrame)}; un rerun del dashboard
+# hace varias consultas y todas se filtran de la misma lectura mientras el CSV no cambie
+_cache_csv = {}
+_cache_csv_lock = threading.Lock()
 
 class DataManager:
-    def __init__(self, csv_path):
+    def __init__(self, csv_path, backend=None):
+        # backend: 'csv', 'sqlite' o 'parquet' (por defecto ALMACENAMIENTO_REGISTROS); con SQLite el historial
+        # vive en una base junto al CSV (mismo nombre, extensión .db) y los resúmenes se calculan en SQL;
+        # con Parquet, en un directorio particionado por fecha y sector (extensión .parquet)
         self.csv_path = csv_path
+        self.backend = (backend or ALMACENAMIENTO_REGISTROS).lower()
+        self.writer = RecordWriter(csv_path)
         self.ensure_csv_exists()
+        self.store = None
+        if self.backend == 'sqlite':
+            self.store = get_sqlite_store(Path(csv_path).with_suffix('.db'))
+        elif self.backend == 'parquet':
+            # pyarrow ya viene con streamlit, pero solo se importa si se usa este backend
+            from src.data.parquet_store import get_parquet_store
+            self.store = get_parquet_store(Path(csv_path).with_suffix('.parquet'), COMPACTACION_PARQUET_ARCHIVOS)
+        # Contadores por clase/sector actualizados en cada escritura (evita releer el CSV para el resumen)
+        # Los almacenes SQLite y Parquet ofrecen la misma interfaz (top_classes, sector_counts, total)
+        self.aggregates = self.store if self.store is not None else get_aggregate_store(csv_path)
 
     def ensure_csv_exists(self):
         # Asegura que el archivo CSV de registros exista con los encabezados correctos
-        if not os.path.exists(self.csv_path):
-            encabezado = ['id', 'timestamp', 'source', 'file_name', 'sector', 'coordenadas', 'class', 'confidence', 'peso_total_foto_kg']
-            df = pd.DataFrame(columns=encabezado)
-            df.to_csv(self.csv_path, index=False)
+        self.writer.ensure_exists()
 
     def add_record(self, fuente, nombre_archivo, sector, coordenadas, nombre_clase, confianza, peso_total_foto_kg):
-        # Añade un nuevo registro de detección al archivo CSV
-        nuevo_registro = {
-            'id': str(uuid.uuid4()),
-            'timestamp': datetime.now().isoformat(),
-            'source': fuente,
-            'file_name': nombre_archivo,
-            'sector': sector,
-            'coordenadas': coordenadas,
-            'class': nombre_clase,
-            'confidence': confianza,
-            'peso_total_foto_kg': peso_total_foto_kg
+        # Añade un nuevo registro de detección al archivo CSV (para varias detecciones, usar add_records)
+        # peso_total_foto_kg: peso estimado de este ítem (no el total de la foto)
+        return self.add_records([{
+            'source': fuente, 'file_name': nombre_archivo, 'sector': sector, 'coordenadas': coordenadas,
+            'class': nombre_clase, 'confidence': confianza, 'peso_total_foto_kg': peso_total_foto_kg
+        }])[0]
+
+    def add_records(self, registros):
+        # Añade en una sola escritura (un flush/fsync) los registros de detección de una o varias fotos
+        if not registros:
+            return []
+        filas = self.writer.build_rows(registros)
+        if self.store is not None:
+            self.store.append(filas)
+            return [fila['id'] for fila in filas]
+        # El bloqueo de archivo del writer coordina además con otros procesos; los contadores se
+        # actualizan dentro del mismo bloqueo, así el archivo auxiliar siempre corresponde al CSV
+        with _lock_escritura, self.writer.locked() as journal:
+            tamano_previo, tamano_final = self.writer.write_locked(journal, filas)
+            self.aggregates.record_appended(filas, tamano_previo, tamano_final)
+        return [fila['id'] for fila in filas]
+
+    def _frame(self):
+        # Todas las columnas salvo id, más lat/lon ya separadas; se vuelve a leer solo si el CSV cambió
+        estado = os.stat(self.csv_path)
+        clave = (estado.st_mtime_ns, estado.st_size)
+        ruta = str(self.csv_path)
+        with _cache_csv_lock:
+            en_cache = _cache_csv.get(ruta)
+        if en_cache is not None and en_cache[0] == clave:
+            return en_cache[1]
+        df = pd.read_csv(self.csv_path, usecols=[c for c in COLUMNAS_REGISTROS if c != 'id'])
+        df['lat'], df['lon'] = parse_coordinates(df['coordenadas'])
+        with _cache_csv_lock:
+            _cache_csv[ruta] = (clave, df)
+        return df
+
+    def _load(self, columnas, sector=None, start=None, end=None, classes=None, exclude_classes=False):
+        # Backend CSV: aplica los filtros sobre el historial en caché y retorna las columnas pedidas
+        df = self._frame()
+        if sector:
+            df = df[df['sector'] == sector]
+        # Las fechas ISO 8601 se comparan correctamente como texto
+        if start:
+            df = df[df['timestamp'].astype(str) >= str(start)]
+        if end:
+            df = df[df['timestamp'].astype(str) < str(end)]
+        if classes is not None:
+            df = df[~df['class'].isin(classes) if exclude_classes else df['class'].isin(classes)]
+        return df[list(columnas)].copy()
+
+    def class_counts(self, **filtros):
+        # Ítems por clase, de mayor a menor
+        # filtros: sector, start/end (fechas ISO, fin exclusivo), classes y exclude_classes
+        if self.store is not None:
+            return self.store.class_counts(**filtros)
+        return self._load(['class'], **filtros)['class'].value_counts()
+
+    def weight_by_class(self, **filtros):
+        # Suma de peso_total_foto_kg por clase
+        if self.store is not None:
+            return self.store.weight_by_class(**filtros)
+        df = self._load(['class', 'peso_total_foto_kg'], **filtros)
+        return df.groupby('class')['peso_total_foto_kg'].sum().rename('peso')
+
+    def summary(self, **filtros):
+        # Totales: ítems, fotos, confianza media, peso acumulado, rango de fechas y sectores presentes
+        if self.store is not None:
+            return self.store.summary(**filtros)
+        df = self._load(['timestamp', 'file_name', 'sector', 'confidence', 'peso_total_foto_kg'], **filtros)
+        return {
+            'total': len(df), 'fotos': df['file_name'].nunique(),
+            'confianza_media': float(df['confidence'].mean()) if len(df) else 0.0,
+            'peso_total': float(df['peso_total_foto_kg'].sum()),
+            'desde': df['timestamp'].min() if len(df) else None, 'hasta': df['timestamp'].max() if len(df) else None,
+            'sectores': list(df['sector'].dropna().unique())
         }
-        df_nuevo = pd.DataFrame([nuevo_registro])
-        df_nuevo.to_csv(self.csv_path, mode='a', header=False, index=False)
+
+    def hotspots(self, n=3, **filtros):
+        # Puntos críticos: fotos con más ítems registrados
+        if self.store is not None:
+            return self.store.hotspots(n, **filtros)
+        df = self._load(['file_name', 'sector', 'coordenadas'], **filtros)
+        return df.groupby(['file_name', 'sector', 'coordenadas']).size().reset_index(name='Total_Desechos').sort_values('Total_Desechos', ascending=False).head(n)
+
+    def counts_by(self, clave, **filtros):
+        # Ítems por fecha ('date', AAAA-MM-DD), hora del día ('hour') o 'sector', ordenados por la clave
+        if self.store is not None:
+            return self.store.counts_by(clave, **filtros)
+        df = self._load(['timestamp', 'sector'], **filtros)
+        if clave == 'sector':
+            valores = df['sector']
+        elif clave == 'date':
+            valores = df['timestamp'].astype(str).str[:10]
+        else:
+            valores = df['timestamp'].astype(str).str[11:13].astype('int64')
+        return valores.value_counts().sort_index().rename('count').rename_axis(clave)
+
+    def recent_records(self, limit=50, **filtros):
+        # Últimos registros (más recientes primero) para la tabla de detalle, sin cargar el historial en el dashboard
+        if self.store is not None:
+            return self.store.recent_records(limit, **filtros)
+        df = self._load(['timestamp', 'sector', 'class', 'confidence', 'peso_total_foto_kg', 'coordenadas'], **filtros)
+        df = df.sort_values('timestamp', ascending=False).head(limit)
+        df['timestamp'] = pd.to_datetime(df['timestamp'], format='ISO8601')
+        return df.reset_index(drop=True)
+
+    def map_point_count(self, **filtros):
+        # Registros con coordenadas válidas (los que podría mostrar el mapa, antes del límite de map_points)
+        if self.store is not None:
+            return self.store.map_point_count(**filtros)
+        return int(self._load(['lat'], **filtros)['lat'].notna().sum())
+
+    def map_points(self, limit=2000, **filtros):
+        # Registros más recientes con coordenadas válidas (lat, lon ya separadas) para el mapa
+        if self.store is not None:
+            return self.store.map_points(limit, **filtros)
+        df = self._load(['timestamp', 'sector', 'class', 'peso_total_foto_kg', 'lat', 'lon'], **filtros)
+        df = df.dropna(subset=['lat', 'lon']).sort_values('timestamp', ascending=False).head(limit)
+        df['timestamp'] = pd.to_datetime(df['timestamp'], format='ISO8601')
+        return df[['lat', 'lon', 'sector', 'class', 'peso_total_foto_kg', 'timestamp']]
+
+    def environmental_impact(self, pesos_por_clase):
+        # CO₂ ahorrado a partir del peso acumulado por clase (equivale a calculate_environmental_impact)
+        return float(sum(peso * FACTORES_CO2.get(clase, FACTOR_CO2_POR_DEFECTO) for clase, peso in pesos_por_clase.items()))
 
     def classify_waste_value(self, nombre_clase):
         # Clasifica el desecho como Alto Valor, Bajo Valor o Residual
@@ -59,16 +204,7 @@ class DataManager:
                 tipo = row['class']
 
                 # Factores específicos por tipo de material
-                factores = {
-                    'PLASTIC': 0.8,
-                    'METAL': 0.6,
-                    'PAPER': 0.3,
-                    'GLASS': 0.4,
-                    'CARDBOARD': 0.3,
-                    'BIODEGRADABLE': 0.1
-                }
-
-                factor = factores.get(tipo, 0.2)
+                factor = FACTORES_CO2.get(tipo, FACTOR_CO2_POR_DEFECTO)
                 total_co2_ahorrado += peso * factor
 
         return total_co2_ahorrado
@@ -112,10 +248,31 @@ class DataManager:
         if df_filtrado.empty:
             return "El informe no puede generarse: no hay datos para el rango y sector seleccionado."
 
-        total_elementos = df_filtrado.shape[0]
-        total_fotos = df_filtrado['file_name'].nunique()
+        # Conteo de Puntos Críticos
+        puntos_criticos = df_filtrado.groupby(['file_name', 'sector', 'coordenadas']).size().reset_index(name='Total_Desechos').sort_values('Total_Desechos', ascending=False).head(3)
 
-        conteos = df_filtrado["class"].value_counts()
+        return self._format_report(
+            df_filtrado['date'].min(), df_filtrado['date'].max(), df_filtrado['sector'].unique(),
+            df_filtrado["class"].value_counts(), df_filtrado['file_name'].nunique(),
+            df_filtrado['peso_total_foto_kg'].sum(),
+            puntos_criticos, categorias
+        )
+
+    def report_summary(self, categorias, **filtros):
+        # Mismo informe que generate_report_summary, calculado con consultas agregadas (en SQL con SQLite;
+        # con Parquet, leyendo solo las columnas y particiones del filtro) en lugar de un DataFrame con todo el historial
+        conteos = self.class_counts(**filtros)
+        if conteos.empty:
+            return "El informe no puede generarse: no hay datos para el rango y sector seleccionado."
+
+        resumen = self.summary(**filtros)
+        return self._format_report(
+            str(resumen['desde'])[:10], str(resumen['hasta'])[:10], resumen['sectores'], conteos,
+            resumen['fotos'], resumen['peso_total'], self.hotspots(3, **filtros), categorias
+        )
+
+    def _format_report(self, desde, hasta, sectores, conteos, total_fotos, peso_total_kg, puntos_criticos, categorias):
+        total_elementos = int(conteos.sum())
 
         # Cálculos de Reciclaje
         reciclables = [nombre for nombre, info in categorias["info"].items() if info.get("recyclable", False) == True]
@@ -125,18 +282,13 @@ class DataManager:
         # Top 3 de Desechos
         top_3 = conteos.head(3).to_string()
 
-        # Cálculo de Peso Estimado Total
-        peso_total_kg = df_filtrado.drop_duplicates(subset=['file_name'])['peso_total_foto_kg'].sum()
-
-        # Conteo de Puntos Críticos
-        puntos_criticos = df_filtrado.groupby(['file_name', 'sector', 'coordenadas']).size().reset_index(name='Total_Desechos').sort_values('Total_Desechos', ascending=False).head(3)
         puntos_criticos_str = puntos_criticos.to_string(index=False)
 
         reporte = f"""
         ### INFORME DE GESTIÓN MUNICIPAL EJECUTIVO
 
-        **Periodo de Análisis:** {df_filtrado['date'].min()} a {df_filtrado['date'].max()}
-        **Sector(es) Analizado(s):** {', '.join(df_filtrado['sector'].unique())}
+        **Periodo de Análisis:** {desde} a {hasta}
+        **Sector(es) Analizado(s):** {', '.join(map(str, sectores))}
 
         ---
 
@@ -0,0 +1,376 @@
+import json
+import os
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from pathlib import Path
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.dataset as ds
+import pyarrow.parquet as pq
+
+from src.data.locking import file_lock
+from src.data.writer import COLUMNAS_REGISTROS
+
+# Columnas guardadas en cada archivo; 'date' y 'sector' van en la ruta (date=AAAA-MM-DD/sector=...),
+# así que se guardan una sola vez por partición. class y source se repiten mucho: diccionario;
+# confianza y peso en float32
+ESQUEMA_ARCHIVO = pa.schema([
+    ('id', pa.string()),
+    ('timestamp', pa.string()),
+    ('source', pa.dictionary(pa.int32(), pa.string())),
+    ('file_name', pa.string()),
+    ('coordenadas', pa.string()),
+    ('class', pa.dictionary(pa.int32(), pa.string())),
+    ('confidence', pa.float32()),
+    ('peso_total_foto_kg', pa.float32()),
+    ('lat', pa.float64()),
+    ('lon', pa.float64())
+])
+ESQUEMA_PARTICIONES = pa.schema([('date', pa.string()), ('sector', pa.string())])
+ESQUEMA_DATASET = pa.schema(list(ESQUEMA_ARCHIVO) + list(ESQUEMA_PARTICIONES))
+SIN_SECTOR = 'Sin sector'
+# Archivos auxiliares (ocultos: las lecturas ignoran los nombres que empiezan con '.')
+BLOQUEO_LECTURAS = '.lecturas.lock'
+BLOQUEO_COMPACTACION = '.compactacion.lock'
+INTENCION_COMPACTACION = '.compactacion.json'
+
+
+NUMERO = r'[-+]?(?:\d+\.?\d*|\.\d+)(?:[eE][-+]?\d+)?'
+
+
+def split_coordinates(values):
+    # Versión vectorizada de parse_coordinates (en Arrow, sin un bucle en Python): "lat, lon" -> dos arreglos float64,
+    # nulos para textos vacíos o mal formados
+    parts = pc.extract_regex(pa.array(values.astype(str), type=pa.string()), rf'^\s*(?P<lat>{NUMERO})\s*,\s*(?P<lon>{NUMERO})\s*$')
+    return pc.struct_field(parts, 'lat').cast(pa.float64()), pc.struct_field(parts, 'lon').cast(pa.float64())
+
+
+def _filters(sector=None, start=None, end=None, classes=None, exclude_classes=False):
+    # Expresión de filtro; sector y fecha recortan particiones completas antes de abrir archivos
+    expression = None
+    def add(condition):
+        nonlocal expression
+        expression = condition if expression is None else expression & condition
+    if sector:
+        add(ds.field('sector') == sector)
+    if start:
+        add(ds.field('date') >= str(start)[:10])
+        add(ds.field('timestamp') >= str(start))
+    if end:
+        add(ds.field('date') <= str(end)[:10])
+        add(ds.field('timestamp') < str(end))
+    if classes is not None:
+        in_classes = ds.field('class').isin(list(classes))
+        add(~in_classes if exclude_classes else in_classes)
+    return expression
+
+
+class ParquetRecordStore:
+    # Historial de detecciones en Parquet particionado por fecha y sector: las consultas leen solo
+    # las columnas y particiones que necesitan. Cada escritura agrega archivos pequeños por partición,
+    # que una compactación en segundo plano une en uno más grande
+    def __init__(self, root, compact_min_files=8, compact_max_bytes=64 * 1024 * 1024):
+        # compact_min_files: archivos pequeños por partición a partir de los cuales se compacta
+        # compact_max_bytes: los archivos más grandes que esto ya no se vuelven a compactar
+        self.root = Path(root)
+        self.compact_min_files = compact_min_files
+        self.compact_max_bytes = compact_max_bytes
+        self.root.mkdir(parents=True, exist_ok=True)
+        # Las lecturas no deben ver una partición a medio compactar (filas duplicadas o archivos ya borrados):
+        # leen con el bloqueo compartido de BLOQUEO_LECTURAS y el reemplazo toma el exclusivo (también entre procesos).
+        # Cada uso abre su propio descriptor, así que el bloqueo de archivo también separa a los hilos del proceso
+        # y las lecturas no se serializan entre sí
+        self._lock = threading.RLock()
+        self._read_lock_path = self.root / BLOQUEO_LECTURAS
+        self._compacting = False
+        # Una sola compactación a la vez en el proceso (la de segundo plano o una llamada explícita);
+        # entre procesos, cada partición tiene su propio bloqueo de archivo
+        self._compact_lock = threading.Lock()
+        self._partitioning = ds.partitioning(ESQUEMA_PARTICIONES, flavor='hive')
+        self._recover_compactions()
+        # Archivos pequeños por partición escritos desde la última compactación: cada escritura suma a las
+        # particiones de sus filas y solo esas se revisan, sin recorrer el árbol completo en cada append.
+        # Se inicia con un único recorrido, para no dejar sin compactar particiones antiguas que ya no reciben filas
+        self._small_files = {directory: len(paths) for directory, paths in self._pending_partitions().items()}
+
+    def _partition_dir(self, date, sector):
+        # Misma codificación que usa pyarrow para las rutas hive (espacios y tildes en el sector)
+        return self.root / self._partitioning.format((ds.field('date') == date) & (ds.field('sector') == sector))[0]
+
+    def _dataset(self):
+        return ds.dataset(self.root, schema=ESQUEMA_DATASET, format='parquet', partitioning=self._partitioning)
+
+    @contextmanager
+    def _reading(self):
+        with file_lock(self._read_lock_path, shared=True):
+            yield
+
+    @contextmanager
+    def _swapping(self):
+        with file_lock(self._read_lock_path):
+            yield
+
+    def _table(self, columns, **filters):
+        with self._reading():
+            # Cada archivo trae su propio diccionario; se unifican para poder agrupar por clase
+            return self._dataset().to_table(columns=columns, filter=_filters(**filters)).unify_dictionaries()
+
+    def load(self, columns, **filters):
+        # DataFrame con solo las columnas pedidas de las particiones que cumplen el filtro
+        return self._table(columns, **filters).to_pandas()
+
+    def append(self, filas):
+        # Escribe las filas de una o varias fotos: un archivo por partición (fecha, sector)
+        if not filas:
+            return
+        self._append_frame(pd.DataFrame(filas))
+
+    def _append_frame(self, df):
+        # Convierte el bloque a Arrow una sola vez y lo reparte por partición con take()
+        df = df.reindex(columns=COLUMNAS_REGISTROS)
+        latitudes, longitudes = split_coordinates(df['coordenadas'])
+        df['lat'], df['lon'] = latitudes.to_numpy(zero_copy_only=False), longitudes.to_numpy(zero_copy_only=False)
+        table = pa.Table.from_pandas(df[ESQUEMA_ARCHIVO.names], schema=ESQUEMA_ARCHIVO, preserve_index=False)
+        partitions = pd.DataFrame({
+            'date': df['timestamp'].astype(str).str[:10].to_numpy(), 'sector': df['sector'].fillna(SIN_SECTOR).to_numpy()
+        }).groupby(['date', 'sector'], sort=False).indices
+        with self._lock:
+            for (date, sector), indices in partitions.items():
+                directory = self._partition_dir(date, sector)
+                self._write(directory, table.take(indices))
+                self._small_files[directory] = self._small_files.get(directory, 0) + 1
+        self._maybe_compact()
+
+    def _write(self, directory, table):
+        # Escritura atómica: un archivo temporal oculto ('.' lo ignoran las lecturas) y luego rename
+        directory.mkdir(parents=True, exist_ok=True)
+        # El nombre empieza con el instante de escritura: el orden alfabético de los archivos es el de inserción
+        path = directory / f"part-{time.time_ns():020d}-{uuid.uuid4().hex[:8]}.parquet"
+        temporary = directory / f".{path.name}.tmp"
+        pq.write_table(table, temporary)
+        os.replace(temporary, path)
+        return path
+
+    def _files(self):
+        return [path for path in self.root.rglob('*.parquet') if not path.name.startswith('.')]
+
+    def import_csv(self, csv_path, chunksize=50000):
+        # Migración desde el CSV histórico, por bloques (un archivo por partición y bloque)
+        imported = 0
+        for chunk in pd.read_csv(csv_path, dtype={'id': str}, chunksize=chunksize):
+            self._append_frame(chunk)
+            imported += len(chunk)
+        return imported
+
+    def _maybe_compact(self):
+        # Lanza la compactación en segundo plano de las particiones que acumularon muchos archivos pequeños
+        with self._lock:
+            if self._compacting:
+                return
+            directories = [directory for directory, count in self._small_files.items() if count >= self.compact_min_files]
+            if not directories:
+                return
+            for directory in directories:
+                del self._small_files[directory]
+            self._compacting = True
+        threading.Thread(target=self._compact_in_background, args=(directories,), daemon=True).start()
+
+    def _compact_in_background(self, directories):
+        try:
+            with self._compact_lock:
+                for directory in directories:
+                    self._compact_partition(directory)
+        finally:
+            with self._lock:
+                self._compacting = False
+
+    def _pending_partitions(self):
+        # Particiones con al menos compact_min_files archivos pequeños
+        small = {}
+        for path in self._files():
+            try:
+                size = path.stat().st_size
+            except FileNotFoundError:
+                # Otro proceso acaba de compactar esa partición
+                continue
+            if size < self.compact_max_bytes:
+                small.setdefault(path.parent, []).append(path)
+        return {directory: paths for directory, paths in small.items() if len(paths) >= self.compact_min_files}
+
+    def compact(self):
+        # Une los archivos pequeños de cada partición en uno solo; retorna cuántos archivos se eliminaron
+        with self._compact_lock:
+            return self._compact()
+
+    def _compact(self):
+        # Compactación explícita: revisa todas las particiones, no solo las escritas por este proceso
+        directories = list(self._pending_partitions())
+        with self._lock:
+            for directory in directories:
+                self._small_files.pop(directory, None)
+        return sum(self._compact_partition(directory) for directory in directories)
+
+    def _compact_partition(self, directory):
+        # Orden seguro ante cortes: 1) el archivo unido se escribe con un nombre temporal oculto, 2) se guarda la
+        # intención (salida y entradas), 3) con las lecturas bloqueadas se renombra la salida y se borran las entradas,
+        # 4) se borra la intención. Si el proceso muere después de 2, la próxima compactación termina el reemplazo
+        with file_lock(directory / BLOQUEO_COMPACTACION, blocking=False) as lock:
+            if lock is None:
+                # Otro proceso (detect_folder, otra instancia de Streamlit) ya está compactando esta partición
+                return 0
+            self._recover_partition(directory)
+            paths = sorted(path for path in directory.glob('*.parquet') if not path.name.startswith('.') and path.stat().st_size < self.compact_max_bytes)
+            if len(paths) < self.compact_min_files:
+                return 0
+            # Se lee sin bloquear a las lecturas (los archivos escritos no cambian)
+            table = pa.concat_tables([pq.read_table(path, schema=ESQUEMA_ARCHIVO) for path in paths]).unify_dictionaries()
+            # Nombre nuevo con el instante del más antiguo: conserva el orden de inserción sin pisar ninguna entrada
+            name = f"part-{paths[0].name.split('-')[1]}-{uuid.uuid4().hex[:8]}.parquet"
+            temporary = directory / f".{name}.tmp"
+            pq.write_table(table, temporary)
+            self._fsync(temporary)
+            intent = {'salida': name, 'entradas': [path.name for path in paths]}
+            self._write_intent(directory, intent)
+            with self._swapping():
+                self._finish_compaction(directory, intent)
+        return len(paths) - 1
+
+    def _fsync(self, path):
+        with open(path, 'rb') as f:
+            os.fsync(f.fileno())
+
+    def _write_intent(self, directory, intent):
+        temporary = directory / f"{INTENCION_COMPACTACION}.tmp"
+        with open(temporary, 'w', encoding='utf-8') as f:
+            json.dump(intent, f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(temporary, directory / INTENCION_COMPACTACION)
+
+    def _finish_compaction(self, directory, intent):
+        # Idempotente: se puede repetir tras un corte en cualquier punto
+        temporary = directory / f".{intent['salida']}.tmp"
+        if temporary.exists():
+            os.replace(temporary, directory / intent['salida'])
+        if (directory / intent['salida']).exists():
+            # Solo con la salida ya en su lugar se borran las entradas; si no, quedan intactas
+            for name in intent['entradas']:
+                (directory / name).unlink(missing_ok=True)
+        (directory / INTENCION_COMPACTACION).unlink(missing_ok=True)
+
+    def _recover_partition(self, directory):
+        # Termina una compactación interrumpida (se llama con el bloqueo de la partición tomado)
+        path = directory / INTENCION_COMPACTACION
+        if not path.exists():
+            return
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                intent = json.load(f)
+        except json.JSONDecodeError:
+            # Intención incompleta: el reemplazo no empezó y las entradas siguen intactas
+            path.unlink(missing_ok=True)
+            return
+        with self._swapping():
+            self._finish_compaction(directory, intent)
+
+    def _recover_compactions(self):
+        for path in self.root.rglob(INTENCION_COMPACTACION):
+            with file_lock(path.parent / BLOQUEO_COMPACTACION, blocking=False) as lock:
+                if lock is not None:
+                    self._recover_partition(path.parent)
+
+    # Interfaz de resúmenes, la misma que AggregateStore (detector y prompts de Gemini)
+
+    def top_classes(self, n=5):
+        return self.class_counts().head(n)
+
+    def sector_counts(self):
+        counts = self._table(['sector']).group_by('sector').aggregate([('sector', 'count')])
+        return dict(zip(counts['sector'].to_pylist(), counts['sector_count'].to_pylist()))
+
+    def total(self):
+        with self._reading():
+            return self._dataset().count_rows()
+
+    # Consultas del dashboard y de los informes
+
+    def class_counts(self, **filters):
+        counts = self._table(['class'], **filters).group_by('class').aggregate([('class', 'count')])
+        series = pd.Series(counts['class_count'].to_numpy(), index=counts['class'].to_pylist(), name='count', dtype='int64')
+        return series.sort_values(ascending=False, kind='stable').rename_axis('class')
+
+    def weight_by_class(self, **filters):
+        sums = self._table(['class', 'peso_total_foto_kg'], **filters).group_by('class').aggregate([('peso_total_foto_kg', 'sum')])
+        return pd.Series(sums['peso_total_foto_kg_sum'].to_numpy(), index=sums['class'].to_pylist(), name='peso', dtype='float64')
+
+    def summary(self, **filters):
+        # Totales de un filtro: ítems, fotos, confianza media, peso acumulado y rango de fechas
+        table = self._table(['timestamp', 'file_name', 'sector', 'confidence', 'peso_total_foto_kg'], **filters)
+        empty = table.num_rows == 0
+        return {
+            'total': table.num_rows, 'fotos': pc.count_distinct(table['file_name']).as_py(),
+            'confianza_media': 0.0 if empty else float(pc.mean(table['confidence']).as_py()),
+            'peso_total': 0.0 if empty else float(pc.sum(table['peso_total_foto_kg']).as_py()),
+            'desde': None if empty else pc.min(table['timestamp']).as_py(),
+            'hasta': None if empty else pc.max(table['timestamp']).as_py(),
+            'sectores': pc.unique(table['sector']).to_pylist()
+        }
+
+    def hotspots(self, n=3, **filters):
+        # Fotos con más ítems (puntos críticos)
+        table = self._table(['file_name', 'sector', 'coordenadas'], **filters)
+        counts = table.group_by(['file_name', 'sector', 'coordenadas']).aggregate([('file_name', 'count')])
+        df = counts.to_pandas().rename(columns={'file_name_count': 'Total_Desechos'})
+        return df[['file_name', 'sector', 'coordenadas', 'Total_Desechos']].sort_values('Total_Desechos', ascending=False).head(n)
+
+    def counts_by(self, key, **filters):
+        # Ítems por fecha ('date'), hora del día ('hour') o 'sector', ordenados por la clave
+        # La fecha y el sector salen de la ruta de cada partición; la hora, del timestamp ISO 8601
+        if key == 'hour':
+            timestamps = self._table(['timestamp'], **filters)['timestamp']
+            values = pc.cast(pc.utf8_slice_codeunits(timestamps, 11, 13), pa.int64())
+        else:
+            values = self._table([key], **filters)[key]
+        counts = pa.table({key: values}).group_by(key).aggregate([(key, 'count')]).sort_by(key)
+        return pd.Series(counts[f'{key}_count'].to_numpy(), index=counts[key].to_pylist(), name='count', dtype='int64').rename_axis(key)
+
+    def recent_records(self, limit=50, **filters):
+        # Últimos registros (más recientes primero), para la tabla de detalle
+        table = self._table(['timestamp', 'sector', 'class', 'confidence', 'peso_total_foto_kg', 'coordenadas'], **filters)
+        df = table.sort_by([('timestamp', 'descending')]).slice(0, limit).to_pandas()
+        df['class'] = df['class'].astype(str)
+        df[['confidence', 'peso_total_foto_kg']] = df[['confidence', 'peso_total_foto_kg']].astype('float64')
+        df['timestamp'] = pd.to_datetime(df['timestamp'], format='ISO8601')
+        return df
+
+    def map_point_count(self, **filters):
+        expression = _filters(**filters)
+        valid = ds.field('lat').is_valid()
+        with self._reading():
+            return self._dataset().count_rows(filter=valid if expression is None else expression & valid)
+
+    def map_points(self, limit=2000, **filters):
+        # Registros más recientes con coordenadas válidas, para el mapa
+        table = self._table(['lat', 'lon', 'sector', 'class', 'peso_total_foto_kg', 'timestamp'], **filters)
+        table = table.filter(pc.is_valid(table['lat'])).sort_by([('timestamp', 'descending')]).slice(0, limit)
+        df = table.to_pandas()
+        df['class'] = df['class'].astype(str)
+        df['peso_total_foto_kg'] = df['peso_total_foto_kg'].astype('float64')
+        df['timestamp'] = pd.to_datetime(df['timestamp'], format='ISO8601')
+        return df
+
+
+_stores = {}
+_stores_lock = threading.Lock()
+
+def get_parquet_store(root, compact_min_files=8):
+    # Un almacén por directorio, compartido por todos los DataManager del proceso
+    key = str(Path(root).resolve())
+    with _stores_lock:
+        if key not in _stores:
+            _stores[key] = ParquetRecordStore(root, compact_min_files)
+        return _stores[key]
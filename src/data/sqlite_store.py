@@ -0,0 +1,213 @@
+import sqlite3
+import threading
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+from src.data.writer import COLUMNAS_REGISTROS
+
+# Columnas de la tabla: las del CSV más latitud y longitud ya separadas de 'coordenadas'
+COLUMNAS_SQLITE = COLUMNAS_REGISTROS + ['lat', 'lon']
+# Claves de counts_by sobre el timestamp ISO 8601 (AAAA-MM-DDTHH:MM:SS)
+CLAVES_CONTEO = {
+    'date': "substr(timestamp, 1, 10)",
+    'hour': "CAST(substr(timestamp, 12, 2) AS INTEGER)",
+    'sector': "sector"
+}
+
+ESQUEMA = """
+CREATE TABLE IF NOT EXISTS records (
+    id TEXT PRIMARY KEY,
+    timestamp TEXT NOT NULL,
+    source TEXT,
+    file_name TEXT,
+    sector TEXT,
+    coordenadas TEXT,
+    class TEXT,
+    confidence REAL,
+    peso_total_foto_kg REAL,
+    lat REAL,
+    lon REAL
+);
+CREATE INDEX IF NOT EXISTS idx_records_timestamp ON records(timestamp);
+CREATE INDEX IF NOT EXISTS idx_records_sector ON records(sector);
+CREATE INDEX IF NOT EXISTS idx_records_class ON records(class);
+CREATE INDEX IF NOT EXISTS idx_records_file_name ON records(file_name);
+"""
+
+
+def parse_coordinates(values):
+    # "lat, lon" -> (lat, lon) como float; None para textos vacíos o mal formados
+    latitudes, longitudes = [], []
+    for value in values:
+        try:
+            lat, lon = (float(part) for part in str(value).split(','))
+        except (TypeError, ValueError):
+            lat, lon = None, None
+        latitudes.append(lat)
+        longitudes.append(lon)
+    return latitudes, longitudes
+
+
+def _filters(sector=None, start=None, end=None, classes=None, exclude_classes=False):
+    # Cláusula WHERE y parámetros para filtrar por sector, rango de fechas (ISO, fin exclusivo) y clases
+    clauses, params = [], []
+    if sector:
+        clauses.append("sector = ?")
+        params.append(sector)
+    if start:
+        clauses.append("timestamp >= ?")
+        params.append(str(start))
+    if end:
+        clauses.append("timestamp < ?")
+        params.append(str(end))
+    if classes is not None:
+        placeholders = ','.join('?' * len(classes)) or "''"
+        clauses.append(f"class {'NOT IN' if exclude_classes else 'IN'} ({placeholders})")
+        params.extend(classes)
+    return (" WHERE " + " AND ".join(clauses)) if clauses else "", params
+
+
+class SQLiteRecordStore:
+    # Historial de detecciones en SQLite (modo WAL): varias sesiones leen mientras otra escribe,
+    # y los resúmenes se calculan en SQL sin cargar todas las filas en pandas
+    def __init__(self, db_path):
+        self.db_path = Path(db_path)
+        self._local = threading.local()
+        with self._connect() as connection:
+            connection.executescript(ESQUEMA)
+
+    def _connect(self):
+        # Una conexión por hilo (las sesiones de Streamlit corren en hilos distintos)
+        connection = getattr(self._local, 'connection', None)
+        if connection is None:
+            self.db_path.parent.mkdir(parents=True, exist_ok=True)
+            connection = sqlite3.connect(self.db_path, timeout=30)
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute("PRAGMA synchronous=NORMAL")
+            self._local.connection = connection
+        return connection
+
+    def _query(self, sql, params=()):
+        return self._connect().execute(sql, params).fetchall()
+
+    def append(self, filas):
+        # Inserta las filas de una o varias fotos en una sola transacción
+        if not filas:
+            return
+        latitudes, longitudes = parse_coordinates(fila.get('coordenadas') for fila in filas)
+        values = [
+            tuple(fila.get(columna) for columna in COLUMNAS_REGISTROS) + (lat, lon)
+            for fila, lat, lon in zip(filas, latitudes, longitudes)
+        ]
+        with self._connect() as connection:
+            connection.executemany(
+                f"INSERT OR IGNORE INTO records ({', '.join(COLUMNAS_SQLITE)}) VALUES ({', '.join('?' * len(COLUMNAS_SQLITE))})",
+                values
+            )
+
+    def import_csv(self, csv_path, chunksize=50000):
+        # Migración desde el CSV histórico, por bloques; los ids ya importados se ignoran
+        imported = 0
+        for chunk in pd.read_csv(csv_path, dtype={'id': str}, chunksize=chunksize):
+            chunk = chunk.reindex(columns=COLUMNAS_REGISTROS)
+            chunk = chunk.astype(object).where(chunk.notna(), None)
+            before = self.total()
+            self.append(chunk.to_dict('records'))
+            imported += self.total() - before
+        return imported
+
+    # Interfaz de resúmenes, la misma que AggregateStore (detector y prompts de Gemini)
+
+    def top_classes(self, n=5):
+        rows = self._query("SELECT class, COUNT(*) AS c FROM records GROUP BY class ORDER BY c DESC LIMIT ?", (n,))
+        return pd.Series(dict(rows), name='count', dtype='int64').rename_axis('class')
+
+    def sector_counts(self):
+        return dict(self._query("SELECT sector, COUNT(*) FROM records GROUP BY sector"))
+
+    def total(self):
+        return self._query("SELECT COUNT(*) FROM records")[0][0]
+
+    # Consultas del dashboard y de los informes
+
+    def class_counts(self, **filters):
+        where, params = _filters(**filters)
+        rows = self._query(f"SELECT class, COUNT(*) AS c FROM records{where} GROUP BY class ORDER BY c DESC", params)
+        return pd.Series(dict(rows), name='count', dtype='int64').rename_axis('class')
+
+    def weight_by_class(self, **filters):
+        where, params = _filters(**filters)
+        rows = self._query(f"SELECT class, SUM(peso_total_foto_kg) FROM records{where} GROUP BY class", params)
+        return pd.Series({name: float(total or 0.0) for name, total in rows}, name='peso', dtype='float64')
+
+    def summary(self, **filters):
+        # Totales de un filtro: ítems, fotos, confianza media, peso acumulado y rango de fechas
+        where, params = _filters(**filters)
+        total, photos, confidence, weight, first, last = self._query(
+            f"SELECT COUNT(*), COUNT(DISTINCT file_name), AVG(confidence), SUM(peso_total_foto_kg), MIN(timestamp), MAX(timestamp) FROM records{where}",
+            params
+        )[0]
+        sectors = [row[0] for row in self._query(f"SELECT DISTINCT sector FROM records{where}", params)]
+        return {
+            'total': total, 'fotos': photos, 'confianza_media': confidence or 0.0, 'peso_total': weight or 0.0,
+            'desde': first, 'hasta': last, 'sectores': sectors
+        }
+
+    def hotspots(self, n=3, **filters):
+        # Fotos con más ítems (puntos críticos)
+        where, params = _filters(**filters)
+        rows = self._query(
+            f"SELECT file_name, sector, coordenadas, COUNT(*) AS c FROM records{where} "
+            f"GROUP BY file_name, sector, coordenadas ORDER BY c DESC LIMIT ?",
+            params + [n]
+        )
+        return pd.DataFrame(rows, columns=['file_name', 'sector', 'coordenadas', 'Total_Desechos'])
+
+    def counts_by(self, key, **filters):
+        # Ítems por fecha ('date'), hora del día ('hour') o 'sector', ordenados por la clave
+        where, params = _filters(**filters)
+        rows = self._query(f"SELECT {CLAVES_CONTEO[key]} AS k, COUNT(*) FROM records{where} GROUP BY k ORDER BY k", params)
+        return pd.Series(dict(rows), name='count', dtype='int64').rename_axis(key)
+
+    def recent_records(self, limit=50, **filters):
+        # Últimos registros (más recientes primero), para la tabla de detalle
+        where, params = _filters(**filters)
+        rows = self._query(
+            f"SELECT timestamp, sector, class, confidence, peso_total_foto_kg, coordenadas FROM records{where} ORDER BY timestamp DESC LIMIT ?",
+            params + [limit]
+        )
+        df = pd.DataFrame(rows, columns=['timestamp', 'sector', 'class', 'confidence', 'peso_total_foto_kg', 'coordenadas'])
+        df['timestamp'] = pd.to_datetime(df['timestamp'], format='ISO8601')
+        return df
+
+    def map_point_count(self, **filters):
+        where, params = _filters(**filters)
+        where = f"{where} AND lat IS NOT NULL" if where else " WHERE lat IS NOT NULL"
+        return self._query(f"SELECT COUNT(*) FROM records{where}", params)[0][0]
+
+    def map_points(self, limit=2000, **filters):
+        # Registros más recientes con coordenadas válidas, para el mapa
+        where, params = _filters(**filters)
+        where = f"{where} AND lat IS NOT NULL" if where else " WHERE lat IS NOT NULL"
+        rows = self._query(
+            f"SELECT lat, lon, sector, class, peso_total_foto_kg, timestamp FROM records{where} ORDER BY timestamp DESC LIMIT ?",
+            params + [limit]
+        )
+        df = pd.DataFrame(rows, columns=['lat', 'lon', 'sector', 'class', 'peso_total_foto_kg', 'timestamp'])
+        df['timestamp'] = pd.to_datetime(df['timestamp'], format='ISO8601')
+        df[['lat', 'lon']] = df[['lat', 'lon']].astype(np.float64)
+        return df
+
+
+_stores = {}
+_stores_lock = threading.Lock()
+
+def get_sqlite_store(db_path):
+    # Un almacén por base de datos, compartido por todos los DataManager del proceso
+    key = str(Path(db_path).resolve())
+    with _stores_lock:
+        if key not in _stores:
+            _stores[key] = SQLiteRecordStore(db_path)
+        return _stores[key]
@@ -0,0 +1,173 @@
+import csv
+import io
+import logging
+import os
+import uuid
+from contextlib import contextmanager
+from datetime import datetime
+
+from src.data.locking import file_lock
+
+# peso_total_foto_kg guarda el peso estimado de cada ítem (caja): el peso de una foto es la suma de sus filas.
+# El nombre se conserva por compatibilidad del esquema; el historial de app.py repetía el total en cada fila
+# (ver scripts/migrate_legacy_weights.py)
+COLUMNAS_REGISTROS = ['id', 'timestamp', 'source', 'file_name', 'sector', 'coordenadas', 'class', 'confidence', 'peso_total_foto_kg']
+
+
+class RecordWriter:
+    # Escritor de registros en bloque: las filas de una o varias fotos se formatean en memoria
+    # y van al CSV en una sola escritura, con un único flush/fsync (sin un DataFrame por fila)
+    # Varias sesiones y procesos pueden escribir a la vez: cada lote se agrega bajo un bloqueo de archivo
+    # (<csv>.lock) y el bloqueo guarda dónde empezó el lote en curso, para deshacerlo si el proceso muere a la mitad
+    def __init__(self, csv_path, columns=COLUMNAS_REGISTROS, fsync=True):
+        self.csv_path = csv_path
+        self.lock_path = f"{csv_path}.lock"
+        self.columns = columns
+        self.fsync = fsync
+
+    @contextmanager
+    def locked(self):
+        # Bloqueo exclusivo entre hilos y procesos; al tomarlo se reparan escrituras interrumpidas
+        created = not os.path.exists(self.lock_path)
+        with file_lock(self.lock_path) as journal:
+            if created and self.fsync:
+                # La entrada del directorio del bloqueo también debe sobrevivir a un corte de energía
+                self._fsync_directory()
+            self._recover(journal)
+            yield journal
+
+    def _fsync_directory(self):
+        try:
+            descriptor = os.open(os.path.dirname(os.path.abspath(self.lock_path)), os.O_RDONLY)
+        except OSError:
+            # Windows no permite abrir directorios; NTFS ya registra la creación en su journal
+            return
+        try:
+            os.fsync(descriptor)
+        except OSError:
+            pass
+        finally:
+            os.close(descriptor)
+
+    def _mark(self, journal, offset):
+        # Registra (o borra, con None) el inicio del lote que se está escribiendo; se fuerza a disco en ambos casos:
+        # una marca perdida dejaría un lote a medias y una marca vieja haría descartar un lote ya completo
+        journal.seek(0)
+        journal.truncate()
+        if offset is not None:
+            journal.write(str(offset).encode('ascii'))
+        journal.flush()
+        if self.fsync:
+            os.fsync(journal.fileno())
+
+    def _recover(self, journal):
+        # Un lote marcado y no terminado se descarta completo (lotes atómicos por foto); además, una última
+        # línea sin salto de línea (corte de energía antes del fsync) se elimina para no corromper la siguiente
+        journal.seek(0)
+        pending = journal.read().strip()
+        try:
+            size = os.path.getsize(self.csv_path)
+        except FileNotFoundError:
+            return 0
+        keep = size
+        if pending:
+            try:
+                keep = min(keep, int(pending))
+            except ValueError:
+                # Bloqueo corrupto o escrito a medias: sin una marca confiable solo se repara la última línea
+                logging.getLogger(__name__).warning("%s: marca de escritura ilegible (%r), se descarta", self.lock_path, pending[:32])
+        if keep > 0:
+            with open(self.csv_path, 'rb') as f:
+                f.seek(keep - 1)
+                if f.read(1) != b'\n':
+                    keep = self._last_line_end(f, keep)
+        if keep < size:
+            with open(self.csv_path, 'r+b') as f:
+                f.truncate(keep)
+                os.fsync(f.fileno())
+            logging.getLogger(__name__).warning("%s: se descartaron %d bytes de una escritura interrumpida", self.csv_path, size - keep)
+        if pending:
+            self._mark(journal, None)
+        return size - keep
+
+    def _last_line_end(self, f, end, block=64 * 1024):
+        # Posición justo después del último salto de línea antes de 'end' (0 si no hay ninguno)
+        while end > 0:
+            start = max(0, end - block)
+            f.seek(start)
+            index = f.read(end - start).rfind(b'\n')
+            if index >= 0:
+                return start + index + 1
+            end = start
+        return 0
+
+    def ensure_exists(self):
+        # Crea el CSV con los encabezados bajo el bloqueo (sin carrera entre comprobar y crear);
+        # se escribe en un temporal y se renombra, así nadie ve un archivo sin encabezados
+        if os.path.exists(self.csv_path):
+            return
+        with self.locked():
+            if os.path.exists(self.csv_path):
+                return
+            buffer = io.StringIO()
+            csv.writer(buffer, lineterminator=os.linesep).writerow(self.columns)
+            temporary = f"{self.csv_path}.{uuid.uuid4().hex}.tmp"
+            with open(temporary, 'w', encoding='utf-8', newline='') as f:
+                f.write(buffer.getvalue())
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(temporary, self.csv_path)
+
+    def build_rows(self, registros, marca_tiempo=None):
+        # Completa id y timestamp de cada registro; la fecha de captura (EXIF) tiene prioridad sobre la de registro
+        marca_tiempo = marca_tiempo or datetime.now().isoformat()
+        return [{
+            'id': str(uuid.uuid4()),
+            'timestamp': registro.get('timestamp') or marca_tiempo,
+            'source': registro['source'],
+            'file_name': registro['file_name'],
+            'sector': registro['sector'],
+            'coordenadas': registro['coordenadas'],
+            'class': registro['class'],
+            'confidence': registro['confidence'],
+            'peso_total_foto_kg': registro.get('peso_total_foto_kg', 0.0)
+        } for registro in registros]
+
+    def format_rows(self, filas):
+        # Mismo formato que pandas.to_csv: separador ',', comillas mínimas y fin de línea del sistema
+        buffer = io.StringIO()
+        writer = csv.writer(buffer, lineterminator=os.linesep)
+        writer.writerows([fila.get(columna) for columna in self.columns] for fila in filas)
+        return buffer.getvalue()
+
+    def write(self, filas):
+        # Agrega las filas ya completas con una sola escritura y las fuerza a disco, todo o nada
+        # Retorna (tamaño antes, tamaño después) del CSV para este lote
+        if not filas:
+            return None, None
+        with self.locked() as journal:
+            return self.write_locked(journal, filas)
+
+    def write_locked(self, journal, filas):
+        # Igual que write, para quien ya tiene el bloqueo (journal es lo que entrega locked())
+        data = self.format_rows(filas).encode('utf-8')
+        with open(self.csv_path, 'ab') as f:
+            start = f.seek(0, os.SEEK_END)
+            self._mark(journal, start)
+            try:
+                f.write(data)
+                f.flush()
+                if self.fsync:
+                    os.fsync(f.fileno())
+            except BaseException:
+                # Disco lleno, interrupción: el lote no queda a medias
+                f.truncate(start)
+                raise
+        self._mark(journal, None)
+        return start, start + len(data)
+
+    def append(self, registros, marca_tiempo=None):
+        # Completa y escribe los registros; retorna las filas escritas (con sus ids)
+        filas = self.build_rows(registros, marca_tiempo)
+        self.write(filas)
+        return filas
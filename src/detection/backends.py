@@ -0,0 +1,188 @@
+import threading
+import time
+from collections import Counter
+from pathlib import Path
+
+import cv2
+import numpy as np
+from ultralytics import YOLO
+
+# Backends de inferencia disponibles: 'torch' usa los pesos .pt directamente,
+# 'onnx' corre en ONNX Runtime, 'onnx-int8' es la variante ONNX cuantizada a INT8
+# y 'openvino' usa el IR de OpenVINO (todos vía ultralytics)
+BACKENDS = ('torch', 'onnx', 'onnx-int8', 'openvino')
+
+EXTENSIONES_IMAGEN = {'.jpg', '.jpeg', '.png'}
+
+_export_lock = threading.Lock()
+
+
+def export_path(weights_path, backend):
+    # Ruta del artefacto exportado, guardado junto a los pesos originales
+    weights = Path(weights_path)
+    if backend == 'onnx':
+        return weights.with_suffix('.onnx')
+    if backend == 'onnx-int8':
+        return weights.parent / f"{weights.stem}_int8.onnx"
+    if backend == 'openvino':
+        return weights.parent / f"{weights.stem}_openvino_model"
+    return weights
+
+
+def is_stale(artifact, weights_path):
+    # El artefacto debe regenerarse si no existe o si los pesos son más recientes
+    return not artifact.exists() or artifact.stat().st_mtime < Path(weights_path).stat().st_mtime
+
+
+def list_images(folder, limit=None):
+    # Imágenes de una carpeta (recursivo), en orden estable
+    paths = sorted(p for p in Path(folder).rglob('*') if p.suffix.lower() in EXTENSIONES_IMAGEN)
+    return paths[:limit] if limit else paths
+
+
+def letterbox(image, imgsz=640):
+    # Preprocesamiento de YOLO: escala sin deformar, rellena con gris y retorna un tensor NCHW float32 en [0, 1]
+    height, width = image.shape[:2]
+    scale = imgsz / max(height, width)
+    resized = cv2.resize(image, (round(width * scale), round(height * scale)), interpolation=cv2.INTER_LINEAR)
+    canvas = np.full((imgsz, imgsz, 3), 114, dtype=np.uint8)
+    top = (imgsz - resized.shape[0]) // 2
+    left = (imgsz - resized.shape[1]) // 2
+    canvas[top:top + resized.shape[0], left:left + resized.shape[1]] = resized
+    rgb = cv2.cvtColor(canvas, cv2.COLOR_BGR2RGB)
+    return np.ascontiguousarray(rgb.transpose(2, 0, 1)[None], dtype=np.float32) / 255.0
+
+
+def _calibration_reader(onnx_path, image_paths, imgsz):
+    # Lector de calibración para la cuantización estática: entrega las fotos guardadas de a una
+    import onnxruntime
+    from onnxruntime.quantization import CalibrationDataReader
+
+    input_name = onnxruntime.InferenceSession(str(onnx_path), providers=['CPUExecutionProvider']).get_inputs()[0].name
+
+    class _Reader(CalibrationDataReader):
+        def __init__(self):
+            self._paths = iter(image_paths)
+
+        def get_next(self):
+            for path in self._paths:
+                image = cv2.imread(str(path))
+                if image is not None:
+                    return {input_name: letterbox(image, imgsz)}
+            return None
+
+    return _Reader()
+
+
+def quantize_model(onnx_path, output_path, calibration_dir=None, max_images=100, imgsz=640):
+    # Cuantiza un modelo ONNX FP32 a INT8
+    # Sin carpeta de calibración: cuantización dinámica (solo pesos, activaciones en tiempo de ejecución)
+    # Con carpeta: cuantización estática QDQ calibrada con nuestras fotos (más rápida en CPU para convoluciones)
+    from onnxruntime.quantization import QuantFormat, QuantType, quantize_dynamic, quantize_static
+
+    image_paths = list_images(calibration_dir, max_images) if calibration_dir else []
+    tmp_path = Path(output_path).with_suffix('.tmp.onnx')
+    if image_paths:
+        quantize_static(
+            str(onnx_path), str(tmp_path), _calibration_reader(onnx_path, image_paths, imgsz),
+            quant_format=QuantFormat.QDQ, activation_type=QuantType.QUInt8, weight_type=QuantType.QInt8,
+            per_channel=True
+        )
+    else:
+        quantize_dynamic(str(onnx_path), str(tmp_path), weight_type=QuantType.QUInt8)
+    tmp_path.replace(output_path)
+    return Path(output_path)
+
+
+def export_model(weights_path, backend, imgsz=640, calibration_dir=None, max_calibration_images=100):
+    # Exporta los pesos una sola vez al formato del backend y retorna la ruta del artefacto
+    # calibration_dir: solo para 'onnx-int8', carpeta de fotos para la cuantización estática
+    if backend not in BACKENDS:
+        raise ValueError(f"Backend de inferencia desconocido: {backend}. Opciones: {', '.join(BACKENDS)}")
+    artifact = export_path(weights_path, backend)
+    if backend == 'torch':
+        return artifact
+    if backend == 'onnx-int8':
+        # Se parte del ONNX FP32 (exportado si hace falta) y el INT8 se guarda junto a los pesos
+        fp32 = export_model(weights_path, 'onnx', imgsz)
+        with _export_lock:
+            if is_stale(artifact, fp32):
+                quantize_model(fp32, artifact, calibration_dir, max_calibration_images, imgsz)
+        return artifact
+    with _export_lock:
+        if is_stale(artifact, weights_path):
+            # dynamic=True permite mini-lotes de cualquier tamaño en ONNX Runtime
+            exported = YOLO(str(weights_path)).export(format=backend, imgsz=imgsz, dynamic=True)
+            artifact = Path(exported)
+    return artifact
+
+
+def resolve_model_path(weights_path, backend, calibration_dir=None):
+    # Ruta que debe cargar el registro de modelos para el backend configurado
+    artifact = export_path(weights_path, backend)
+    if backend == 'torch' or not is_stale(artifact, weights_path):
+        return artifact
+    return export_model(weights_path, backend, calibration_dir=calibration_dir)
+
+
+def _result_classes(result):
+    # Clases de un resultado: cajas para detección, clase principal para clasificación
+    if result.boxes is not None:
+        return [int(c) for c in result.boxes.cls.tolist()]
+    if result.probs is not None:
+        return [int(result.probs.top1)]
+    return []
+
+
+def count_classes(model, image_paths, confidence_threshold):
+    # Conteo de clases por imagen para un modelo dado, junto con el tiempo total de inferencia
+    counts = []
+    elapsed = 0.0
+    for image_path in image_paths:
+        start = time.perf_counter()
+        result = model(str(image_path), conf=confidence_threshold, verbose=False)[0]
+        elapsed += time.perf_counter() - start
+        counts.append(Counter(model.names[c] for c in _result_classes(result)))
+    return counts, elapsed
+
+
+def class_count_parity(reference_path, candidate_path, image_paths, confidence_threshold=0.5):
+    # Compara, imagen por imagen, el conteo de clases de un modelo candidato contra el de referencia
+    reference = YOLO(str(reference_path))
+    candidate = YOLO(str(candidate_path), task=reference.task)
+    # La primera inferencia inicializa kernels y no se cuenta en el tiempo
+    reference(str(image_paths[0]), verbose=False)
+    candidate(str(image_paths[0]), verbose=False)
+    reference_counts, reference_time = count_classes(reference, image_paths, confidence_threshold)
+    candidate_counts, candidate_time = count_classes(candidate, image_paths, confidence_threshold)
+
+    report = []
+    for image_path, expected, obtained in zip(image_paths, reference_counts, candidate_counts):
+        report.append({
+            'image': str(image_path),
+            'reference': dict(expected),
+            'candidate': dict(obtained),
+            'match': expected == obtained
+        })
+    timing = {
+        'reference_images_per_s': len(image_paths) / reference_time if reference_time else 0.0,
+        'candidate_images_per_s': len(image_paths) / candidate_time if candidate_time else 0.0
+    }
+    return report, timing
+
+
+def per_class_summary(report):
+    # Resumen por clase del reporte de paridad: totales de cada modelo e imágenes con el mismo conteo
+    classes = sorted({name for row in report for name in (*row['reference'], *row['candidate'])})
+    summary = {}
+    for name in classes:
+        reference_total = sum(row['reference'].get(name, 0) for row in report)
+        candidate_total = sum(row['candidate'].get(name, 0) for row in report)
+        matching = sum(row['reference'].get(name, 0) == row['candidate'].get(name, 0) for row in report)
+        summary[name] = {
+            'reference': reference_total,
+            'candidate': candidate_total,
+            'difference': candidate_total - reference_total,
+            'match_rate': matching / len(report) if report else 1.0
+        }
+    return summary
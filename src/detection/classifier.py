@@ -0,0 +1,81 @@
+import numpy as np
+
+# Formato de las detecciones refinadas (forma parte de la versión de los resultados en caché):
+# 2 = la columna 4 conserva la confianza del detector y el puntaje del clasificador va aparte, en la columna 6
+FORMATO_DETECCIONES = 2
+
+
+def crop_boxes(image_array, detections, padding=0.1):
+    # Recortes de cada caja como vistas del mismo buffer (sin copiar píxeles), con un margen de contexto
+    height, width = image_array.shape[:2]
+    boxes = detections[:, :4]
+    pad_x = (boxes[:, 2] - boxes[:, 0]) * padding
+    pad_y = (boxes[:, 3] - boxes[:, 1]) * padding
+    x0 = np.clip(boxes[:, 0] - pad_x, 0, width - 1).astype(int)
+    y0 = np.clip(boxes[:, 1] - pad_y, 0, height - 1).astype(int)
+    x1 = np.maximum(np.clip(boxes[:, 2] + pad_x, 0, width).astype(int), x0 + 1)
+    y1 = np.maximum(np.clip(boxes[:, 3] + pad_y, 0, height).astype(int), y0 + 1)
+    return [image_array[top:bottom, left:right] for left, top, right, bottom in zip(x0, y0, x1, y1)]
+
+
+def with_classifier_scores(detections, scores=None):
+    # Agrega a (N, 6) la columna 6 con el puntaje del clasificador (NaN en las cajas que no se clasificaron)
+    column = np.full((len(detections), 1), np.nan, dtype=np.float32) if scores is None else scores.reshape(-1, 1)
+    return np.hstack([detections[:, :6], column]).astype(np.float32)
+
+
+def map_class_ids(classifier_names, detector_names):
+    # Id del detector para cada clase del clasificador (por nombre, sin distinguir mayúsculas); -1 si no existe
+    by_name = {name.upper(): class_id for class_id, name in detector_names.items()}
+    mapping = np.full(max(classifier_names) + 1, -1, dtype=np.int64)
+    for class_id, name in classifier_names.items():
+        mapping[class_id] = by_name.get(name.upper(), -1)
+    return mapping
+
+
+class CropClassifier:
+    # Segunda etapa: clasifica los recortes de las cajas detectadas y corrige la clase del detector
+    # cuando el clasificador está más seguro; todos los recortes van en una sola llamada al modelo
+    def __init__(self, min_confidence=0.25, padding=0.1, max_batch=256):
+        # min_confidence: solo se reclasifican las cajas con al menos esta confianza del detector
+        # max_batch: tope de recortes por llamada, para acotar la memoria en fotos con cientos de cajas
+        self.min_confidence = min_confidence
+        self.padding = padding
+        self.max_batch = max_batch
+
+    def refine(self, model, image_arrays, detections_list, detector_names):
+        # Retorna (detecciones corregidas por imagen, cantidad de cajas cuya clase cambió)
+        # model: clasificador YOLO; detections_list: arreglos (N, 6) en coordenadas de cada imagen
+        # Las detecciones corregidas son (N, 7): la confianza del detector queda en la columna 4 (es la que filtra
+        # el umbral del usuario y la que se registra) y el puntaje top-1 del clasificador va en la columna 6
+        selected = [np.flatnonzero(detections[:, 4] >= self.min_confidence) for detections in detections_list]
+        crops = [
+            crop
+            for image_array, detections, indices in zip(image_arrays, detections_list, selected)
+            for crop in crop_boxes(image_array, detections[indices], self.padding)
+        ]
+        if not crops:
+            return [with_classifier_scores(detections) for detections in detections_list], 0
+
+        results = [
+            result
+            for start in range(0, len(crops), self.max_batch)
+            for result in model(crops[start:start + self.max_batch], verbose=False)
+        ]
+        labels = np.array([int(result.probs.top1) for result in results])
+        scores = np.array([float(result.probs.top1conf) for result in results], dtype=np.float32)
+        mapped = map_class_ids(model.names, detector_names)[labels]
+
+        refined, changed, offset = [], 0, 0
+        for detections, indices in zip(detections_list, selected):
+            detections = with_classifier_scores(detections)
+            box_labels = mapped[offset:offset + len(indices)]
+            box_scores = scores[offset:offset + len(indices)]
+            offset += len(indices)
+            # Clases del clasificador sin equivalente en el detector (por ejemplo 'trash') no reemplazan nada
+            use = (box_labels >= 0) & (box_scores > detections[indices, 4])
+            changed += int(np.count_nonzero(detections[indices[use], 5] != box_labels[use]))
+            detections[indices[use], 5] = box_labels[use]
+            detections[indices, 6] = box_scores
+            refined.append(detections)
+        return refined, changed
@@ -1,39 +1,80 @@
-import streamlit as st
+import logging
 import numpy as np
 import pandas as pd
-import re
-from src.config.settings import cliente, categorias, CSV_REGISTROS
+import math
+import time
+from src.config.settings import (
+    cliente, categorias, CSV_REGISTROS, RUTA_MODELO, TAMANO_LOTE, BACKEND_INFERENCIA, UMBRAL_MINIMO_INFERENCIA,
+    DIRECTORIO_CALIBRACION_INT8, CLASIFICACION_SEGUNDA_ETAPA, RUTA_CLASIFICADOR, UMBRAL_CLASIFICADOR,
+    NUM_TRABAJADORES_INFERENCIA, MAX_TRABAJOS_PENDIENTES, TIEMPO_LIMITE_INFERENCIA, MAX_REINICIOS_TRABAJADOR,
+    AJUSTE_INFERENCIA, HILOS_INFERENCIA, SLO_LATENCIA_MS, TAMANOS_ENTRADA, INFERENCIAS_SIMULTANEAS,
+    TAMANO_TILE, SOLAPAMIENTO_TILE, PRESUPUESTO_LATENCIA_MS, LATENCIA_TILE_MS_INICIAL,
+    DIRECTORIO_CACHE, MAX_ENTRADAS_CACHE, MAX_ENTRADAS_CACHE_DISCO, DISTANCIA_CASI_DUPLICADO,
+    TAMANO_DECODIFICACION, VIDEO_CADA_N_CUADROS, VIDEO_UMBRAL_ESCENA,
+    TRACKER_IOU, TRACKER_MAX_PERDIDOS, TRACKER_MIN_DETECCIONES,
+    MODELO_GEMINI, MAX_CONCURRENCIA_GEMINI, DIRECTORIO_ANALISIS, TTL_ANALISIS_S, MAX_TRABAJOS_ANALISIS, MAX_ARCHIVOS_ANALISIS,
+    RUTA_CALIBRACION_PESO, PESO_POR_DEFECTO_KG,
+    VERSION_PROMPT_GEMINI, TTL_CACHE_GEMINI_S, MAX_ENTRADAS_CACHE_GEMINI,
+    LADO_VISUALIZACION, LADO_MINIATURA, FORMATO_IMAGEN_SALIDA, CALIDAD_IMAGEN_SALIDA, MAX_BYTES_CACHE_IMAGENES
+)
 from src.data.manager import DataManager
-from ultralytics import YOLO
-from pathlib import Path
-import os
+from src.detection.backends import resolve_model_path
+from src.detection.classifier import FORMATO_DETECCIONES, CropClassifier
+from src.detection.gemini_cache import get_response_cache, make_analysis_key
+from src.detection.gemini_jobs import get_job_queue
+from src.detection.model_registry import registro_modelos
+from src.detection.preprocessing import PreparedImage
+from src.detection.rendering import AnnotatedRenderer
+from src.detection.result_cache import ResultCache, exact_hash, perceptual_hash
+from src.detection.tiling import plan_tiles, tiles_for_budget, merge_detections
+from src.detection.tracking import IoUTracker
+from src.detection.tuning import InferenceTuner
+from src.detection.video import FrameSampler, iter_sampled_frames, video_info
+from src.detection.weights import WeightEstimator
+from src.detection.worker_pool import get_worker_pool
+
+# streamlit solo se importa en los métodos de interfaz (render_* y detect_and_analyze): la inferencia y los lotes
+# también corren sin Streamlit (scripts/detect_folder.py), así que allí los errores van al log
+logger = logging.getLogger(__name__)
+
+# Tiempos de ultralytics por imagen (ms); el resto de claves de los tiempos son ajustes de la llamada
+ETAPAS_INFERENCIA = ('preprocess', 'inference', 'postprocess')
+
+# Hilos e imgsz de la inferencia en proceso, repartidos entre todas las sesiones
+inference_tuner = InferenceTuner(HILOS_INFERENCIA, SLO_LATENCIA_MS, TAMANOS_ENTRADA, AJUSTE_INFERENCIA, INFERENCIAS_SIMULTANEAS)
+# Una copia del modelo por inferencia simultánea (se cargan solo cuando hay llamadas a la vez)
+registro_modelos.replicas = inference_tuner.max_concurrent
+
+# Segunda etapa de clasificación por recortes (opcional)
+crop_classifier = CropClassifier(UMBRAL_CLASIFICADOR)
+
+# Caché de detecciones compartida por todas las sesiones del proceso
+result_cache = ResultCache(
+    DIRECTORIO_CACHE / "detecciones", MAX_ENTRADAS_CACHE, MAX_ENTRADAS_CACHE_DISCO, DISTANCIA_CASI_DUPLICADO
+)
+
+# Imágenes anotadas ya codificadas, reutilizadas entre reruns y sesiones
+renderer = AnnotatedRenderer(
+    LADO_VISUALIZACION, LADO_MINIATURA, FORMATO_IMAGEN_SALIDA, CALIDAD_IMAGEN_SALIDA, MAX_BYTES_CACHE_IMAGENES
+)
 
 class WasteDetector:
-    def __init__(self):
-        self.model_cache = None
+    def __init__(self, batch_size=TAMANO_LOTE, backend=BACKEND_INFERENCIA, classify=CLASIFICACION_SEGUNDA_ETAPA):
+        # classify: reclasifica cada caja con el clasificador (models/best-classify.pt)
+        self.weights_path = RUTA_MODELO
+        self.classifier_path = RUTA_CLASIFICADOR
+        self.classify = classify
+        self.backend = backend
+        self.tile_latency_ms = LATENCIA_TILE_MS_INICIAL
+        self.batch_size = batch_size
         self.data_manager = DataManager(CSV_REGISTROS)
+        self.weight_estimator = WeightEstimator(categorias, RUTA_CALIBRACION_PESO, PESO_POR_DEFECTO_KG)
 
-    def extract_estimated_weight(self, response_text):
-        # Extrae el peso total estimado en kg de la respuesta de Gemini
-        patterns = [
-            r"Peso Total Estimado[:\s]*([\d\.]+)\s*kg",
-            r"peso total[:\s]*([\d\.]+)\s*kg",
-            r"([\d\.]+)\s*kg"
-        ]
-        for pattern in patterns:
-            match = re.search(pattern, response_text, re.IGNORECASE)
-            if match:
-                try:
-                    return float(match.group(1))
-                except ValueError:
-                    continue
-        return 0.0
-
-    def get_data_summary(self, df, category_data, current_count):
+    def get_data_summary(self, top_classes, category_data, current_count):
         # Genera un resumen de los datos y del conteo actual para el prompt de Gemini
+        # top_classes: clases más frecuentes del historial (Serie con formato de value_counts)
         csv_summary = "Historial Total de Desechos (Top 5):\n"
-        if not df.empty:
-            top_classes = df["class"].value_counts().head(5)
+        if not top_classes.empty:
             csv_summary += top_classes.to_string()
         else:
             csv_summary += "Aún no hay registros históricos."
@@ -48,97 +89,557 @@ class WasteDetector:
 
         return f"{csv_summary}\n\n{category_info}\n\n{current_summary}"
 
+    @property
+    def model_path(self):
+        # Artefacto del backend configurado (los pesos .pt o su exportación ONNX/INT8/OpenVINO en caché)
+        return resolve_model_path(self.weights_path, self.backend, DIRECTORIO_CALIBRACION_INT8)
+
     def load_model(self):
-        if self.model_cache is None:
-            model_path = Path(os.getcwd()) / "models" / "best.pt"
-            try:
-                self.model_cache = YOLO(str(model_path))
-            except Exception as e:
-                st.error(f"Error al cargar el modelo YOLO: {e}")
-                return None
-        return self.model_cache
+        # El modelo vive en el registro del proceso: no se recarga en cada sesión ni en cada rerun
+        try:
+            return registro_modelos.get(self.model_path)
+        except Exception as e:
+            logger.error("Error al cargar el modelo YOLO: %s", e)
+            return None
 
-    def detect_and_analyze(self, image, source_type, file_name, sector, coordinates, confidence_threshold, use_gemini=True):
-        # Ejecuta YOLO, guarda los registros con GPS y llama a Gemini
+    def warm_up(self):
+        # Precarga el modelo en segundo plano (o arranca el pool) para que ninguna sesión pague la carga en frío
+        try:
+            if self.get_pool() is None:
+                registro_modelos.preload(self.model_path)
+        except Exception as e:
+            logger.error("Error al preparar el modelo YOLO (%s): %s", self.backend, e)
 
-        model = self.load_model()
-        if not model:
+    def to_array(self, image):
+        # Convierte la imagen (PreparedImage, PIL o ndarray) en un arreglo uint8 contiguo, sin copiar si ya lo es
+        # Las imágenes pueden llegar sin decodificar; se decodifican aquí, justo antes de su mini-lote
+        if isinstance(image, PreparedImage):
+            return image.decode()
+        if hasattr(image, 'convert') and image.mode != 'RGB':
+            image = image.convert('RGB')
+        return np.ascontiguousarray(np.asarray(image, dtype=np.uint8))
+
+    def get_pool(self):
+        # Retorna el pool de procesos de inferencia compartido, o None si está deshabilitado
+        if NUM_TRABAJADORES_INFERENCIA <= 0:
             return None
+        return get_worker_pool(
+            self.model_path, NUM_TRABAJADORES_INFERENCIA, MAX_TRABAJOS_PENDIENTES, TIEMPO_LIMITE_INFERENCIA,
+            self.backend, MAX_REINICIOS_TRABAJADOR
+        )
+
+    def get_class_names(self):
+        # Retorna el diccionario {id: nombre} de clases del modelo, o None si no se pudo cargar
+        pool = self.get_pool()
+        if pool is not None:
+            if not pool.wait_until_ready(timeout=TIEMPO_LIMITE_INFERENCIA):
+                logger.error(pool.unavailable() or "Error al cargar el modelo YOLO: los trabajadores no respondieron a tiempo")
+                return None
+            return pool.names
+        model = self.load_model()
+        return model.names if model else None
+
+    def result_to_array(self, result):
+        # Convierte un resultado de YOLO en un arreglo compacto (x1, y1, x2, y2, conf, cls)
+        if len(result.boxes):
+            return result.boxes.data[:, :6].cpu().numpy().astype(np.float32)
+        return np.zeros((0, 6), dtype=np.float32)
+
+    def predict(self, arrays, confidence_threshold):
+        # Ejecuta el modelo sobre una lista de arreglos; retorna [(detecciones, tiempos_ms), ...]
+        # En proceso, los tiempos incluyen los ajustes elegidos: hilos, imgsz, llamadas en cola delante y latencia
+        pool = self.get_pool()
+        if pool is not None:
+            # Cada trabajador del pool ya tiene sus propios núcleos fijos
+            return pool.predict(arrays, confidence_threshold, timeout=TIEMPO_LIMITE_INFERENCIA)
+        with inference_tuner.slot(len(arrays), apply_threads=self.backend == 'torch') as settings:
+            # El modelo es compartido por todas las sesiones: la llamada completa, con el imgsz elegido, va bajo su lock
+            with registro_modelos.use(self.model_path) as model:
+                predictions = model(arrays, conf=confidence_threshold, imgsz=settings['imgsz'], verbose=False)
+        return [(self.result_to_array(result), dict(result.speed, **settings)) for result in predictions]
+
+    def refine_classes(self, image_arrays, detections_list, names):
+        # Segunda etapa: los recortes de todas las cajas de estas imágenes van al clasificador en una sola llamada
+        if not self.classify:
+            return detections_list
+        try:
+            with registro_modelos.use(self.classifier_path) as model:
+                refined, _ = crop_classifier.refine(model, image_arrays, detections_list, names)
+        except Exception as e:
+            logger.warning("No se pudo usar el clasificador; se usan las clases del detector: %s", e)
+            return detections_list
+        return refined
+
+    def model_version(self, tiled=False):
+        # Versión de los resultados: pesos del detector, modo y, si está activo, pesos del clasificador
+        version = f"{registro_modelos.version(self.model_path)}:{'tiles' if tiled else 'full'}"
+        if self.classify:
+            version += f":{registro_modelos.version(self.classifier_path)}:f{FORMATO_DETECCIONES}"
+        return version
+
+    def predict_chunks(self, chunks, confidence_threshold):
+        # Genera las predicciones de cada mini-lote en orden; con el pool mantiene varios mini-lotes en vuelo
+        pool = self.get_pool()
+        if pool is None:
+            for chunk in chunks:
+                yield self.predict([self.to_array(image) for image in chunk], confidence_threshold)
+            return
+
+        in_flight = []
+        for chunk in chunks:
+            arrays = [self.to_array(image) for image in chunk]
+            in_flight.append(pool.submit(arrays, confidence_threshold, timeout=TIEMPO_LIMITE_INFERENCIA))
+            if len(in_flight) > pool.num_workers:
+                yield in_flight.pop(0).result()
+        for future in in_flight:
+            yield future.result()
 
-        results = model(np.array(image), conf=confidence_threshold)[0]
+    def predict_tiled(self, image_array, confidence_threshold):
+        # Divide la foto en tiles solapados, los infiere como un lote y fusiona las cajas con NMS entre tiles
+        height, width = image_array.shape[:2]
+        # Un cupo del presupuesto se reserva para la pasada sobre la imagen completa (objetos grandes)
+        max_tiles = tiles_for_budget(PRESUPUESTO_LATENCIA_MS, self.tile_latency_ms) - 1
+        tiles = plan_tiles(height, width, TAMANO_TILE, SOLAPAMIENTO_TILE, max_tiles)
+        if len(tiles) <= 1:
+            return self.predict([image_array], confidence_threshold)[0]
 
-        current_count = {name: 0 for name in model.names.values()}
-        records_for_csv = []
+        # Los tiles son vistas del mismo buffer, sin copiar la imagen completa
+        crops = [image_array] + [image_array[y0:y1, x0:x1] for y0, x0, y1, x1 in tiles]
+        offsets = [(0, 0)] + [(x0, y0) for y0, x0, _, _ in tiles]
 
-        for box in results.boxes:
-            class_id = int(box.cls)
-            confidence = float(box.conf)
-            class_name = model.names.get(class_id, f"Clase ID {class_id}")
+        # Con el pool habilitado, los tiles se reparten entre los trabajadores
+        pool = self.get_pool()
+        chunk_size = math.ceil(len(crops) / (pool.num_workers if pool is not None else 1))
+        chunks = [crops[i:i + chunk_size] for i in range(0, len(crops), chunk_size)]
 
-            current_count[class_name] += 1
+        start = time.perf_counter()
+        outputs = [output for chunk_outputs in self.predict_chunks(chunks, confidence_threshold) for output in chunk_outputs]
+        elapsed_ms = (time.perf_counter() - start) * 1000
+        # Promedio móvil de la latencia por tile para ajustar la grilla de la siguiente foto
+        self.tile_latency_ms = 0.7 * self.tile_latency_ms + 0.3 * (elapsed_ms / len(crops))
 
-            records_for_csv.append({
-                'source': source_type, 'file_name': file_name, 'sector': sector,
-                'coordenadas': coordinates, 'class': class_name, 'confidence': confidence
+        shifted = []
+        for (detections, _), (dx, dy) in zip(outputs, offsets):
+            detections = detections.copy()
+            detections[:, [0, 2]] += dx
+            detections[:, [1, 3]] += dy
+            shifted.append(detections)
+
+        timings = {key: sum(t.get(key, 0.0) for _, t in outputs) for key in ETAPAS_INFERENCIA}
+        timings.update({key: value for key, value in outputs[-1][1].items() if key not in ETAPAS_INFERENCIA})
+        timings['tiles'] = len(tiles)
+        return merge_detections(np.concatenate(shifted)), timings
+
+    def filter_detections(self, detections, confidence_threshold):
+        # Filtra por confianza el arreglo de cajas crudas, sin volver a ejecutar el modelo
+        return detections[detections[:, 4] >= confidence_threshold]
+
+    def count_classes(self, detections, names):
+        # Calcula el conteo por clase a partir del arreglo de detecciones
+        current_count = {name: 0 for name in names.values()}
+        for class_id in detections[:, 5].astype(int):
+            class_name = names.get(class_id, f"Clase ID {class_id}")
+            current_count[class_name] = current_count.get(class_name, 0) + 1
+        return current_count
+
+    def plot_detections(self, image, image_array, detections, names, cache_key=None):
+        # Dibuja las cajas a resolución de pantalla y retorna los bytes codificados (cacheados por cache_key)
+        # Con una PreparedImage se dibuja sobre el original decodificado a LADO_VISUALIZACION, no sobre el buffer
+        # del modelo (640 px); esa decodificación solo ocurre si el resultado no está en caché
+        def load():
+            if isinstance(image, PreparedImage):
+                return image.display_frame(image_array, detections, renderer.display_side)
+            return image_array, detections
+        return renderer.render_lazy(load, names, cache_key)
+
+    def make_thumbnail(self, image, detections, names, image_shape):
+        # Miniatura anotada para listas; las fotos JPEG se vuelven a decodificar directamente a escala reducida
+        if isinstance(image, PreparedImage):
+            small = PreparedImage(image.source, max_side=LADO_MINIATURA).decode()
+            ratio = small.shape[0] / image_shape[0]
+            scaled = detections.copy()
+            scaled[:, :4] *= ratio
+            return renderer.thumbnail(small, scaled, names)
+        return renderer.thumbnail(self.to_array(image), detections, names)
+
+    def image_shape(self, image):
+        # (alto, ancho) de la imagen tal como la recibió el modelo, sin volver a decodificarla
+        if isinstance(image, PreparedImage):
+            width, height = image.original_size
+            return round(height * image.scale), round(width * image.scale)
+        if hasattr(image, 'size') and not isinstance(image, np.ndarray):
+            return image.size[1], image.size[0]
+        return image.shape[:2]
+
+    def assign_weights(self, records, detections, names, image_shape=None):
+        # Estima el peso de cada caja y lo guarda en su registro; retorna el peso total de la foto
+        weights = self.weight_estimator.estimate(detections, names, image_shape)
+        for record, weight in zip(records, weights):
+            record['peso_total_foto_kg'] = float(weight)
+        return float(weights.sum())
+
+    def build_records(self, detections, names, metadata):
+        # Construye los registros para el CSV a partir de las detecciones de una foto
+        records = []
+        for class_id, confidence in zip(detections[:, 5].astype(int), detections[:, 4]):
+            records.append({
+                'source': metadata.get('source'), 'file_name': metadata.get('file_name'),
+                'sector': metadata.get('sector'), 'coordenadas': metadata.get('coordenadas'),
+                'timestamp': metadata.get('timestamp'),
+                'class': names.get(class_id, f"Clase ID {class_id}"), 'confidence': float(confidence)
             })
+        return records
+
+    def photo_metadata(self, image, metadata):
+        # Completa los metadatos con el GPS y la fecha de captura del EXIF, que tienen prioridad sobre los ingresados
+        exif = image.exif() if isinstance(image, PreparedImage) else {}
+        resolved = dict(metadata)
+        if exif.get('coordenadas'):
+            resolved['coordenadas'] = exif['coordenadas']
+        if exif.get('timestamp'):
+            resolved['timestamp'] = exif['timestamp']
+        return resolved
+
+    def detect_batch(self, images, metadata, confidence_threshold=0.5, batch_size=None, save=True, tiled=False, thumbnails=False):
+        # Ejecuta YOLO sobre muchas fotos en mini-lotes, sin dibujar en la interfaz
+        # metadata: lista de diccionarios con 'source', 'file_name', 'sector' y 'coordenadas' por imagen
+        # (el GPS y la fecha del EXIF de cada foto reemplazan a los ingresados)
+        # tiled: cada foto se procesa por tiles
+        # thumbnails: agrega a cada resultado una miniatura anotada ya codificada ('miniatura')
+        # save=False: no se escribe nada; los registros de cada foto quedan en su resultado ('registros')
+        if len(images) != len(metadata):
+            raise ValueError("La cantidad de imágenes y de metadatos debe coincidir.")
+
+        names = self.get_class_names()
+        if not names:
+            return None
+
+        # En modo tiles cada foto ya es un lote de tiles, así que se procesan de a una
+        batch_size = 1 if tiled else max(1, batch_size or self.batch_size)
+        batch_results = []
+        pending_records = []
+
+        starts = range(0, len(images), batch_size)
+        # Los arreglos decodificados se conservan hasta procesar su mini-lote (la segunda etapa recorta de ellos)
+        decoded = {}
+
+        def decoded_chunks():
+            for start in starts:
+                decoded[start] = [self.to_array(image) for image in images[start:start + batch_size]]
+                yield decoded[start]
+
+        if tiled:
+            predictions_by_chunk = ([self.predict_tiled(chunk[0], UMBRAL_MINIMO_INFERENCIA)] for chunk in decoded_chunks())
+        else:
+            predictions_by_chunk = self.predict_chunks(decoded_chunks(), UMBRAL_MINIMO_INFERENCIA)
+
+        for start, predictions in zip(starts, predictions_by_chunk):
+            chunk_images = images[start:start + batch_size]
+            # Una sola llamada al clasificador por mini-lote de fotos
+            refined = self.refine_classes(decoded.pop(start), [raw for raw, _ in predictions], names)
+            for raw_detections, (_, timings), meta, image in zip(refined, predictions, metadata[start:start + batch_size], chunk_images):
+                # Se guardan todas las cajas crudas; conteo y registros usan solo las que superan el umbral
+                detections = self.filter_detections(raw_detections, confidence_threshold)
+                current_count = self.count_classes(detections, names)
+                meta = self.photo_metadata(image, meta)
+                records = self.build_records(detections, names, meta)
+                shape = self.image_shape(image)
+                total_weight = self.assign_weights(records, detections, names, shape)
+                pending_records.extend(records)
+
+                batch_results.append({
+                    'file_name': meta.get('file_name'),
+                    'source': meta.get('source'),
+                    'sector': meta.get('sector'),
+                    'coordenadas': meta.get('coordenadas'),
+                    'timestamp': meta.get('timestamp'),
+                    'detecciones': raw_detections,
+                    'conteo': current_count,
+                    'total_items': len(detections),
+                    'peso_total': total_weight,
+                    'tiempos_ms': timings,
+                    'registros': records,
+                    'miniatura': self.make_thumbnail(image, detections, names, shape) if thumbnails else None
+                })
 
+        # Guardar todos los registros del lote en una sola escritura
+        if save:
+            self.data_manager.add_records(pending_records)
+
+        return batch_results
+
+    def detect_video(self, video_path, metadata, confidence_threshold=0.5, every_n=VIDEO_CADA_N_CUADROS,
+                     scene_threshold=VIDEO_UMBRAL_ESCENA, save=True, progress_callback=None):
+        # Procesa un video en streaming: muestrea cuadros, los infiere en mini-lotes y los sigue con un tracker
+        # para que un mismo objeto visto en muchos cuadros genere un solo registro
+        names = self.get_class_names()
+        if not names:
+            return None
+
+        info = video_info(video_path)
+        sampler = FrameSampler(every_n, scene_threshold)
+        tracker = IoUTracker(TRACKER_IOU, TRACKER_MAX_PERDIDOS, TRACKER_MIN_DETECCIONES)
+        start = time.perf_counter()
+        processed_frames = 0
+
+        def flush(indices, frames):
+            raw = [detections for detections, _ in self.predict(frames, UMBRAL_MINIMO_INFERENCIA)]
+            for frame_index, raw_detections in zip(indices, self.refine_classes(frames, raw, names)):
+                tracker.update(self.filter_detections(raw_detections, confidence_threshold), frame_index)
+
+        indices, frames = [], []
+        frame_shape = None
+        for frame_index, frame in iter_sampled_frames(video_path, sampler, TAMANO_DECODIFICACION):
+            frame_shape = frame.shape[:2]
+            indices.append(frame_index)
+            frames.append(frame)
+            if len(frames) >= self.batch_size:
+                flush(indices, frames)
+                processed_frames += len(frames)
+                indices, frames = [], []
+                if progress_callback and info['frames']:
+                    progress_callback(min(1.0, frame_index / info['frames']))
+        if frames:
+            flush(indices, frames)
+            processed_frames += len(frames)
+
+        tracks = tracker.finalize()
+        detections = np.array(
+            [[*track['box'], track['confidence'], track['class_id']] for track in tracks], dtype=np.float32
+        ).reshape(-1, 6)
+        records = self.build_records(detections, names, metadata)
+        total_weight = self.assign_weights(records, detections, names, frame_shape)
+
+        # Un registro por objeto seguido, escritos todos juntos
+        if save:
+            self.data_manager.add_records(records)
+
+        elapsed = time.perf_counter() - start
+        return {
+            'file_name': metadata.get('file_name'),
+            'conteo': self.count_classes(detections, names),
+            'total_items': len(tracks),
+            'peso_total': total_weight,
+            'tracks': tracks,
+            'cuadros_totales': info['frames'],
+            'cuadros_procesados': processed_frames,
+            'duracion_video_s': info['duracion_s'],
+            'tiempo_proceso_s': elapsed,
+            'factor_tiempo_real': info['duracion_s'] / elapsed if elapsed > 0 else 0.0
+        }
+
+    def render_detection(self, processed_image, current_count, confidence_threshold):
+        # Muestra en Streamlit la imagen anotada y el conteo por clase de una foto
+        import streamlit as st
         total_detected = sum(current_count.values())
         st.subheader(f"Detección completada: {total_detected} ítems encontrados (Conf > {confidence_threshold*100:.0f}%)")
 
-        estimated_total_weight = 0.0
-
-        processed_image = results.plot()
         st.image(processed_image, caption=f"Imagen con {total_detected} desechos detectados", width='stretch')
 
         count_df = pd.Series(current_count).rename_axis('class').to_frame('count').sort_values('count', ascending=False)
         st.markdown("### Reporte de Cuantificación por Foto")
         st.dataframe(count_df, width='stretch')
+        return count_df
 
-        st.markdown("---")
-        if cliente and total_detected > 0 and use_gemini:
-            st.subheader("Análisis Avanzado")
-            historical_df = pd.read_csv(CSV_REGISTROS)
-            data_summary = self.get_data_summary(historical_df, categorias, count_df['count'])
-
-            task = (
-                f"Analiza la composición de desechos encontrados en esta foto (Conteo de la FOTO ACTUAL en el sector '{sector}'). "
-                f"Responde en formato Markdown:\n"
-                f"1. **Peso Total Estimado (kg)**: Estima el peso total aproximado de *todos* los desechos detectados en esta foto basándote en conocimientos generales de pesos típicos de desechos. Muestra la estimación en kilogramos (kg). (Ej: 'Peso Total Estimado: 15.3 kg').\n"
-                f"2. **Prioridad de Reciclaje Inmediato**: Indica las 2-3 categorías más valiosas para el reciclaje detectadas en esta foto y sugiere la acción más inmediata para el municipio (ej: coordinar camión específico, notificar centro de acopio).\n"
-                f"3. **Riesgo Ambiental Clave**: Indica si la composición (Orgánico vs. Plástico, etc.) representa un problema de salud pública/contaminación del agua más urgente y por qué. "
+    def render_batch_summary(self, batch_results):
+        # Muestra en Streamlit un resumen tabular de un lote ya procesado
+        import streamlit as st
+        summary_df = pd.DataFrame([{
+            'file_name': result['file_name'],
+            'total_items': result['total_items'],
+            **result['conteo']
+        } for result in batch_results])
+        st.subheader(f"Lote procesado: {len(batch_results)} fotos, {int(summary_df['total_items'].sum()) if not summary_df.empty else 0} ítems")
+        thumbnails = [result for result in batch_results if result.get('miniatura')]
+        if thumbnails:
+            st.image(
+                [result['miniatura'] for result in thumbnails],
+                caption=[f"{result['file_name']} ({result['total_items']})" for result in thumbnails],
+                width=LADO_MINIATURA
             )
-            full_prompt = f"CONTEXTO DE DATOS:\n{data_summary}\n\nTAREA:\n{task}"
-
-            try:
-                with st.spinner('Generando análisis avanzado para toma de decisiones...'):
-                    response = cliente.models.generate_content(
-                        model='gemini-2.5-flash', contents=full_prompt
-                    )
-                estimated_total_weight = self.extract_estimated_weight(response.text)
-                st.success(response.text)
-            except Exception as e:
-                error_msg = str(e)
-                if "503" in error_msg or "UNAVAILABLE" in error_msg:
-                    st.warning("**Servidores de Gemini sobrecargados**\n\nLos servidores de Google están temporalmente saturados. El análisis avanzado estará disponible en unos minutos. Los datos de detección se guardaron correctamente.")
-                elif "400" in error_msg or "INVALID_ARGUMENT" in error_msg:
-                    st.error("❌ **Error de configuración**\n\nRevisa tu clave de API de Gemini. Puede estar expirada o ser inválida.")
-                elif "403" in error_msg or "PERMISSION_DENIED" in error_msg:
-                    st.error("🚫 **Acceso denegado**\n\nVerifica que tu clave de API tenga permisos para usar Gemini.")
-                else:
-                    st.warning(f"⚠️ **Error en análisis avanzado**\n\n{error_msg}\n\nLos datos básicos de detección se guardaron correctamente.")
-                estimated_total_weight = 0.0
+        st.dataframe(summary_df, width='stretch')
+        return summary_df
+
+    def get_analysis_queue(self):
+        # Cola de análisis de Gemini compartida por todas las sesiones, con caché de respuestas
+        response_cache = get_response_cache(
+            DIRECTORIO_CACHE / "gemini", TTL_CACHE_GEMINI_S, MAX_ENTRADAS_CACHE_GEMINI, MAX_ENTRADAS_CACHE_DISCO
+        )
+        return get_job_queue(
+            cliente, DIRECTORIO_ANALISIS, MODELO_GEMINI, MAX_CONCURRENCIA_GEMINI, response_cache,
+            TTL_ANALISIS_S, MAX_TRABAJOS_ANALISIS, MAX_ARCHIVOS_ANALISIS
+        )
+
+    def build_analysis_prompt(self, sector, count_series):
+        # Arma el prompt de Gemini con el historial, las categorías y el conteo de la foto
+        # El historial sale de los contadores incrementales, sin volver a leer el CSV
+        top_classes = self.data_manager.aggregates.top_classes(5)
+        data_summary = self.get_data_summary(top_classes, categorias, count_series)
+
+        task = (
+            f"Analiza la composición de desechos encontrados en esta foto (Conteo de la FOTO ACTUAL en el sector '{sector}'). "
+            f"Responde en formato Markdown:\n"
+            f"1. **Prioridad de Reciclaje Inmediato**: Indica las 2-3 categorías más valiosas para el reciclaje detectadas en esta foto y sugiere la acción más inmediata para el municipio (ej: coordinar camión específico, notificar centro de acopio).\n"
+            f"2. **Riesgo Ambiental Clave**: Indica si la composición (Orgánico vs. Plástico, etc.) representa un problema de salud pública/contaminación del agua más urgente y por qué. "
+        )
+        return f"CONTEXTO DE DATOS:\n{data_summary}\n\nTAREA:\n{task}"
+
+    def render_analysis(self, analysis_id):
+        # Muestra el estado del análisis en segundo plano; retorna el trabajo para que la UI sepa si debe volver a consultar
+        import streamlit as st
+        job = self.get_analysis_queue().status(analysis_id)
+        st.subheader("Análisis Avanzado")
+        if job is None:
+            st.warning("No se encontró el análisis solicitado.")
+        elif job['estado'] in ('pendiente', 'procesando'):
+            st.info("⏳ Generando análisis avanzado para toma de decisiones... Los datos de detección ya se guardaron.")
+        elif job['estado'] == 'completado':
+            st.success(job['analisis'])
+            if job.get('desde_cache'):
+                stats = self.get_analysis_queue().response_cache.stats()
+                st.caption(f"Respuesta reutilizada de un análisis previo del sector con el mismo conteo (tasa de aciertos de la caché: {stats['tasa_aciertos']*100:.0f}%)")
+        else:
+            error_msg = job.get('error', '')
+            if job.get('transitorio'):
+                st.warning("**Servidores de Gemini sobrecargados**\n\nLos servidores de Google están temporalmente saturados. El análisis avanzado estará disponible en unos minutos. Los datos de detección se guardaron correctamente.")
+            elif job.get('codigo') == 400 or "INVALID_ARGUMENT" in error_msg:
+                st.error("❌ **Error de configuración**\n\nRevisa tu clave de API de Gemini. Puede estar expirada o ser inválida.")
+            elif job.get('codigo') == 403 or "PERMISSION_DENIED" in error_msg:
+                st.error("🚫 **Acceso denegado**\n\nVerifica que tu clave de API tenga permisos para usar Gemini.")
+            else:
+                st.warning(f"⚠️ **Error en análisis avanzado**\n\n{error_msg}\n\nLos datos básicos de detección se guardaron correctamente.")
+        return job
+
+    def detect_raw(self, image, tiled=False):
+        # Ejecuta YOLO una sola vez con el umbral mínimo y retorna todas las cajas crudas
+        # Las fotos ya vistas (exactas o casi idénticas) se sirven desde la caché sin inferir
+        names = self.get_class_names()
+        if not names:
+            return None
+
+        image_array = self.to_array(image)
+
+        model_version = self.model_version(tiled)
+        digest = exact_hash(image_array)
+        phash = perceptual_hash(image_array)
+        cached = result_cache.get(digest, model_version, UMBRAL_MINIMO_INFERENCIA)
+        near_duplicate = False
+        if cached is None:
+            # Las cajas de una foto casi idéntica llegan ya reescaladas a esta imagen
+            cached = result_cache.find_near_duplicate(phash, model_version, UMBRAL_MINIMO_INFERENCIA, image_array.shape)
+            near_duplicate = cached is not None
+
+        timings = None
+        if cached is not None:
+            detections = cached['detecciones']
         else:
-            pass
+            if tiled:
+                detections, timings = self.predict_tiled(image_array, UMBRAL_MINIMO_INFERENCIA)
+            else:
+                detections, timings = self.predict([image_array], UMBRAL_MINIMO_INFERENCIA)[0]
+            detections = self.refine_classes([image_array], [detections], names)[0]
+            # Un resultado con imgsz reducido por carga se guarda aparte para no servirlo como el de tamaño completo
+            imgsz = timings.get('imgsz', inference_tuner.full_size)
+            if imgsz != inference_tuner.full_size:
+                model_version = f"{model_version}:{imgsz}"
+            result_cache.put(
+                digest, phash, model_version, UMBRAL_MINIMO_INFERENCIA, detections,
+                registrado=False, forma=list(image_array.shape[:2])
+            )
 
-        # Guardar registros
-        for record in records_for_csv:
-            self.data_manager.add_record(
-                record['source'], record['file_name'], record['sector'],
-                record['coordenadas'], record['class'], record['confidence'], estimated_total_weight / len(records_for_csv) if records_for_csv else 0
+        # Solo la misma foto (hash exacto) se da por ya registrada; una casi idéntica se registra, pero se avisa
+        registered = cached is not None and cached.get('registrado', False)
+        return {
+            'detecciones': detections,
+            'image': image,
+            'image_array': image_array,
+            'names': names,
+            'digest': digest,
+            'phash': phash,
+            'model_version': model_version,
+            'registrado_como': cached.get('file_name') if registered and not near_duplicate else None,
+            'casi_duplicado_de': cached.get('file_name') if registered and near_duplicate else None,
+            'peso_total': cached.get('peso_total', 0.0) if registered and not near_duplicate else 0.0,
+            'tiempos_ms': timings
+        }
+
+    def render_preview(self, raw, confidence_threshold):
+        # Vuelve a filtrar y dibujar las cajas crudas con otro umbral; no ejecuta el modelo
+        detections = self.filter_detections(raw['detecciones'], confidence_threshold)
+        current_count = self.count_classes(detections, raw['names'])
+        cache_key = (raw['digest'], raw['model_version'], round(confidence_threshold, 3))
+        return self.render_detection(self.plot_detections(raw['image'], raw['image_array'], detections, raw['names'], cache_key), current_count, confidence_threshold)
+
+    def detect_and_analyze(self, image, source_type, file_name, sector, coordinates, confidence_threshold, use_gemini=True, tiled=False, skip_duplicates=True, raw=None):
+        # Ejecuta YOLO, guarda los registros con GPS y encola el análisis de Gemini en segundo plano
+        # Si la foto trae GPS o fecha de captura en el EXIF, se usan en lugar de coordinates y de la hora actual
+        # tiled: modo por tiles para fotos de alta resolución con objetos pequeños
+        # skip_duplicates: una foto ya registrada (o casi idéntica) no se vuelve a registrar
+        # raw: resultado previo de detect_raw, para registrar con otro umbral sin volver a inferir
+        import streamlit as st
+
+        raw = raw or self.detect_raw(image, tiled)
+        if raw is None:
+            return None
+        names = raw['names']
+        image_array = raw['image_array']
+
+        if raw['registrado_como'] and skip_duplicates:
+            st.info(f"Esta foto ya fue analizada (archivo '{raw['registrado_como']}'). Se muestran los resultados guardados y no se registra de nuevo.")
+            self.render_preview(raw, confidence_threshold)
+            detections = self.filter_detections(raw['detecciones'], confidence_threshold)
+            return {
+                'total_items': len(detections),
+                'peso_total': raw['peso_total'],
+                'conteo': self.count_classes(detections, names),
+                'duplicado': True,
+                'duplicado_de': raw['registrado_como']
+            }
+
+        if raw.get('casi_duplicado_de'):
+            st.warning(f"Esta foto es casi idéntica a '{raw['casi_duplicado_de']}', ya registrada. Se registra igualmente; revisa que no sea la misma foto.")
+
+        detections = self.filter_detections(raw['detecciones'], confidence_threshold)
+        current_count = self.count_classes(detections, names)
+        records_for_csv = self.build_records(detections, names, self.photo_metadata(image, {
+            'source': source_type, 'file_name': file_name,
+            'sector': sector, 'coordenadas': coordinates
+        }))
+        total_detected = len(records_for_csv)
+
+        cache_key = (raw['digest'], raw['model_version'], round(confidence_threshold, 3))
+        count_df = self.render_detection(self.plot_detections(image, image_array, detections, names, cache_key), current_count, confidence_threshold)
+        timings = raw.get('tiempos_ms') or {}
+        if timings.get('hilos'):
+            st.caption(f"Inferencia: {timings['latencia_ms']:.0f} ms con {timings['hilos']} hilo(s), imgsz {timings['imgsz']}, {timings['en_cola']} inferencia(s) en cola delante")
+
+        # El prompt usa el historial previo a esta foto
+        use_analysis = cliente and total_detected > 0 and use_gemini
+        full_prompt = self.build_analysis_prompt(sector, count_df['count']) if use_analysis else None
+
+        # El peso se estima localmente por caja; Gemini solo aporta el análisis en texto
+        estimated_total_weight = self.assign_weights(records_for_csv, detections, names, image_array.shape)
+        record_ids = self.data_manager.add_records(records_for_csv)
+
+        result_cache.put(
+            raw['digest'], raw['phash'], raw['model_version'], UMBRAL_MINIMO_INFERENCIA, raw['detecciones'],
+            registrado=True, file_name=file_name, peso_total=estimated_total_weight, forma=list(image_array.shape[:2])
+        )
+
+        analysis_id = None
+        st.markdown("---")
+        if use_analysis:
+            analysis_id = self.get_analysis_queue().submit(
+                full_prompt, record_ids,
+                cache_key=make_analysis_key(sector, current_count, VERSION_PROMPT_GEMINI)
             )
+            st.info("El análisis avanzado de Gemini se está generando en segundo plano.")
 
         return {
             'total_items': total_detected,
             'peso_total': estimated_total_weight,
-            'conteo': current_count
-        }
\ No newline at end of file
+            'conteo': current_count,
+            'duplicado': False,
+            'analisis_id': analysis_id,
+            'tiempos_ms': raw.get('tiempos_ms')
+        }
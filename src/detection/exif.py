@@ -0,0 +1,49 @@
+from datetime import datetime
+
+from PIL import Image
+
+# Etiquetas EXIF usadas (https://exiftool.org/TagNames/EXIF.html)
+IFD_GPS = 0x8825
+IFD_EXIF = 0x8769
+FECHA_ORIGINAL = 36867
+FECHA = 306
+
+
+def _to_degrees(value, ref):
+    # (grados, minutos, segundos) en racionales -> grados decimales con signo
+    degrees, minutes, seconds = (float(part) for part in value)
+    decimal = degrees + minutes / 60 + seconds / 3600
+    return -decimal if ref in ('S', 'W') else decimal
+
+
+def read_exif(source):
+    # Lee GPS y fecha de captura solo del encabezado; PIL no decodifica los píxeles hasta que se piden
+    # Retorna {'coordenadas': "lat, lon" o None, 'timestamp': ISO 8601 o None}
+    if hasattr(source, 'seek'):
+        source.seek(0)
+    metadata = {'coordenadas': None, 'timestamp': None}
+    try:
+        with Image.open(source) as image:
+            exif = image.getexif()
+    except (OSError, ValueError):
+        return metadata
+    finally:
+        if hasattr(source, 'seek'):
+            source.seek(0)
+
+    try:
+        gps = exif.get_ifd(IFD_GPS)
+        if 2 in gps and 4 in gps:
+            latitude = _to_degrees(gps[2], gps.get(1, 'N'))
+            longitude = _to_degrees(gps[4], gps.get(3, 'E'))
+            metadata['coordenadas'] = f"{latitude:.6f}, {longitude:.6f}"
+    except (KeyError, TypeError, ValueError, ZeroDivisionError):
+        pass
+
+    captured = exif.get_ifd(IFD_EXIF).get(FECHA_ORIGINAL) or exif.get(FECHA)
+    if captured:
+        try:
+            metadata['timestamp'] = datetime.strptime(str(captured).strip('\x00 '), "%Y:%m:%d %H:%M:%S").isoformat()
+        except ValueError:
+            pass
+    return metadata
@@ -0,0 +1,127 @@
+import hashlib
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+from pathlib import Path
+
+
+def make_analysis_key(sector, counts, prompt_version):
+    # Clave normalizada: sector sin mayúsculas/espacios, clases con conteo > 0 ordenadas y versión del prompt
+    normalized_sector = " ".join(str(sector).split()).lower()
+    vector = sorted((str(name), int(count)) for name, count in dict(counts).items() if int(count) > 0)
+    return json.dumps([normalized_sector, vector, str(prompt_version)], ensure_ascii=False)
+
+
+class GeminiResponseCache:
+    # Caché de respuestas de Gemini: LRU en memoria con TTL y un nivel persistente en disco
+    def __init__(self, cache_dir, ttl_seconds=86400, max_entries=512, max_disk_entries=5000):
+        self.cache_dir = Path(cache_dir)
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self.max_disk_entries = max_disk_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._stats = {'hits_memoria': 0, 'hits_disco': 0, 'misses': 0, 'expirados': 0}
+        self._index_path = self.cache_dir / "index.json"
+        self._index = self._load_index()
+
+    def _load_index(self):
+        # Índice {clave: fecha de creación} de las entradas en disco
+        try:
+            with open(self._index_path, "r", encoding="utf-8") as f:
+                return json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            return {}
+
+    def _save_index(self):
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+        tmp_path = self._index_path.with_suffix(".tmp")
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(self._index, f, ensure_ascii=False)
+        os.replace(tmp_path, self._index_path)
+
+    def _entry_path(self, key):
+        return self.cache_dir / f"{hashlib.sha1(key.encode()).hexdigest()}.json"
+
+    def _expired(self, entry):
+        return time.time() - entry['creado'] > self.ttl_seconds
+
+    def _read_disk(self, key):
+        try:
+            with open(self._entry_path(key), "r", encoding="utf-8") as f:
+                return json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            return None
+
+    def _drop(self, key):
+        self._entries.pop(key, None)
+        if self._index.pop(key, None) is not None:
+            self._entry_path(key).unlink(missing_ok=True)
+            self._save_index()
+
+    def _remember(self, key, entry):
+        self._entries[key] = entry
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def get(self, key):
+        # Retorna {'texto', 'creado'} o None si no existe o ya expiró
+        with self._lock:
+            entry = self._entries.get(key)
+            tier = 'hits_memoria'
+            if entry is None and key in self._index:
+                entry = self._read_disk(key)
+                tier = 'hits_disco'
+            if entry is None:
+                self._stats['misses'] += 1
+                return None
+            if self._expired(entry):
+                self._drop(key)
+                self._stats['expirados'] += 1
+                self._stats['misses'] += 1
+                return None
+            self._remember(key, entry)
+            self._stats[tier] += 1
+            return dict(entry)
+
+    def put(self, key, text):
+        entry = {'texto': text, 'creado': time.time()}
+        with self._lock:
+            self._remember(key, entry)
+            self.cache_dir.mkdir(parents=True, exist_ok=True)
+            tmp_path = self._entry_path(key).with_suffix(".tmp")
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump(entry, f, ensure_ascii=False)
+            os.replace(tmp_path, self._entry_path(key))
+
+            self._index[key] = entry['creado']
+            if len(self._index) > self.max_disk_entries:
+                # Se descartan las respuestas más antiguas del nivel en disco
+                for old_key in sorted(self._index, key=self._index.get)[:len(self._index) - self.max_disk_entries]:
+                    self._index.pop(old_key, None)
+                    self._entry_path(old_key).unlink(missing_ok=True)
+            self._save_index()
+
+    def stats(self):
+        # Aciertos (memoria y disco), fallos, expirados y tasa de aciertos
+        with self._lock:
+            stats = dict(self._stats, entradas_memoria=len(self._entries), entradas_disco=len(self._index))
+        hits = stats['hits_memoria'] + stats['hits_disco']
+        total = hits + stats['misses']
+        stats['tasa_aciertos'] = hits / total if total else 0.0
+        return stats
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+def get_response_cache(cache_dir, ttl_seconds=86400, max_entries=512, max_disk_entries=5000):
+    # Caché compartida por todas las sesiones del proceso
+    global _cache
+    with _cache_lock:
+        if _cache is None:
+            _cache = GeminiResponseCache(cache_dir, ttl_seconds, max_entries, max_disk_entries)
+        return _cache
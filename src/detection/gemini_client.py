@@ -0,0 +1,163 @@
+import random
+import threading
+import time
+
+
+# Códigos HTTP que indican una falla pasajera del servicio (se reintentan y cuentan para el circuito)
+CODIGOS_TRANSITORIOS = {429, 500, 502, 503, 504}
+ESTADOS_TRANSITORIOS = ('UNAVAILABLE', 'RESOURCE_EXHAUSTED', 'DEADLINE_EXCEEDED', 'INTERNAL')
+
+
+class GeminiUnavailableError(Exception):
+    # Gemini se omitió sin llamarlo: circuito abierto o cuota local agotada
+    pass
+
+
+def is_transient(error):
+    # Errores de red, timeouts y 429/5xx; los 400/403 (clave inválida, permisos) no se reintentan
+    code = getattr(error, 'code', None)
+    if isinstance(code, int):
+        return code in CODIGOS_TRANSITORIOS
+    if isinstance(error, (TimeoutError, ConnectionError)):
+        return True
+    name = type(error).__name__
+    if name in ('ConnectError', 'ReadTimeout', 'ConnectTimeout', 'RemoteProtocolError', 'ReadError'):
+        return True
+    return any(estado in str(error) for estado in ESTADOS_TRANSITORIOS)
+
+
+class TokenBucket:
+    # Limitador de tasa: rate fichas por segundo con ráfagas de hasta burst llamadas
+    def __init__(self, rate_per_minute, burst=None):
+        self.rate = rate_per_minute / 60.0
+        self.capacity = burst or max(1, int(rate_per_minute // 6))
+        self._tokens = float(self.capacity)
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def acquire(self, max_wait):
+        # Toma una ficha esperando a lo sumo max_wait segundos; retorna False si no alcanzó
+        deadline = time.monotonic() + max_wait
+        while True:
+            with self._lock:
+                self._refill()
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return True
+                wait = (1 - self._tokens) / self.rate
+            if time.monotonic() + wait > deadline:
+                return False
+            time.sleep(wait)
+
+
+class CircuitBreaker:
+    # Tras failure_threshold fallas seguidas se abre durante cooldown_s; luego deja pasar una llamada de prueba
+    def __init__(self, failure_threshold=3, cooldown_s=60.0):
+        self.failure_threshold = failure_threshold
+        self.cooldown_s = cooldown_s
+        self._failures = 0
+        self._opened_at = None
+        self._probing = False
+        self._lock = threading.Lock()
+
+    @property
+    def state(self):
+        with self._lock:
+            if self._opened_at is None:
+                return 'cerrado'
+            if time.monotonic() - self._opened_at < self.cooldown_s:
+                return 'abierto'
+            return 'semiabierto'
+
+    def allow(self):
+        with self._lock:
+            if self._opened_at is None:
+                return True
+            if time.monotonic() - self._opened_at < self.cooldown_s or self._probing:
+                return False
+            # Enfriamiento cumplido: una sola llamada de prueba decide si se cierra
+            self._probing = True
+            return True
+
+    def record_success(self):
+        with self._lock:
+            self._failures = 0
+            self._opened_at = None
+            self._probing = False
+
+    def record_failure(self):
+        with self._lock:
+            self._failures += 1
+            if self._probing or self._failures >= self.failure_threshold:
+                self._opened_at = time.monotonic()
+            self._probing = False
+
+    def release(self):
+        # Libera la llamada de prueba sin resultado (no llegó a Gemini o falló por un error no transitorio)
+        with self._lock:
+            self._probing = False
+
+    def remaining(self):
+        # Segundos que faltan para volver a intentar
+        with self._lock:
+            if self._opened_at is None:
+                return 0.0
+            return max(0.0, self.cooldown_s - (time.monotonic() - self._opened_at))
+
+
+class ResilientGeminiClient:
+    # Envuelve genai.Client con limitador de tasa, reintentos con backoff exponencial y circuit breaker
+    # Expone la misma interfaz (cliente.models.generate_content) para poder reemplazar al cliente original
+    def __init__(self, client, rate_per_minute=10, max_retries=3, base_delay=1.0, max_delay=20.0,
+                 failure_threshold=3, cooldown_s=60.0, max_wait_s=30.0):
+        self.client = client
+        self.limiter = TokenBucket(rate_per_minute)
+        self.breaker = CircuitBreaker(failure_threshold, cooldown_s)
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.max_wait_s = max_wait_s
+
+    @property
+    def models(self):
+        return self
+
+    def _backoff(self, attempt):
+        # Backoff exponencial con jitter completo para no sincronizar los reintentos
+        return random.uniform(0, min(self.max_delay, self.base_delay * 2 ** attempt))
+
+    def generate_content(self, model, contents, **kwargs):
+        attempt = 0
+        while True:
+            if not self.breaker.allow():
+                raise GeminiUnavailableError(
+                    f"UNAVAILABLE: Gemini omitido por fallas repetidas; se reintentará en {self.breaker.remaining():.0f} s"
+                )
+            # Toda salida sin éxito ni falla registrada libera la prueba; si no, el circuito quedaría abierto para siempre
+            recorded = False
+            try:
+                if not self.limiter.acquire(self.max_wait_s):
+                    raise GeminiUnavailableError("RESOURCE_EXHAUSTED: se alcanzó el límite local de solicitudes a Gemini")
+                try:
+                    response = self.client.models.generate_content(model=model, contents=contents, **kwargs)
+                except Exception as e:
+                    if not is_transient(e):
+                        raise
+                    self.breaker.record_failure()
+                    recorded = True
+                    if attempt >= self.max_retries:
+                        raise
+                    time.sleep(self._backoff(attempt))
+                    attempt += 1
+                    continue
+                self.breaker.record_success()
+                recorded = True
+                return response
+            finally:
+                if not recorded:
+                    self.breaker.release()
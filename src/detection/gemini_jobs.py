@@ -0,0 +1,145 @@
+import json
+import os
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+from src.detection.gemini_client import GeminiUnavailableError, is_transient
+
+
+# Como mucho una limpieza del directorio de resultados por intervalo, para no listarlo en cada análisis
+INTERVALO_LIMPIEZA_S = 60
+
+
+class GeminiJobQueue:
+    # Análisis de Gemini en segundo plano: la detección se guarda primero y el análisis llega después
+    # ttl_seconds: vida de un trabajo terminado, en memoria y en disco
+    # max_jobs / max_results: trabajos terminados en memoria (LRU) y archivos de resultado en disco
+    def __init__(self, client, results_dir, model_name, max_concurrency=2, response_cache=None,
+                 ttl_seconds=86400, max_jobs=256, max_results=2000):
+        self.client = client
+        self.response_cache = response_cache
+        self.results_dir = Path(results_dir)
+        self.model_name = model_name
+        self.ttl_seconds = ttl_seconds
+        self.max_jobs = max_jobs
+        self.max_results = max_results
+        # El tamaño del executor es el límite de llamadas simultáneas a Gemini
+        self._executor = ThreadPoolExecutor(max_workers=max(1, max_concurrency), thread_name_prefix="gemini")
+        self._jobs = OrderedDict()
+        self._lock = threading.Lock()
+        self._last_prune = 0.0
+
+    def submit(self, prompt, record_ids, cache_key=None):
+        # Encola el análisis y retorna un id para consultar el resultado más tarde
+        # record_ids: registros de la foto analizada (el peso ya se guardó con ellos; Gemini solo aporta el texto)
+        # cache_key: clave de make_analysis_key; si ya hay respuesta en caché el trabajo se completa sin llamar a Gemini
+        job_id = str(uuid.uuid4())
+        job = {'estado': 'pendiente', 'creado': time.time(), 'registros': len(record_ids)}
+        cached = self.response_cache.get(cache_key) if self.response_cache and cache_key else None
+        if cached is not None:
+            job.update(estado='completado', analisis=cached['texto'], desde_cache=True)
+            job['terminado'] = time.time()
+            self._set(job_id, job)
+            self._persist(job_id, job)
+            return job_id
+        self._set(job_id, job)
+        self._executor.submit(self._run, job_id, prompt, cache_key)
+        return job_id
+
+    def status(self, job_id):
+        # Estado del trabajo: 'pendiente', 'procesando', 'completado' o 'error'
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is not None:
+                self._jobs.move_to_end(job_id)
+        if job is not None:
+            return dict(job)
+        try:
+            with open(self._result_path(job_id), "r", encoding="utf-8") as f:
+                return json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            return None
+
+    def _result_path(self, job_id):
+        return self.results_dir / f"{job_id}.json"
+
+    def _set(self, job_id, job):
+        with self._lock:
+            self._jobs[job_id] = job
+            self._jobs.move_to_end(job_id)
+            self._evict()
+
+    def _evict(self):
+        # Saca de memoria los trabajos terminados vencidos o que exceden max_jobs (los menos consultados primero);
+        # los pendientes no se tocan y los terminados se siguen pudiendo leer desde disco
+        limit = time.time() - self.ttl_seconds
+        finished = [job_id for job_id, job in self._jobs.items() if 'terminado' in job]
+        excess = len(finished) - self.max_jobs
+        for job_id in finished:
+            if excess > 0 or self._jobs[job_id]['terminado'] < limit:
+                del self._jobs[job_id]
+                excess -= 1
+
+    def _run(self, job_id, prompt, cache_key):
+        job = dict(self.status(job_id) or {}, estado='procesando')
+        self._set(job_id, job)
+        try:
+            response = self.client.models.generate_content(model=self.model_name, contents=prompt)
+            if self.response_cache and cache_key:
+                self.response_cache.put(cache_key, response.text)
+            job.update(estado='completado', analisis=response.text)
+        except Exception as e:
+            # transitorio: servicio saturado o circuito abierto; los registros ya guardados no cambian
+            job.update(estado='error', error=str(e), codigo=getattr(e, 'code', None), transitorio=isinstance(e, GeminiUnavailableError) or is_transient(e))
+        job['terminado'] = time.time()
+        self._set(job_id, job)
+        self._persist(job_id, job)
+
+    def _persist(self, job_id, job):
+        # Guarda el resultado en disco para poder consultarlo desde otra sesión o tras un reinicio
+        self.results_dir.mkdir(parents=True, exist_ok=True)
+        tmp_path = self._result_path(job_id).with_suffix(".tmp")
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(job, f, ensure_ascii=False)
+        os.replace(tmp_path, self._result_path(job_id))
+        self._prune()
+
+    def _prune(self):
+        # Borra los resultados en disco vencidos y, si aún sobran, los más antiguos hasta quedar en max_results
+        now = time.time()
+        with self._lock:
+            if now - self._last_prune < INTERVALO_LIMPIEZA_S:
+                return
+            self._last_prune = now
+        results = []
+        for path in self.results_dir.glob("*.json"):
+            try:
+                results.append((path.stat().st_mtime, path))
+            except FileNotFoundError:
+                continue
+        results.sort()
+        excess = len(results) - self.max_results
+        for modified, path in results:
+            if excess <= 0 and modified >= now - self.ttl_seconds:
+                break
+            path.unlink(missing_ok=True)
+            excess -= 1
+
+
+_queue = None
+_queue_lock = threading.Lock()
+
+def get_job_queue(client, results_dir, model_name, max_concurrency=2, response_cache=None,
+                  ttl_seconds=86400, max_jobs=256, max_results=2000):
+    # Cola compartida por todas las sesiones del proceso
+    global _queue
+    with _queue_lock:
+        if _queue is None:
+            _queue = GeminiJobQueue(
+                client, results_dir, model_name, max_concurrency, response_cache, ttl_seconds, max_jobs, max_results
+            )
+        return _queue
@@ -0,0 +1,151 @@
+import threading
+from contextlib import contextmanager
+from pathlib import Path
+
+import numpy as np
+from ultralytics import YOLO
+
+
+class _Replicas:
+    # Copias de un mismo modelo para inferir en paralelo: cada llamada toma una libre y
+    # las copias adicionales se cargan solo cuando hay llamadas simultáneas
+    def __init__(self, model, load):
+        self._load = load
+        self._free = [model]
+        self._created = 1
+        self._condition = threading.Condition()
+
+    @contextmanager
+    def acquire(self, limit):
+        # Entrega una copia libre; si no hay y se crearon menos de limit, carga otra, si no espera
+        with self._condition:
+            while not self._free and self._created >= limit:
+                self._condition.wait()
+            model = self._free.pop() if self._free else None
+            if model is None:
+                self._created += 1
+        if model is None:
+            try:
+                model = self._load()
+            except Exception:
+                with self._condition:
+                    self._created -= 1
+                    self._condition.notify()
+                raise
+        try:
+            yield model
+        finally:
+            with self._condition:
+                self._free.append(model)
+                self._condition.notify()
+
+
+class ModelRegistry:
+    # Registro de modelos compartido por todo el proceso, indexado por ruta resuelta y mtime del archivo
+    # Un objeto YOLO no es seguro entre hilos (conf, imgsz y demás argumentos se guardan en el predictor
+    # antes de inferir), así que cada inferencia toma su propia copia del modelo a través de use()
+    def __init__(self, warm_up_size=640, replicas=1):
+        # replicas: copias por modelo, es decir, inferencias simultáneas sobre el mismo modelo
+        self.warm_up_size = warm_up_size
+        self.replicas = replicas
+        # ruta -> (mtime, modelo, copias para inferir)
+        self._models = {}
+        self._lock = threading.Lock()
+        # Un lock de carga por ruta: dos sesiones que piden el mismo modelo en frío no lo cargan dos veces
+        self._load_locks = {}
+        self._loading = set()
+
+    def _key(self, path):
+        resolved = Path(path).resolve()
+        return str(resolved), resolved.stat().st_mtime_ns
+
+    def _load_lock(self, path):
+        with self._lock:
+            return self._load_locks.setdefault(path, threading.Lock())
+
+    def _load(self, path, mtime):
+        # Carga el modelo, ejecuta una inferencia de calentamiento y lo publica en el registro
+        # Se llama con el lock de carga de la ruta tomado; si otro hilo ya publicó esta versión, se reutiliza
+        with self._lock:
+            current = self._models.get(path)
+        if current is not None and current[0] >= mtime:
+            return current
+        model = self._new_model(path)
+        with self._lock:
+            current = self._models.get(path)
+            if current is None or current[0] < mtime:
+                self._models[path] = current = (mtime, model, _Replicas(model, lambda: self._new_model(path)))
+        return current
+
+    def _new_model(self, path):
+        model = YOLO(path)
+        self.warm_up(model)
+        return model
+
+    def _reload_in_background(self, path, mtime):
+        # Recarga el modelo en segundo plano; mientras tanto se sigue sirviendo la versión anterior
+        def run():
+            try:
+                with self._load_lock(path):
+                    self._load(path, mtime)
+            except Exception:
+                # El archivo puede estar a medio copiar; se reintenta en la siguiente consulta
+                pass
+            finally:
+                with self._lock:
+                    self._loading.discard(path)
+
+        with self._lock:
+            if path in self._loading:
+                return
+            self._loading.add(path)
+        threading.Thread(target=run, daemon=True).start()
+
+    def warm_up(self, model):
+        # Ejecuta una inferencia sobre una imagen vacía para inicializar pesos y kernels
+        dummy = np.zeros((self.warm_up_size, self.warm_up_size, 3), dtype=np.uint8)
+        model(dummy, verbose=False)
+
+    def _entry(self, path):
+        # Entrada vigente del modelo; solo la primera carga del proceso es bloqueante
+        key, mtime = self._key(path)
+        with self._lock:
+            entry = self._models.get(key)
+        if entry is not None:
+            if entry[0] != mtime:
+                self._reload_in_background(key, mtime)
+            return entry
+        with self._load_lock(key):
+            return self._load(key, mtime)
+
+    def get(self, path):
+        # Retorna el modelo cargado, para consultar sus atributos (names, task); para inferir, usar use()
+        return self._entry(path)[1]
+
+    @contextmanager
+    def use(self, path):
+        # Entrega una copia del modelo de uso exclusivo durante la llamada completa (argumentos e inferencia):
+        # no se mezcla con la de otra sesión; con replicas > 1, varias sesiones infieren a la vez
+        _, _, replicas = self._entry(path)
+        with replicas.acquire(self.replicas) as model:
+            yield model
+
+    def preload(self, path):
+        # Carga y calienta el modelo en segundo plano (por ejemplo al arrancar el servidor)
+        try:
+            key, mtime = self._key(path)
+        except OSError:
+            return
+        with self._lock:
+            loaded = key in self._models
+        if not loaded:
+            self._reload_in_background(key, mtime)
+
+    def version(self, path):
+        # Identificador de la versión actual de los pesos: nombre del archivo y mtime
+        key, mtime = self._key(path)
+        return f"{Path(key).name}@{mtime}"
+
+
+# Registro único del proceso, compartido por todas las sesiones de Streamlit
+registro_modelos = ModelRegistry()
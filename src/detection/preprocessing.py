@@ -0,0 +1,62 @@
+import numpy as np
+from PIL import Image
+
+from src.detection.exif import read_exif
+
+
+class PreparedImage:
+    # Imagen subida que se decodifica bajo demanda y solo al tamaño que necesita el modelo
+    def __init__(self, source, max_side=640, name=None):
+        # source: ruta o archivo (UploadedFile, BytesIO); max_side=None decodifica a resolución completa
+        self.source = source
+        self.max_side = max_side
+        self.name = name or getattr(source, 'name', None)
+        self.original_size = None
+        self.scale = 1.0
+        self._exif = None
+
+    def _open(self):
+        if hasattr(self.source, 'seek'):
+            self.source.seek(0)
+        image = Image.open(self.source)
+        self.original_size = image.size
+        return image
+
+    def exif(self):
+        # GPS y fecha de captura del encabezado EXIF (sin decodificar píxeles), leídos una sola vez
+        if self._exif is None:
+            self._exif = read_exif(self.source)
+        return self._exif
+
+    def _decoded(self, max_side):
+        image = self._open()
+        if max_side and image.format == 'JPEG':
+            # draft elige la menor escala de decodificación que sigue siendo >= max_side
+            image.draft('RGB', (max_side, max_side))
+        if image.mode != 'RGB':
+            image = image.convert('RGB')
+        if max_side and max(image.size) >= 2 * max_side:
+            # Formatos sin draft (PNG): reducción entera antes de pasar a numpy
+            image = image.reduce(max(image.size) // max_side)
+        return image
+
+    def decode(self, full_resolution=False):
+        # Decodifica a un único buffer uint8 RGB contiguo; para JPEG usa el modo draft (escala 1/2, 1/4 u 1/8)
+        # full_resolution=True decodifica el original completo
+        image = self._decoded(None if full_resolution else self.max_side)
+        self.scale = image.size[0] / self.original_size[0]
+        return np.ascontiguousarray(np.asarray(image, dtype=np.uint8))
+
+    def display_frame(self, model_array, detections, max_side):
+        # Imagen a mostrar y cajas en sus coordenadas. Si el buffer del modelo ya cubre la pantalla se usa tal cual;
+        # si no, se vuelve a decodificar el original (bajo demanda, con draft hasta max_side) y se escalan las cajas.
+        # No cambia scale, que sigue describiendo el buffer del modelo
+        if max(model_array.shape[:2]) >= max_side:
+            return model_array, detections
+        display = np.ascontiguousarray(np.asarray(self._decoded(max_side), dtype=np.uint8))
+        ratio = display.shape[1] / model_array.shape[1]
+        if ratio <= 1.0:
+            return model_array, detections
+        scaled = detections.copy()
+        scaled[:, :4] *= ratio
+        return display, scaled
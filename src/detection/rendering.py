@@ -0,0 +1,108 @@
+import threading
+from collections import OrderedDict
+
+import cv2
+import numpy as np
+from ultralytics.utils.plotting import colors
+
+
+def resize_for_display(image_array, max_side):
+    # Reduce la imagen al tamaño en que se va a mostrar; retorna (imagen, escala aplicada a las cajas)
+    height, width = image_array.shape[:2]
+    scale = min(1.0, max_side / max(height, width))
+    if scale < 1.0:
+        image_array = cv2.resize(image_array, (round(width * scale), round(height * scale)), interpolation=cv2.INTER_AREA)
+    else:
+        image_array = image_array.copy()
+    return image_array, scale
+
+
+def draw_detections(image_array, detections, names, max_side=1024, labels=True):
+    # Dibuja las cajas con la paleta de ultralytics directamente sobre la imagen ya reducida (RGB)
+    canvas, scale = resize_for_display(image_array, max_side)
+    thickness = max(1, round(max(canvas.shape[:2]) / 500))
+    font_scale = thickness / 3
+    boxes = np.round(detections[:, :4] * scale).astype(int)
+    for (x1, y1, x2, y2), confidence, class_id in zip(boxes, detections[:, 4], detections[:, 5].astype(int)):
+        color = colors(class_id, False)
+        cv2.rectangle(canvas, (x1, y1), (x2, y2), color, thickness, cv2.LINE_AA)
+        if not labels:
+            continue
+        label = f"{names.get(class_id, class_id)} {confidence:.2f}"
+        (text_width, text_height), baseline = cv2.getTextSize(label, cv2.FONT_HERSHEY_SIMPLEX, font_scale, max(1, thickness - 1))
+        top = max(y1 - text_height - baseline, 0)
+        cv2.rectangle(canvas, (x1, top), (x1 + text_width, top + text_height + baseline), color, -1, cv2.LINE_AA)
+        # Texto negro sobre colores claros, blanco sobre oscuros
+        text_color = (0, 0, 0) if 0.299 * color[0] + 0.587 * color[1] + 0.114 * color[2] > 150 else (255, 255, 255)
+        cv2.putText(canvas, label, (x1, top + text_height), cv2.FONT_HERSHEY_SIMPLEX, font_scale,
+                    text_color, max(1, thickness - 1), cv2.LINE_AA)
+    return canvas
+
+
+def encode_image(image_array, image_format="JPEG", quality=85):
+    # Codifica una sola vez a JPEG o WebP; st.image recibe los bytes sin volver a codificar
+    extension, flag = {"JPEG": (".jpg", cv2.IMWRITE_JPEG_QUALITY), "WEBP": (".webp", cv2.IMWRITE_WEBP_QUALITY)}[image_format.upper()]
+    ok, buffer = cv2.imencode(extension, cv2.cvtColor(image_array, cv2.COLOR_RGB2BGR), [flag, int(quality)])
+    if not ok:
+        raise ValueError(f"No se pudo codificar la imagen como {image_format}")
+    return buffer.tobytes()
+
+
+class RenderCache:
+    # Bytes ya codificados por resultado de detección, con límite de memoria total (LRU)
+    def __init__(self, max_bytes=64 * 1024 * 1024):
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict()
+        self._size = 0
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            data = self._entries.get(key)
+            if data is not None:
+                self._entries.move_to_end(key)
+            return data
+
+    def put(self, key, data):
+        with self._lock:
+            previous = self._entries.pop(key, None)
+            if previous is not None:
+                self._size -= len(previous)
+            self._entries[key] = data
+            self._size += len(data)
+            while self._size > self.max_bytes and len(self._entries) > 1:
+                _, evicted = self._entries.popitem(last=False)
+                self._size -= len(evicted)
+
+
+class AnnotatedRenderer:
+    # Etapa de salida: dibuja a resolución de pantalla, codifica una vez y reutiliza los bytes en cada rerun
+    def __init__(self, display_side=1024, thumbnail_side=256, image_format="JPEG", quality=85, max_cache_bytes=64 * 1024 * 1024):
+        self.display_side = display_side
+        self.thumbnail_side = thumbnail_side
+        self.image_format = image_format
+        self.quality = quality
+        self.cache = RenderCache(max_cache_bytes)
+
+    def render(self, image_array, detections, names, cache_key=None, max_side=None, labels=True):
+        # cache_key identifica el resultado (p. ej. hash de la foto + umbral); sin clave no se cachea
+        return self.render_lazy(lambda: (image_array, detections), names, cache_key, max_side, labels)
+
+    def render_lazy(self, load, names, cache_key=None, max_side=None, labels=True):
+        # Igual que render, con load() -> (imagen, detecciones): solo se llama si los bytes no están en caché,
+        # así la foto a resolución de pantalla se decodifica únicamente cuando hay que dibujarla
+        max_side = max_side or self.display_side
+        key = (cache_key, max_side, labels, self.image_format, self.quality) if cache_key is not None else None
+        if key is not None:
+            cached = self.cache.get(key)
+            if cached is not None:
+                return cached
+        image_array, detections = load()
+        data = encode_image(draw_detections(image_array, detections, names, max_side, labels), self.image_format, self.quality)
+        if key is not None:
+            self.cache.put(key, data)
+        return data
+
+    def thumbnail(self, image_array, detections, names, cache_key=None):
+        # Miniatura para listas: solo cajas, sin etiquetas
+        return self.render(image_array, detections, names, cache_key, self.thumbnail_side, labels=False)
@@ -0,0 +1,213 @@
+import hashlib
+import json
+import os
+import threading
+from collections import OrderedDict
+from pathlib import Path
+
+import cv2
+import numpy as np
+
+from src.data.locking import file_lock
+
+
+def exact_hash(image_array):
+    # Hash exacto del contenido decodificado (incluye la forma para distinguir escalas)
+    digest = hashlib.sha1(str(image_array.shape).encode())
+    digest.update(np.ascontiguousarray(image_array).data)
+    return digest.hexdigest()
+
+
+def perceptual_hash(image_array):
+    # dHash de 64 bits: compara brillo de píxeles vecinos en una miniatura de 9x8
+    gray = cv2.cvtColor(image_array, cv2.COLOR_RGB2GRAY)
+    small = cv2.resize(gray, (9, 8), interpolation=cv2.INTER_AREA)
+    bits = (small[:, 1:] > small[:, :-1]).flatten()
+    return int(''.join('1' if bit else '0' for bit in bits), 2)
+
+
+def hamming_distance(hash_a, hash_b):
+    return bin(hash_a ^ hash_b).count('1')
+
+
+def rescale_detections(detections, from_shape, to_shape, tolerance=0.01):
+    # Lleva las cajas (N, 6) de una imagen de forma from_shape a otra de forma to_shape (alto, ancho);
+    # retorna None si las proporciones no coinciden (recorte o rotación: las cajas no corresponden)
+    from_height, from_width = from_shape[:2]
+    to_height, to_width = to_shape[:2]
+    scale_x, scale_y = to_width / from_width, to_height / from_height
+    if abs(scale_x - scale_y) > tolerance * max(scale_x, scale_y):
+        return None
+    if (from_height, from_width) == (to_height, to_width):
+        return detections
+    rescaled = np.array(detections, dtype=np.float32, copy=True)
+    rescaled[:, [0, 2]] *= scale_x
+    rescaled[:, [1, 3]] *= scale_y
+    return rescaled
+
+
+class ResultCache:
+    # Caché de detecciones por contenido: LRU en memoria y un nivel persistente en disco
+    # El nivel en disco es compartido entre procesos (pool, lote nocturno, Streamlit): cada entrada es su propio
+    # archivo y el índice es un log de solo-agregar que cada proceso relee de forma incremental
+    def __init__(self, cache_dir, max_entries=256, max_disk_entries=5000, max_distance=5):
+        self.cache_dir = Path(cache_dir)
+        self.max_entries = max_entries
+        self.max_disk_entries = max_disk_entries
+        self.max_distance = max_distance
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._log_path = self.cache_dir / "index.log"
+        self._lock_path = self.cache_dir / "index.lock"
+        # Índice {clave: hash perceptual} de las entradas en disco, para detectar casi-duplicados
+        self._index = {}
+        # (inodo, bytes leídos, líneas leídas) del log; un inodo distinto indica que otro proceso lo compactó
+        self._log_state = (None, 0, 0)
+        self._migrate_index()
+        self._refresh_index()
+
+    def _migrate_index(self):
+        # Convierte el index.json de versiones anteriores en el log
+        legacy_path = self.cache_dir / "index.json"
+        if not legacy_path.exists():
+            return
+        with file_lock(self._lock_path):
+            try:
+                with open(legacy_path, "r", encoding="utf-8") as f:
+                    legacy = json.load(f)
+            except FileNotFoundError:
+                return
+            except json.JSONDecodeError:
+                legacy = {}
+            with open(self._log_path, "ab") as f:
+                f.write(b"".join(self._log_line(key, phash) for key, phash in legacy.items()))
+            legacy_path.unlink()
+
+    def _log_line(self, key, phash):
+        return (json.dumps([key, phash]) + "\n").encode("utf-8")
+
+    def _refresh_index(self):
+        # Incorpora las entradas que otros procesos agregaron al log desde la última lectura
+        try:
+            f = open(self._log_path, "rb")
+        except FileNotFoundError:
+            return
+        with f:
+            inode, offset, lines = self._log_state
+            stat = os.fstat(f.fileno())
+            if stat.st_ino != inode or stat.st_size < offset:
+                self._index, offset, lines = {}, 0, 0
+            f.seek(offset)
+            data = f.read()
+        # Una línea sin salto final todavía se está escribiendo: se lee en la próxima pasada
+        end = data.rfind(b"\n") + 1
+        for line in data[:end].splitlines():
+            try:
+                key, phash = json.loads(line)
+            except (ValueError, TypeError):
+                continue
+            self._index.pop(key, None)
+            self._index[key] = phash
+            lines += 1
+        self._log_state = (stat.st_ino, offset + end, lines)
+
+    def _compact_index(self):
+        # Reescribe el log con las max_disk_entries entradas más recientes y borra los archivos del resto
+        # Se llama con el bloqueo del log tomado, cuando las líneas duplican al máximo de entradas
+        stale = list(self._index)[:max(0, len(self._index) - self.max_disk_entries)]
+        for old_key in stale:
+            self._index.pop(old_key)
+            self._entry_path(old_key).unlink(missing_ok=True)
+        tmp_path = self._log_path.with_suffix(".tmp")
+        with open(tmp_path, "wb") as f:
+            f.write(b"".join(self._log_line(key, phash) for key, phash in self._index.items()))
+        try:
+            os.replace(tmp_path, self._log_path)
+        except OSError:
+            # Windows no reemplaza un archivo que otro proceso tiene abierto; se reintenta en el próximo put
+            tmp_path.unlink(missing_ok=True)
+            return
+        self._log_state = (None, 0, 0)
+        self._refresh_index()
+
+    def make_key(self, digest, model_version, confidence_threshold):
+        return f"{digest}:{model_version}:{confidence_threshold:.3f}"
+
+    def _entry_path(self, key):
+        return self.cache_dir / f"{hashlib.sha1(key.encode()).hexdigest()}.npz"
+
+    def _read_disk(self, key):
+        try:
+            with np.load(self._entry_path(key), allow_pickle=False) as data:
+                entry = json.loads(str(data['meta']))
+                entry['detecciones'] = data['detecciones']
+            return entry
+        except (FileNotFoundError, KeyError, ValueError, OSError):
+            return None
+
+    def _write_disk(self, key, entry):
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+        meta = {k: v for k, v in entry.items() if k != 'detecciones'}
+        tmp_path = self._entry_path(key).with_suffix(".tmp.npz")
+        np.savez(tmp_path, detecciones=entry['detecciones'], meta=np.array(json.dumps(meta)))
+        os.replace(tmp_path, self._entry_path(key))
+
+        # Se agrega una línea al log (sin reescribir el índice) y se integra lo que escribieron otros procesos
+        with file_lock(self._lock_path):
+            with open(self._log_path, "ab") as f:
+                f.write(self._log_line(key, entry['phash']))
+            self._refresh_index()
+            if self._log_state[2] > 2 * self.max_disk_entries:
+                self._compact_index()
+
+    def _remember(self, key, entry):
+        self._entries[key] = entry
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def get(self, digest, model_version, confidence_threshold):
+        # Busca por hash exacto, primero en memoria y luego en disco
+        key = self.make_key(digest, model_version, confidence_threshold)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+                return entry
+            if key not in self._index:
+                self._refresh_index()
+            if key not in self._index:
+                return None
+            entry = self._read_disk(key)
+            if entry is not None:
+                self._remember(key, entry)
+            return entry
+
+    def find_near_duplicate(self, phash, model_version, confidence_threshold, shape):
+        # Busca una foto casi idéntica (distancia de Hamming pequeña) con el mismo modelo y umbral
+        # shape: forma de la imagen consultada; las cajas se reescalan a ella (una copia recodificada puede
+        # decodificarse a otro tamaño) y se descartan las entradas sin forma o con otras proporciones
+        suffix = f":{model_version}:{confidence_threshold:.3f}"
+        with self._lock:
+            self._refresh_index()
+            candidates = [
+                (hamming_distance(phash, stored), key) for key, stored in self._index.items()
+                if key.endswith(suffix)
+            ]
+        for _, key in sorted(c for c in candidates if c[0] <= self.max_distance):
+            with self._lock:
+                entry = self._entries.get(key) or self._read_disk(key)
+            if entry is None or 'forma' not in entry:
+                continue
+            detections = rescale_detections(entry['detecciones'], entry['forma'], shape)
+            if detections is not None:
+                return dict(entry, detecciones=detections, forma=list(shape[:2]))
+        return None
+
+    def put(self, digest, phash, model_version, confidence_threshold, detections, **meta):
+        # Guarda las detecciones de una foto junto con metadatos serializables (archivo, peso, etc.)
+        key = self.make_key(digest, model_version, confidence_threshold)
+        entry = dict(meta, phash=phash, detecciones=detections)
+        with self._lock:
+            self._remember(key, entry)
+            self._write_disk(key, entry)
@@ -0,0 +1,57 @@
+import math
+
+import numpy as np
+
+
+def tiles_for_budget(latency_budget_ms, tile_latency_ms, max_tiles=64):
+    # Número de tiles que caben en el presupuesto de latencia según la latencia medida por tile
+    if tile_latency_ms <= 0:
+        return max_tiles
+    return int(max(1, min(max_tiles, latency_budget_ms // tile_latency_ms)))
+
+
+def plan_tiles(height, width, tile_size=640, overlap=0.2, max_tiles=16):
+    # Grilla de tiles solapados (y0, x0, y1, x1); si excede max_tiles se agrandan los tiles
+    tile = max(32, int(tile_size))
+    while True:
+        step = max(1, int(tile * (1 - overlap)))
+        rows = 1 if height <= tile else math.ceil((height - tile) / step) + 1
+        cols = 1 if width <= tile else math.ceil((width - tile) / step) + 1
+        if rows * cols <= max(1, max_tiles):
+            break
+        tile = int(tile * 1.25)
+
+    tiles = []
+    for row in range(rows):
+        y0 = min(row * step, max(0, height - tile))
+        for col in range(cols):
+            x0 = min(col * step, max(0, width - tile))
+            tiles.append((y0, x0, min(y0 + tile, height), min(x0 + tile, width)))
+    return tiles
+
+
+def merge_detections(detections, overlap_threshold=0.6):
+    # NMS entre tiles por clase; usa intersección sobre el área menor para que una caja
+    # cortada por el borde de un tile se fusione con la caja completa del tile vecino
+    if len(detections) == 0:
+        return np.zeros((0, 6), dtype=np.float32)
+
+    boxes = detections[:, :4]
+    areas = np.maximum(boxes[:, 2] - boxes[:, 0], 0) * np.maximum(boxes[:, 3] - boxes[:, 1], 0)
+    order = np.argsort(-detections[:, 4])
+    keep = []
+
+    while order.size:
+        best = order[0]
+        keep.append(best)
+        rest = order[1:]
+        x1 = np.maximum(boxes[best, 0], boxes[rest, 0])
+        y1 = np.maximum(boxes[best, 1], boxes[rest, 1])
+        x2 = np.minimum(boxes[best, 2], boxes[rest, 2])
+        y2 = np.minimum(boxes[best, 3], boxes[rest, 3])
+        intersection = np.maximum(x2 - x1, 0) * np.maximum(y2 - y1, 0)
+        smaller = np.maximum(np.minimum(areas[best], areas[rest]), 1e-6)
+        same_class = detections[rest, 5] == detections[best, 5]
+        order = rest[~(same_class & (intersection / smaller > overlap_threshold))]
+
+    return detections[np.array(keep)].astype(np.float32)
@@ -0,0 +1,95 @@
+from collections import Counter
+
+import numpy as np
+
+
+def iou_matrix(boxes_a, boxes_b):
+    # IoU entre todas las cajas de A (N, 4) y de B (M, 4)
+    x1 = np.maximum(boxes_a[:, None, 0], boxes_b[None, :, 0])
+    y1 = np.maximum(boxes_a[:, None, 1], boxes_b[None, :, 1])
+    x2 = np.minimum(boxes_a[:, None, 2], boxes_b[None, :, 2])
+    y2 = np.minimum(boxes_a[:, None, 3], boxes_b[None, :, 3])
+    intersection = np.maximum(x2 - x1, 0) * np.maximum(y2 - y1, 0)
+    area_a = (boxes_a[:, 2] - boxes_a[:, 0]) * (boxes_a[:, 3] - boxes_a[:, 1])
+    area_b = (boxes_b[:, 2] - boxes_b[:, 0]) * (boxes_b[:, 3] - boxes_b[:, 1])
+    return intersection / np.maximum(area_a[:, None] + area_b[None, :] - intersection, 1e-6)
+
+
+class IoUTracker:
+    # Seguimiento liviano por IoU: la misma botella en varios cuadros cuenta como un solo ítem
+    def __init__(self, iou_threshold=0.3, max_missed=3, min_hits=2):
+        self.iou_threshold = iou_threshold
+        self.max_missed = max_missed
+        self.min_hits = min_hits
+        self._next_id = 1
+        self._active = {}
+        self._finished = []
+
+    def _new_track(self, detection, frame_index):
+        self._active[self._next_id] = {
+            'id': self._next_id,
+            'box': detection[:4].copy(),
+            'votes': Counter({int(detection[5]): float(detection[4])}),
+            'max_conf': float(detection[4]),
+            'hits': 1,
+            'missed': 0,
+            'first_frame': frame_index,
+            'last_frame': frame_index
+        }
+        self._next_id += 1
+
+    def update(self, detections, frame_index):
+        # Asocia las detecciones (N, 6) del cuadro con los tracks activos, de mayor a menor IoU
+        track_ids = list(self._active)
+        matched_tracks, matched_detections = set(), set()
+
+        if track_ids and len(detections):
+            track_boxes = np.array([self._active[t]['box'] for t in track_ids], dtype=np.float32)
+            ious = iou_matrix(track_boxes, detections[:, :4])
+            for flat in np.argsort(-ious, axis=None):
+                t_index, d_index = np.unravel_index(flat, ious.shape)
+                if ious[t_index, d_index] < self.iou_threshold:
+                    break
+                if t_index in matched_tracks or d_index in matched_detections:
+                    continue
+                track = self._active[track_ids[t_index]]
+                detection = detections[d_index]
+                track['box'] = detection[:4].copy()
+                track['votes'][int(detection[5])] += float(detection[4])
+                track['max_conf'] = max(track['max_conf'], float(detection[4]))
+                track['hits'] += 1
+                track['missed'] = 0
+                track['last_frame'] = frame_index
+                matched_tracks.add(t_index)
+                matched_detections.add(d_index)
+
+        for t_index, track_id in enumerate(track_ids):
+            if t_index in matched_tracks:
+                continue
+            track = self._active[track_id]
+            track['missed'] += 1
+            if track['missed'] > self.max_missed:
+                self._finished.append(self._active.pop(track_id))
+
+        for d_index in range(len(detections)):
+            if d_index not in matched_detections:
+                self._new_track(detections[d_index], frame_index)
+
+    def finalize(self):
+        # Cierra los tracks activos y retorna los confirmados: (id, clase por voto ponderado, confianza máxima, última caja, ...)
+        self._finished.extend(self._active.values())
+        self._active = {}
+        confirmed = []
+        for track in self._finished:
+            if track['hits'] < self.min_hits:
+                continue
+            confirmed.append({
+                'id': track['id'],
+                'class_id': track['votes'].most_common(1)[0][0],
+                'confidence': track['max_conf'],
+                'box': track['box'],
+                'hits': track['hits'],
+                'first_frame': track['first_frame'],
+                'last_frame': track['last_frame']
+            })
+        return confirmed
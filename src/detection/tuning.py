@@ -0,0 +1,121 @@
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+# Núcleos por inferencia a partir de los cuales conviene admitir otra en paralelo en lugar de seguir
+# repartiendo los hilos de una sola (la convolución escala mal más allá de unos pocos hilos por llamada)
+HILOS_POR_INFERENCIA = 4
+MAX_INFERENCIAS_AUTO = 4
+
+
+class InferenceTuner:
+    # Reparte los núcleos entre las inferencias en curso del proceso: con una sola llamada usa todos los hilos
+    # y con varias admite hasta max_concurrent a la vez, cada una con total_threads / llamadas en vuelo.
+    # Si hay un SLO de latencia, baja el tamaño de entrada (imgsz) cuando la cola no permitiría cumplirlo
+    def __init__(self, total_threads=0, latency_slo_ms=0.0, sizes=(640, 512, 416, 320), enabled=True, max_concurrent=0):
+        # total_threads: núcleos disponibles para inferir (0 = todos los del equipo)
+        # latency_slo_ms: latencia objetivo por llamada, incluida la espera en cola (0 = imgsz fijo, el más grande de sizes)
+        # max_concurrent: inferencias simultáneas (0 = una cada HILOS_POR_INFERENCIA núcleos, hasta MAX_INFERENCIAS_AUTO);
+        # el resto espera turno en lugar de seguir partiendo los núcleos
+        self.total_threads = total_threads or os.cpu_count() or 1
+        self.latency_slo_ms = latency_slo_ms
+        self.sizes = sorted(sizes, reverse=True)
+        self.enabled = enabled
+        self.max_concurrent = max_concurrent or max(1, min(MAX_INFERENCIAS_AUTO, self.total_threads // HILOS_POR_INFERENCIA))
+        self._running = 0
+        self._waiting = 0
+        self._condition = threading.Condition()
+        # Costo en ms por imagen al tamaño de referencia con todos los hilos (promedio móvil), para estimar la latencia
+        self._cost = None
+        self._interop_set = False
+
+    @property
+    def full_size(self):
+        return self.sizes[0]
+
+    @property
+    def in_flight(self):
+        # Llamadas en curso o esperando turno
+        with self._condition:
+            return self._waiting + self._running
+
+    def threads_for(self, in_flight):
+        # Hilos intra-op de una llamada con in_flight llamadas en vuelo (ella incluida)
+        return max(1, self.total_threads // max(1, min(in_flight, self.max_concurrent)))
+
+    def estimate_ms(self, images, imgsz, queued=0):
+        # Latencia estimada: el costo escala con el área de entrada; las llamadas en vuelo se reparten los núcleos,
+        # así que cada una delante suma su parte del trabajo con todos los hilos
+        if self._cost is None:
+            return None
+        return self._cost * images * (imgsz / self.full_size) ** 2 * (queued + 1)
+
+    def choose_size(self, images, queued=0):
+        # El imgsz más grande cuya latencia estimada (espera incluida) cumple el SLO, o el más chico si ninguno lo cumple
+        if self.latency_slo_ms <= 0 or self._cost is None:
+            return self.full_size
+        for size in self.sizes:
+            if self.estimate_ms(images, size, queued) <= self.latency_slo_ms:
+                return size
+        return self.sizes[-1]
+
+    def _apply_threads(self, threads):
+        # Hilos intra-op de esta llamada. torch.set_num_threads vale para todo el proceso, pero las llamadas
+        # simultáneas piden el mismo valor (total_threads / llamadas en vuelo), así que entre todas ocupan los núcleos
+        # sin sobresuscribirlos. Las inferencias simultáneas reemplazan al paralelismo inter-op, que queda en 1 hilo
+        # (solo se puede fijar antes del primer uso)
+        import torch
+        if not self._interop_set:
+            self._interop_set = True
+            try:
+                torch.set_num_interop_threads(1)
+            except RuntimeError:
+                pass
+        torch.set_num_threads(threads)
+
+    @contextmanager
+    def slot(self, images=1, apply_threads=True):
+        # Reserva un turno de inferencia y retorna los ajustes elegidos para esta llamada
+        # Los hilos se fijan al empezar, según las llamadas en vuelo; una llamada ya en curso conserva los suyos
+        # apply_threads: False para backends cuyos hilos se fijan al crear la sesión (ONNX, OpenVINO)
+        if not self.enabled:
+            start = time.perf_counter()
+            settings = {'hilos': None, 'imgsz': self.full_size, 'en_cola': None}
+            yield settings
+            settings['latencia_ms'] = (time.perf_counter() - start) * 1000
+            return
+
+        start = time.perf_counter()
+        with self._condition:
+            # El tamaño se elige al llegar, con las llamadas que ya están delante
+            queued = self._waiting + self._running
+            imgsz = self.choose_size(images, queued)
+            self._waiting += 1
+            try:
+                while self._running >= self.max_concurrent:
+                    self._condition.wait()
+            finally:
+                self._waiting -= 1
+            self._running += 1
+            threads = self.threads_for(self._running + self._waiting)
+        try:
+            if apply_threads:
+                self._apply_threads(threads)
+            settings = {'hilos': threads, 'imgsz': imgsz, 'en_cola': queued}
+            run_start = time.perf_counter()
+            yield settings
+            now = time.perf_counter()
+            settings['latencia_ms'] = (now - start) * 1000
+            self._record((now - run_start) * 1000, images, imgsz, threads)
+        finally:
+            with self._condition:
+                self._running -= 1
+                self._condition.notify()
+
+    def _record(self, elapsed_ms, images, imgsz, threads):
+        # Normaliza la duración de la inferencia (sin la espera) al tamaño de referencia y a todos los hilos
+        # (escala lineal con los núcleos) y la incorpora al promedio móvil
+        cost = elapsed_ms / max(images, 1) / (imgsz / self.full_size) ** 2 * threads / self.total_threads
+        with self._condition:
+            self._cost = cost if self._cost is None else 0.8 * self._cost + 0.2 * cost
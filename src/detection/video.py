@@ -0,0 +1,64 @@
+import cv2
+import numpy as np
+
+
+class FrameSampler:
+    # Decide qué cuadros se procesan: uno cada N, o solo cuando cambia la escena
+    def __init__(self, every_n=10, scene_threshold=0.0, max_gap=None):
+        # scene_threshold > 0 activa el muestreo por cambio de escena (diferencia media de grises, 0-255)
+        self.every_n = max(1, every_n)
+        self.scene_threshold = scene_threshold
+        self.max_gap = max_gap or self.every_n * 10
+        self._last_thumbnail = None
+        self._last_index = None
+
+    def needs_pixels(self, index):
+        # Con muestreo fijo los cuadros descartados ni siquiera se convierten (solo grab)
+        return self.scene_threshold > 0 or index % self.every_n == 0
+
+    def accept(self, index, frame):
+        if self.scene_threshold <= 0:
+            return index % self.every_n == 0
+        # En modo escena solo se compara un cuadro de cada every_n, contra el último aceptado
+        if index % self.every_n != 0:
+            return False
+        thumbnail = cv2.resize(cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY), (32, 32), interpolation=cv2.INTER_AREA)
+        changed = (
+            self._last_thumbnail is None
+            or index - self._last_index >= self.max_gap
+            or np.abs(thumbnail.astype(np.int16) - self._last_thumbnail).mean() > self.scene_threshold
+        )
+        if changed:
+            self._last_thumbnail = thumbnail.astype(np.int16)
+            self._last_index = index
+        return changed
+
+
+def video_info(path):
+    # Cuadros por segundo, cantidad de cuadros y duración del video
+    capture = cv2.VideoCapture(str(path))
+    fps = capture.get(cv2.CAP_PROP_FPS) or 30.0
+    frames = int(capture.get(cv2.CAP_PROP_FRAME_COUNT))
+    capture.release()
+    return {'fps': fps, 'frames': frames, 'duracion_s': frames / fps if fps else 0.0}
+
+
+def iter_sampled_frames(path, sampler, max_side=640):
+    # Recorre el video en streaming y genera (índice, arreglo RGB reducido) de los cuadros muestreados
+    capture = cv2.VideoCapture(str(path))
+    if not capture.isOpened():
+        raise ValueError(f"No se pudo abrir el video: {path}")
+    index = 0
+    try:
+        while capture.grab():
+            if sampler.needs_pixels(index):
+                ok, frame = capture.retrieve()
+                if ok and sampler.accept(index, frame):
+                    height, width = frame.shape[:2]
+                    scale = max_side / max(height, width)
+                    if scale < 1:
+                        frame = cv2.resize(frame, (int(width * scale), int(height * scale)), interpolation=cv2.INTER_AREA)
+                    yield index, np.ascontiguousarray(cv2.cvtColor(frame, cv2.COLOR_BGR2RGB))
+            index += 1
+    finally:
+        capture.release()
@@ -0,0 +1,74 @@
+import json
+from pathlib import Path
+
+import numpy as np
+
+
+class WeightEstimator:
+    # Estimación local y determinista del peso de cada caja: masa típica de la clase escalada por el área de la caja
+    def __init__(self, category_data, calibration_path=None, default_mass_kg=0.1, exponent=1.5, scale_limits=(0.25, 4.0)):
+        # category_data: contenido de categories.json; cada clase puede traer typical_mass_kg y typical_area_ratio
+        # exponent: el área crece al cuadrado del tamaño y la masa al cubo, por eso masa ~ área^1.5
+        info = category_data.get("info", {})
+        self.typical_mass = {name: float(data.get("typical_mass_kg", default_mass_kg)) for name, data in info.items()}
+        self.typical_area = {name: float(data.get("typical_area_ratio", 0.05)) for name, data in info.items()}
+        self.default_mass_kg = default_mass_kg
+        self.exponent = exponent
+        self.scale_limits = scale_limits
+        self.calibration = self.load_calibration(calibration_path)
+        self._lookups = {}
+
+    def load_calibration(self, calibration_path):
+        # Factores por clase ajustados con datos históricos (scripts/fit_weight_calibration.py)
+        if not calibration_path:
+            return {}
+        try:
+            with open(calibration_path, "r", encoding="utf-8") as f:
+                return {name: float(factor) for name, factor in json.load(f).get("factores", {}).items()}
+        except (FileNotFoundError, json.JSONDecodeError):
+            return {}
+
+    def _lookup(self, names):
+        # Arreglos (masa calibrada, área de referencia) indexados por id de clase, cacheados por mapa de nombres
+        key = tuple(sorted(names.items()))
+        if key not in self._lookups:
+            size = max(names) + 1 if names else 1
+            mass = np.full(size, self.default_mass_kg, dtype=np.float32)
+            area = np.full(size, 0.05, dtype=np.float32)
+            for class_id, name in names.items():
+                mass[class_id] = self.typical_mass.get(name, self.default_mass_kg) * self.calibration.get(name, 1.0)
+                area[class_id] = self.typical_area.get(name, 0.05)
+            self._lookups[key] = (mass, area)
+        return self._lookups[key]
+
+    def estimate(self, detections, names, image_shape=None):
+        # Peso en kg de cada detección (N, 6); sin image_shape se usa la masa típica sin escalar
+        if len(detections) == 0:
+            return np.zeros(0, dtype=np.float32)
+        mass, reference_area = self._lookup(names)
+        class_ids = np.clip(detections[:, 5].astype(np.int64), 0, len(mass) - 1)
+        weights = mass[class_ids]
+        if image_shape is not None:
+            height, width = image_shape[:2]
+            box_area = (detections[:, 2] - detections[:, 0]) * (detections[:, 3] - detections[:, 1])
+            ratio = np.maximum(box_area, 0) / float(height * width)
+            scale = np.clip((ratio / reference_area[class_ids]) ** self.exponent, *self.scale_limits)
+            weights = weights * scale
+        return weights.astype(np.float32)
+
+    def fit_calibration(self, count_matrix, observed_totals, class_names, limits=(0.1, 10.0)):
+        # Ajusta un factor por clase por mínimos cuadrados: peso observado de la foto ~ sum(conteo * masa típica * factor)
+        # count_matrix: (fotos, clases) con el conteo de cada clase por foto
+        base = np.array([self.typical_mass.get(name, self.default_mass_kg) for name in class_names], dtype=np.float64)
+        design = np.asarray(count_matrix, dtype=np.float64) * base
+        factors, *_ = np.linalg.lstsq(design, np.asarray(observed_totals, dtype=np.float64), rcond=None)
+        # Las clases sin datos quedan con factor 1
+        supported = design.sum(axis=0) > 0
+        factors = np.where(supported, np.clip(factors, *limits), 1.0)
+        return {name: float(factor) for name, factor in zip(class_names, factors)}
+
+
+def save_calibration(calibration_path, factors, photos):
+    Path(calibration_path).parent.mkdir(parents=True, exist_ok=True)
+    with open(calibration_path, "w", encoding="utf-8") as f:
+        json.dump({"factores": factors, "fotos": photos}, f, ensure_ascii=False, indent=2)
@@ -0,0 +1,262 @@
+import itertools
+import multiprocessing as mp
+import os
+import queue
+import threading
+import time
+from concurrent.futures import Future
+
+import numpy as np
+
+
+class PoolSaturatedError(RuntimeError):
+    # La cola de trabajos está llena: el llamador debe reintentar más tarde
+    pass
+
+
+class WorkerCrashedError(RuntimeError):
+    # El proceso que atendía el trabajo terminó inesperadamente
+    pass
+
+
+def _worker_main(index, model_path, num_threads, tasks, results):
+    # Proceso trabajador: carga el modelo una sola vez y atiende trabajos hasta recibir None
+    import torch
+    from src.detection.model_registry import registro_modelos
+
+    torch.set_num_threads(num_threads)
+    try:
+        model = registro_modelos.get(model_path)
+    except Exception as e:
+        results.put((index, 'load_error', None, repr(e)))
+        return
+    results.put((index, 'ready', dict(model.names), None))
+
+    while True:
+        job = tasks.get()
+        if job is None:
+            break
+        job_id, arrays, confidence_threshold = job
+        try:
+            # El registro recarga los pesos en segundo plano si el archivo cambió
+            with registro_modelos.use(model_path) as model:
+                predictions = model(arrays, conf=confidence_threshold, verbose=False)
+            output = [
+                (r.boxes.data[:, :6].cpu().numpy().astype(np.float32), dict(r.speed))
+                for r in predictions
+            ]
+            results.put((index, job_id, output, None))
+        except Exception as e:
+            results.put((index, job_id, None, repr(e)))
+
+
+# Espera antes de reiniciar un trabajador caído: se duplica con cada caída seguida, hasta el máximo
+ESPERA_REINICIO_S = 0.5
+ESPERA_REINICIO_MAX_S = 30.0
+
+
+class InferenceWorkerPool:
+    # Pool de N procesos que cargan el modelo una vez y reciben trabajos desde una cola acotada
+    # max_restarts: caídas seguidas de un trabajador antes de darlo por perdido
+    def __init__(self, model_path, num_workers, max_pending=32, job_timeout=60.0, max_restarts=5):
+        self.model_path = str(model_path)
+        self.num_workers = max(1, num_workers)
+        self.job_timeout = job_timeout
+        self.max_restarts = max_restarts
+        self.names = None
+        self.load_error = None
+
+        self._ctx = mp.get_context('spawn')
+        self._results = self._ctx.Queue()
+        self._pending = queue.Queue(maxsize=max_pending)
+        self._job_ids = itertools.count()
+        self._condition = threading.Condition()
+        self._running = True
+        self._threads_per_worker = max(1, (os.cpu_count() or 1) // self.num_workers)
+
+        self._workers = [None] * self.num_workers
+        for index in range(self.num_workers):
+            self._start_worker(index)
+
+        self._dispatcher = threading.Thread(target=self._dispatch_loop, daemon=True)
+        self._collector = threading.Thread(target=self._collect_loop, daemon=True)
+        self._dispatcher.start()
+        self._collector.start()
+
+    def _start_worker(self, index, crashes=0):
+        tasks = self._ctx.Queue()
+        process = self._ctx.Process(
+            target=_worker_main,
+            args=(index, self.model_path, self._threads_per_worker, tasks, self._results),
+            daemon=True
+        )
+        process.start()
+        self._workers[index] = {
+            'process': process, 'tasks': tasks, 'ready': False, 'job': None,
+            'crashes': crashes, 'restart_at': None, 'lost': False
+        }
+
+    def _restart_worker(self, index, error, crashed=False):
+        # Falla el trabajo en curso del trabajador y lo reemplaza por un proceso nuevo
+        # Las caídas seguidas esperan cada vez más antes del reinicio; pasado max_restarts el trabajador se pierde
+        worker = self._workers[index]
+        if worker['job'] is not None:
+            _, future, _ = worker['job']
+            if not future.done():
+                future.set_exception(error)
+            worker['job'] = None
+        if worker['process'].is_alive():
+            worker['process'].terminate()
+        worker['process'].join(timeout=5)
+        worker['ready'] = False
+        if not crashed:
+            self._start_worker(index, worker['crashes'])
+            return
+        worker['crashes'] += 1
+        if worker['crashes'] > self.max_restarts:
+            worker['lost'] = True
+            return
+        delay = min(ESPERA_REINICIO_S * 2 ** (worker['crashes'] - 1), ESPERA_REINICIO_MAX_S)
+        worker['restart_at'] = time.monotonic() + delay
+
+    def unavailable(self):
+        # Motivo por el que el pool no puede atender trabajos (modelo que no carga o trabajadores perdidos), o None
+        if self.load_error:
+            return f"Error al cargar el modelo YOLO en los trabajadores: {self.load_error}"
+        if all(worker['lost'] for worker in self._workers):
+            return (
+                f"Los trabajadores de inferencia terminaron inesperadamente más de {self.max_restarts} veces seguidas; "
+                "revisa el modelo y la memoria disponible."
+            )
+        return None
+
+    def submit(self, arrays, confidence_threshold, block=True, timeout=None):
+        # Encola un trabajo; si la cola está llena espera o lanza PoolSaturatedError (contrapresión)
+        if not self._running:
+            raise RuntimeError("El pool de inferencia está detenido.")
+        error = self.unavailable()
+        if error:
+            raise RuntimeError(error)
+        future = Future()
+        try:
+            self._pending.put((next(self._job_ids), list(arrays), confidence_threshold, future), block=block, timeout=timeout)
+        except queue.Full:
+            raise PoolSaturatedError("El servidor de análisis está saturado. Intenta nuevamente en unos segundos.")
+        return future
+
+    def predict(self, arrays, confidence_threshold, timeout=None):
+        # Versión bloqueante de submit: retorna [(detecciones, tiempos_ms), ...] por imagen
+        future = self.submit(arrays, confidence_threshold, timeout=timeout)
+        return future.result()
+
+    def wait_until_ready(self, timeout=None):
+        # Espera a que al menos un trabajador tenga el modelo cargado
+        with self._condition:
+            self._condition.wait_for(lambda: self.names is not None or self.unavailable() is not None, timeout=timeout)
+        return self.names is not None
+
+    def _idle_worker(self):
+        for index, worker in enumerate(self._workers):
+            if worker['ready'] and worker['job'] is None:
+                return index
+        return None
+
+    def _dispatch_loop(self):
+        while self._running:
+            try:
+                job_id, arrays, confidence_threshold, future = self._pending.get(timeout=0.1)
+            except queue.Empty:
+                continue
+            if not future.set_running_or_notify_cancel():
+                continue
+            with self._condition:
+                self._condition.wait_for(
+                    lambda: not self._running or self._idle_worker() is not None or self.unavailable() is not None
+                )
+                if not self._running:
+                    future.set_exception(RuntimeError("El pool de inferencia está detenido."))
+                    continue
+                error = self.unavailable()
+                if error:
+                    future.set_exception(RuntimeError(error))
+                    continue
+                index = self._idle_worker()
+                worker = self._workers[index]
+                worker['job'] = (job_id, future, time.monotonic())
+                worker['tasks'].put((job_id, arrays, confidence_threshold))
+
+    def _collect_loop(self):
+        while self._running:
+            try:
+                index, job_id, output, error = self._results.get(timeout=0.1)
+            except queue.Empty:
+                self._check_workers()
+                continue
+            except (EOFError, OSError):
+                break
+
+            with self._condition:
+                worker = self._workers[index]
+                if job_id == 'ready':
+                    worker['ready'] = True
+                    self.names = output
+                elif job_id == 'load_error':
+                    self.load_error = error
+                elif worker['job'] is not None and worker['job'][0] == job_id:
+                    _, future, _ = worker['job']
+                    worker['job'] = None
+                    if error:
+                        future.set_exception(RuntimeError(error))
+                    else:
+                        worker['crashes'] = 0
+                        future.set_result(output)
+                self._condition.notify_all()
+            self._check_workers()
+
+    def _check_workers(self):
+        # Reinicia trabajadores caídos o que superaron el tiempo límite del trabajo
+        with self._condition:
+            if not self._running or self.load_error:
+                return
+            for index, worker in enumerate(self._workers):
+                if worker['lost']:
+                    continue
+                if worker['restart_at'] is not None:
+                    if time.monotonic() >= worker['restart_at']:
+                        self._start_worker(index, worker['crashes'])
+                elif not worker['process'].is_alive():
+                    self._restart_worker(index, WorkerCrashedError("El trabajador de inferencia terminó inesperadamente."), crashed=True)
+                elif worker['job'] is not None and time.monotonic() - worker['job'][2] > self.job_timeout:
+                    self._restart_worker(index, TimeoutError(f"La inferencia superó el límite de {self.job_timeout:g} s."))
+            self._condition.notify_all()
+
+    def shutdown(self):
+        # Detiene los trabajadores y falla los trabajos que no llegaron a ejecutarse
+        with self._condition:
+            self._running = False
+            self._condition.notify_all()
+        while True:
+            try:
+                _, _, _, future = self._pending.get_nowait()
+            except queue.Empty:
+                break
+            if not future.done():
+                future.set_exception(RuntimeError("El pool de inferencia está detenido."))
+        for worker in self._workers:
+            worker['tasks'].put(None)
+        for worker in self._workers:
+            worker['process'].join(timeout=5)
+            if worker['process'].is_alive():
+                worker['process'].terminate()
+
+
+_pools = {}
+_pool_lock = threading.Lock()
+
+def get_worker_pool(model_path, num_workers, max_pending=32, job_timeout=60.0, backend=None, max_restarts=5):
+    # Retorna el pool compartido por todas las sesiones del proceso para (modelo, backend), creándolo la primera vez
+    key = (str(model_path), backend)
+    with _pool_lock:
+        if key not in _pools:
+            _pools[key] = InferenceWorkerPool(model_path, num_workers, max_pending, job_timeout, max_restarts)
+        return _pools[key]
@@ -2,7 +2,7 @@ import streamlit as st
 import pandas as pd
 import altair as alt
 import datetime
-from src.config.settings import categorias, CSV_REGISTROS
+from src.config.settings import categorias, CSV_REGISTROS, MAX_PUNTOS_MAPA
 from src.data.manager import DataManager
 import folium
 from streamlit_folium import st_folium
@@ -10,6 +10,7 @@ from streamlit_folium import st_folium
 data_manager = DataManager(CSV_REGISTROS)
 
 def mostrar_mapa_residuos(df_filtrado, mostrar_peso=True):
+    # df_filtrado: columnas lat, lon, sector, class, peso_total_foto_kg y timestamp (DataManager.map_points)
     if df_filtrado.empty:
         st.info("No hay datos para mostrar en el mapa")
         return
@@ -21,7 +22,7 @@ def mostrar_mapa_residuos(df_filtrado, mostrar_peso=True):
     puntos_agregados = 0
     for _, row in df_filtrado.iterrows():
         try:
-            lat, lon = map(float, [s.strip() for s in row['coordenadas'].split(',')])
+            lat, lon = float(row['lat']), float(row['lon'])
             peso_text = f"<b>Peso:</b> {row.get('peso_total_foto_kg', 'N/A')} kg<br>" if mostrar_peso else ""
             popup_text = f"""
             <b>Sector:</b> {row['sector']}<br>
@@ -64,27 +65,26 @@ def mostrar_dashboard():
     </div>
     """, unsafe_allow_html=True)
 
-    df = pd.read_csv(CSV_REGISTROS)
-
-    if not df.empty:
-        df['timestamp'] = pd.to_datetime(df['timestamp'])
-        df['date'] = df['timestamp'].dt.date
-
-        df_filtrado = df.copy()
+    # Solo agregados: conteos y pesos por clase (en SQL con SQLite, solo las columnas necesarias con Parquet),
+    # sin cargar el historial completo
+    conteos = data_manager.class_counts()
 
+    if not conteos.empty:
         # Métricas principales mejoradas
-        if not df_filtrado.empty:
+        if conteos.sum() > 0:
             # Cálculos de métricas
-            total_general = df_filtrado["class"].value_counts().sum()
+            resumen = data_manager.summary()
+            pesos_por_clase = data_manager.weight_by_class()
+            total_general = int(conteos.sum())
             reciclables = ['PLASTIC', 'METAL', 'PAPER', 'GLASS', 'CARDBOARD']
-            total_reciclable = df_filtrado[df_filtrado["class"].isin(reciclables)]["class"].value_counts().sum()
+            total_reciclable = int(conteos[conteos.index.isin(reciclables)].sum())
             porcentaje_reciclable = (total_reciclable / total_general) * 100 if total_general > 0 else 0
-            avg_confidence = df_filtrado['confidence'].mean() * 100
-            total_peso = df_filtrado['peso_total_foto_kg'].sum() if 'peso_total_foto_kg' in df_filtrado.columns else 0
-            impacto_co2 = data_manager.calculate_environmental_impact(df_filtrado)
+            avg_confidence = resumen['confianza_media'] * 100
+            total_peso = resumen['peso_total']
+            impacto_co2 = data_manager.environmental_impact(pesos_por_clase)
 
             # Alertas inteligentes
-            porc_residuales = df_filtrado[~df_filtrado["class"].isin(reciclables)]["class"].value_counts().sum() / total_general * 100 if total_general > 0 else 0
+            porc_residuales = (total_general - total_reciclable) / total_general * 100 if total_general > 0 else 0
 
             if porc_residuales > 40:
                 st.error(f"ALERTA: Residuales ({porc_residuales:.1f}%) exceden el 40%. Riesgo Sanitario alto.")
@@ -131,7 +131,7 @@ def mostrar_dashboard():
 
             with col_graf1:
                 # Gráfico de distribución por tipo
-                chart_data = df_filtrado["class"].value_counts().reset_index()
+                chart_data = conteos.reset_index()
                 chart_data.columns = ['Tipo', 'Cantidad']
 
                 chart = alt.Chart(chart_data).mark_bar().encode(
@@ -183,12 +183,16 @@ def mostrar_dashboard():
             with col_map_filt2:
                 mostrar_peso = st.checkbox("Mostrar peso en popups", value=True, key="mostrar_peso")
 
-            # Aplicar filtro de vista
-            df_mapa = df_filtrado.copy()
+            # Aplicar filtro de vista (lo resuelve la consulta; solo se traen los puntos más recientes)
+            filtro_clases = {}
             if vista_mapa == "Solo reciclables":
-                df_mapa = df_mapa[df_mapa["class"].isin(reciclables)]
+                filtro_clases = {'classes': reciclables}
             elif vista_mapa == "Solo no reciclables":
-                df_mapa = df_mapa[~df_mapa["class"].isin(reciclables)]
+                filtro_clases = {'classes': reciclables, 'exclude_classes': True}
+            df_mapa = data_manager.map_points(MAX_PUNTOS_MAPA, **filtro_clases)
+            total_puntos = data_manager.map_point_count(**filtro_clases)
+            if total_puntos > len(df_mapa):
+                st.caption(f"Se muestran los {len(df_mapa):,} registros más recientes de {total_puntos:,} con coordenadas (MAX_PUNTOS_MAPA).")
 
             mostrar_mapa_residuos(df_mapa, mostrar_peso)
 
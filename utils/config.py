@@ -5,6 +5,8 @@ import json
 import streamlit as st
 from ultralytics import YOLO
 from google import genai
+from google.genai import types
+from src.detection.gemini_client import ResilientGeminiClient
 
 # Cargar variables de entorno
 load_dotenv()
@@ -15,12 +17,45 @@ RUTA_MODELO = DIRECTORIO_BASE / "models" / "best.pt"
 JSON_CATEGORIAS = DIRECTORIO_BASE / "data" / "categories.json"
 CSV_REGISTROS = DIRECTORIO_BASE / "data" / "records_scm.csv"
 
+# Estimación local de peso: masa típica por clase (categories.json) escalada por el área de la caja
+RUTA_CALIBRACION_PESO = DIRECTORIO_BASE / "data" / "weight_calibration.json"
+PESO_POR_DEFECTO_KG = float(os.environ.get("PESO_POR_DEFECTO_KG", "0.1"))
+
+# Ubicación: el GPS del EXIF de cada foto tiene prioridad; la consulta por IP es solo un respaldo en caché
+COORDENADAS_POR_DEFECTO = os.environ.get("COORDENADAS_POR_DEFECTO", "8.98, -79.52")
+URL_UBICACION_IP = os.environ.get("URL_UBICACION_IP", "http://ip-api.com/json/")
+TTL_UBICACION_IP_S = float(os.environ.get("TTL_UBICACION_IP_S", "3600"))
+
 # Configuración de Gemini
+MODELO_GEMINI = os.environ.get("MODELO_GEMINI", "gemini-2.5-flash")
+MAX_CONCURRENCIA_GEMINI = int(os.environ.get("MAX_CONCURRENCIA_GEMINI", "2"))
+DIRECTORIO_ANALISIS = DIRECTORIO_BASE / "data" / "analisis"
+TTL_ANALISIS_S = float(os.environ.get("TTL_ANALISIS_S", "86400"))
+MAX_TRABAJOS_ANALISIS = int(os.environ.get("MAX_TRABAJOS_ANALISIS", "256"))
+MAX_ARCHIVOS_ANALISIS = int(os.environ.get("MAX_ARCHIVOS_ANALISIS", "2000"))
+DIRECTORIO_CACHE = DIRECTORIO_BASE / "data" / "cache"
+VERSION_PROMPT_GEMINI = "2"
+TTL_CACHE_GEMINI_S = float(os.environ.get("TTL_CACHE_GEMINI_S", "86400"))
+MAX_ENTRADAS_CACHE_GEMINI = int(os.environ.get("MAX_ENTRADAS_CACHE_GEMINI", "512"))
+MAX_ENTRADAS_CACHE_DISCO = int(os.environ.get("MAX_ENTRADAS_CACHE_DISCO", "5000"))
+# Capa de resiliencia: cuota local (solicitudes/minuto), reintentos y enfriamiento tras fallas seguidas
+# GEMINI_BASE_URL permite apuntar a un servidor falso local (scripts/fake_gemini_server.py)
+GEMINI_BASE_URL = os.environ.get("GEMINI_BASE_URL")
+TIEMPO_LIMITE_GEMINI_S = float(os.environ.get("TIEMPO_LIMITE_GEMINI_S", "30"))
+GEMINI_SOLICITUDES_POR_MINUTO = float(os.environ.get("GEMINI_SOLICITUDES_POR_MINUTO", "10"))
+GEMINI_MAX_REINTENTOS = int(os.environ.get("GEMINI_MAX_REINTENTOS", "3"))
+GEMINI_FALLAS_PARA_ABRIR = int(os.environ.get("GEMINI_FALLAS_PARA_ABRIR", "3"))
+GEMINI_ENFRIAMIENTO_S = float(os.environ.get("GEMINI_ENFRIAMIENTO_S", "60"))
 cliente = None
 try:
     api_key = os.environ.get("GEMINI_API_KEY")
     if api_key:
-        cliente = genai.Client(api_key=api_key)
+        opciones_http = types.HttpOptions(base_url=GEMINI_BASE_URL, timeout=int(TIEMPO_LIMITE_GEMINI_S * 1000))
+        cliente = ResilientGeminiClient(
+            genai.Client(api_key=api_key, http_options=opciones_http),
+            rate_per_minute=GEMINI_SOLICITUDES_POR_MINUTO, max_retries=GEMINI_MAX_REINTENTOS,
+            failure_threshold=GEMINI_FALLAS_PARA_ABRIR, cooldown_s=GEMINI_ENFRIAMIENTO_S
+        )
     else:
         pass
 except Exception as e:
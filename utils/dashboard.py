@@ -3,11 +3,17 @@ import pandas as pd
 import altair as alt
 import datetime
 from utils.config import categorias, CSV_REGISTROS
-from utils.helpers import obtener_categoria_valor_reciclaje, generar_resumen_reporte, calcular_impacto_ambiental
+from utils.helpers import obtener_categoria_valor_reciclaje, generar_resumen_reporte
+from src.config.settings import MAX_PUNTOS_MAPA
+from src.data.manager import DataManager
 import folium
 from streamlit_folium import st_folium
 
+# Lee del almacén configurado (CSV, SQLite o Parquet), el mismo en el que escribe app.py
+gestor_datos = DataManager(CSV_REGISTROS)
+
 def mostrar_mapa_residuos(df_filtrado, mostrar_peso=True):
+    # df_filtrado: columnas lat, lon, sector, class, peso_total_foto_kg y timestamp (DataManager.map_points)
     if df_filtrado.empty:
         st.info("No hay datos para mostrar en el mapa")
         return
@@ -19,7 +25,7 @@ def mostrar_mapa_residuos(df_filtrado, mostrar_peso=True):
     puntos_agregados = 0
     for _, row in df_filtrado.iterrows():
         try:
-            lat, lon = map(float, [s.strip() for s in row['coordenadas'].split(',')])
+            lat, lon = float(row['lat']), float(row['lon'])
             peso_text = f"<b>Peso:</b> {row.get('peso_total_foto_kg', 'N/A')} kg<br>" if mostrar_peso else ""
             popup_text = f"""
             <b>Sector:</b> {row['sector']}<br>
@@ -62,27 +68,25 @@ def mostrar_dashboard():
     </div>
     """, unsafe_allow_html=True)
 
-    df = pd.read_csv(CSV_REGISTROS)
-
-    if not df.empty:
-        df['timestamp'] = pd.to_datetime(df['timestamp'])
-        df['date'] = df['timestamp'].dt.date
-
-        df_filtrado = df.copy()
+    # Solo agregados por consulta (en SQL con SQLite, solo las columnas necesarias con Parquet),
+    # sin cargar el historial completo
+    conteos = gestor_datos.class_counts()
 
+    if not conteos.empty:
         # Métricas principales mejoradas
-        if not df_filtrado.empty:
+        if conteos.sum() > 0:
             # Cálculos de métricas
-            total_general = df_filtrado["class"].value_counts().sum()
+            resumen = gestor_datos.summary()
+            total_general = int(conteos.sum())
             reciclables = ['PLASTIC', 'METAL', 'PAPER', 'GLASS', 'CARDBOARD']
-            total_reciclable = df_filtrado[df_filtrado["class"].isin(reciclables)]["class"].value_counts().sum()
+            total_reciclable = int(conteos[conteos.index.isin(reciclables)].sum())
             porcentaje_reciclable = (total_reciclable / total_general) * 100 if total_general > 0 else 0
-            avg_confidence = df_filtrado['confidence'].mean() * 100
-            total_peso = df_filtrado['peso_total_foto_kg'].sum() if 'peso_total_foto_kg' in df_filtrado.columns else 0
-            impacto_co2 = calcular_impacto_ambiental(df_filtrado)
+            avg_confidence = resumen['confianza_media'] * 100
+            total_peso = resumen['peso_total']
+            impacto_co2 = gestor_datos.environmental_impact(gestor_datos.weight_by_class())
 
             # Alertas inteligentes
-            porc_residuales = df_filtrado[~df_filtrado["class"].isin(reciclables)]["class"].value_counts().sum() / total_general * 100 if total_general > 0 else 0
+            porc_residuales = (total_general - total_reciclable) / total_general * 100 if total_general > 0 else 0
 
             if porc_residuales > 40:
                 st.error(f"ALERTA: Residuales ({porc_residuales:.1f}%) exceden el 40%. Riesgo Sanitario alto.")
@@ -132,7 +136,7 @@ def mostrar_dashboard():
 
             with col_chart1:
                 st.markdown("#### Distribución por Tipo")
-                counts = df_filtrado["class"].value_counts().reset_index()
+                counts = conteos.reset_index()
                 counts.columns = ["Tipo", "Cantidad"]
 
                 chart_composition = (
@@ -152,8 +156,7 @@ def mostrar_dashboard():
 
             with col_chart2:
                 st.markdown("#### Valor Reciclaje")
-                df_filtrado['categoria_valor'] = df_filtrado['class'].apply(obtener_categoria_valor_reciclaje)
-                value_counts = df_filtrado['categoria_valor'].value_counts().reset_index()
+                value_counts = conteos.groupby(conteos.index.map(obtener_categoria_valor_reciclaje)).sum().sort_values(ascending=False).reset_index()
                 value_counts.columns = ['Categoría', 'Cantidad']
 
                 chart_value = (
@@ -178,7 +181,7 @@ def mostrar_dashboard():
 
             with col_trend:
                 st.markdown("#### Tendencia Temporal")
-                df_tendencia = df_filtrado.groupby('date')['id'].count().reset_index()
+                df_tendencia = gestor_datos.counts_by('date').reset_index()
                 df_tendencia.columns = ['Fecha', 'Cantidad']
 
                 chart_trend = (
@@ -196,8 +199,7 @@ def mostrar_dashboard():
 
             with col_time:
                 st.markdown("#### Distribución por Hora")
-                df_filtrado['hora'] = df_filtrado['timestamp'].dt.hour
-                hourly_counts = df_filtrado.groupby('hora')['id'].count().reset_index()
+                hourly_counts = gestor_datos.counts_by('hour').reset_index()
                 hourly_counts.columns = ['Hora', 'Cantidad']
 
                 chart_hourly = (
@@ -215,11 +217,11 @@ def mostrar_dashboard():
                 st.altair_chart(chart_hourly, use_container_width=True)
 
             # Análisis por sector si hay múltiples sectores
-            if len(df_filtrado['sector'].unique()) > 1:
+            if len(resumen['sectores']) > 1:
                 st.markdown("---")
                 st.markdown("### Análisis por Sector")
 
-                sector_comparison = df_filtrado.groupby('sector')['id'].count().reset_index()
+                sector_comparison = gestor_datos.counts_by('sector').reset_index()
                 sector_comparison.columns = ['Sector', 'Total_Residuos']
 
                 chart_sector = (
@@ -240,14 +242,14 @@ def mostrar_dashboard():
             st.markdown("---")
             st.markdown("### Datos Detallados")
 
-            # Preparar datos para mostrar
-            df_mostrar = df_filtrado.copy()
+            # Preparar datos para mostrar: los 50 registros más recientes
+            df_mostrar = gestor_datos.recent_records(50)
             df_mostrar['timestamp'] = df_mostrar['timestamp'].dt.strftime('%Y-%m-%d %H:%M')
             df_mostrar = df_mostrar[['timestamp', 'sector', 'class', 'confidence', 'peso_total_foto_kg', 'coordenadas']]
             df_mostrar.columns = ['Fecha/Hora', 'Sector', 'Tipo', 'Confianza', 'Peso (kg)', 'Coordenadas']
 
             st.dataframe(
-                df_mostrar.tail(50),
+                df_mostrar,
                 use_container_width=True,
                 column_config={
                     "Confianza": st.column_config.NumberColumn(format="%.1f%%"),
@@ -272,13 +274,17 @@ def mostrar_dashboard():
             with col_map_filt2:
                 mostrar_peso = st.checkbox("Mostrar peso en popups", value=True, key="mostrar_peso")
             
-            # Aplicar filtro de vista
-            df_mapa = df_filtrado.copy()
+            # Aplicar filtro de vista (lo resuelve la consulta; solo se traen los puntos más recientes)
+            filtro_clases = {}
             if vista_mapa == "Solo reciclables":
-                df_mapa = df_mapa[df_mapa["class"].isin(reciclables)]
+                filtro_clases = {'classes': reciclables}
             elif vista_mapa == "Solo no reciclables":
-                df_mapa = df_mapa[~df_mapa["class"].isin(reciclables)]
-            
+                filtro_clases = {'classes': reciclables, 'exclude_classes': True}
+            df_mapa = gestor_datos.map_points(MAX_PUNTOS_MAPA, **filtro_clases)
+            total_puntos = gestor_datos.map_point_count(**filtro_clases)
+            if total_puntos > len(df_mapa):
+                st.caption(f"Se muestran los {len(df_mapa):,} registros más recientes de {total_puntos:,} con coordenadas (MAX_PUNTOS_MAPA).")
+
             mostrar_mapa_residuos(df_mapa, mostrar_peso)
 
         else:
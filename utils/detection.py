@@ -1,34 +1,28 @@
 import streamlit as st
-import numpy as np
 import pandas as pd
-import re
-from utils.config import cliente, categorias, CSV_REGISTROS
-from utils.helpers import agregar_registro
-from ultralytics import YOLO
-from pathlib import Path
-import os
-
-def extraer_peso_estimado(respuesta_texto):
-    # Extrae el peso total estimado en kg de la respuesta de Gemini
-    patrones = [
-        r"Peso Total Estimado[:\s]*([\d\.]+)\s*kg",
-        r"peso total[:\s]*([\d\.]+)\s*kg",
-        r"([\d\.]+)\s*kg"
-    ]
-    for patron in patrones:
-        match = re.search(patron, respuesta_texto, re.IGNORECASE)
-        if match:
-            try:
-                return float(match.group(1))
-            except ValueError:
-                continue
-    return 0.0
-
-def obtener_resumen_datos(df, datos_categorias, conteo_actual):
+from utils.config import (
+    cliente, categorias, CSV_REGISTROS,
+    MODELO_GEMINI, MAX_CONCURRENCIA_GEMINI, DIRECTORIO_ANALISIS, TTL_ANALISIS_S, MAX_TRABAJOS_ANALISIS, MAX_ARCHIVOS_ANALISIS,
+    RUTA_CALIBRACION_PESO, PESO_POR_DEFECTO_KG,
+    DIRECTORIO_CACHE, VERSION_PROMPT_GEMINI, TTL_CACHE_GEMINI_S, MAX_ENTRADAS_CACHE_GEMINI, MAX_ENTRADAS_CACHE_DISCO
+)
+from src.data.manager import DataManager
+from src.detection.gemini_cache import get_response_cache, make_analysis_key
+from src.detection.gemini_jobs import get_job_queue
+from src.detection.detector import WasteDetector
+from src.detection.weights import WeightEstimator
+
+estimador_peso = WeightEstimator(categorias, RUTA_CALIBRACION_PESO, PESO_POR_DEFECTO_KG)
+
+# Mismo detector que el flujo de src: YOLO corre una sola vez por foto con el umbral mínimo
+# y el umbral de confianza solo filtra las cajas crudas
+detector = WasteDetector()
+
+def obtener_resumen_datos(top_clases, datos_categorias, conteo_actual):
     # Genera un resumen de los datos y del conteo actual para el prompt de Gemini
+    # top_clases: clases más frecuentes del historial (Serie con formato de value_counts)
     resumen_csv = "Historial Total de Desechos (Top 5):\n"
-    if not df.empty:
-        top_clases = df["class"].value_counts().head(5)
+    if not top_clases.empty:
         resumen_csv += top_clases.to_string()
     else:
         resumen_csv += "Aún no hay registros históricos."
@@ -43,105 +37,140 @@ def obtener_resumen_datos(df, datos_categorias, conteo_actual):
 
     return f"{resumen_csv}\n\n{info_categorias}\n\n{resumen_actual}"
 
-# Global para cachear el modelo
-modelo_cache = None
+def construir_prompt_analisis(sector, serie_conteo):
+    # Arma el prompt de Gemini con el historial, las categorías y el conteo de la foto
+    # El historial sale de los contadores incrementales, sin volver a leer el CSV
+    top_clases = DataManager(CSV_REGISTROS).aggregates.top_classes(5)
+    resumen_datos = obtener_resumen_datos(top_clases, categorias, serie_conteo)
 
-def ejecutar_deteccion_analisis_gemini(imagen, tipo_fuente, nombre_archivo, sector, coordenadas, umbral_confianza, usar_gemini=True):
-    # Ejecuta YOLO, guarda los registros con GPS y llama a Gemini
-    
-    global modelo_cache
-    if modelo_cache is None:
-        RUTA_MODELO = Path(os.getcwd()) / "models" / "best.pt"
-        try:
-            modelo_cache = YOLO(str(RUTA_MODELO))
-        except Exception as e:
-            st.error(f"Error al cargar el modelo YOLO: {e}")
-            return
-    
-    modelo = modelo_cache
-    resultados = modelo(np.array(imagen), conf=umbral_confianza)[0]
-    
-    conteo_actual = {nombre: 0 for nombre in modelo.names.values()}
-    registros_para_csv = []
-    
-    for caja in resultados.boxes:
-        id_clase = int(caja.cls)
-        confianza = float(caja.conf)
-        nombre_clase = modelo.names.get(id_clase, f"Clase ID {id_clase}")
-        
-        conteo_actual[nombre_clase] += 1
-        
-        registros_para_csv.append({
-            'source': tipo_fuente, 'file_name': nombre_archivo, 'sector': sector, 
-            'coordenadas': coordenadas, 'class': nombre_clase, 'confidence': confianza
-        })
+    tarea = (
+        f"Analiza la composición de desechos encontrados en esta foto (Conteo de la FOTO ACTUAL en el sector '{sector}'). "
+        f"Responde en formato Markdown:\n"
+        f"1. **Prioridad de Reciclaje Inmediato**: Indica las 2-3 categorías más valiosas para el reciclaje detectadas en esta foto y sugiere la acción más inmediata para el municipio (ej: coordinar camión específico, notificar centro de acopio).\n"
+        f"2. **Riesgo Ambiental Clave**: Indica si la composición (Orgánico vs. Plástico, etc.) representa un problema de salud pública/contaminación del agua más urgente y por qué. "
+    )
+    return f"CONTEXTO DE DATOS:\n{resumen_datos}\n\nTAREA:\n{tarea}"
 
-    total_detectado = sum(conteo_actual.values())
-    st.subheader(f"Detección completada: {total_detectado} ítems encontrados (Conf > {umbral_confianza*100:.0f}%)")
+def obtener_cola_analisis():
+    # Cola de análisis de Gemini compartida por todas las sesiones, con caché de respuestas
+    # Mismos argumentos que WasteDetector.get_analysis_queue: la caché es única por proceso y la crea el primero que la pide
+    cache_respuestas = get_response_cache(
+        DIRECTORIO_CACHE / "gemini", TTL_CACHE_GEMINI_S, MAX_ENTRADAS_CACHE_GEMINI, MAX_ENTRADAS_CACHE_DISCO
+    )
+    return get_job_queue(
+        cliente, DIRECTORIO_ANALISIS, MODELO_GEMINI, MAX_CONCURRENCIA_GEMINI, cache_respuestas,
+        TTL_ANALISIS_S, MAX_TRABAJOS_ANALISIS, MAX_ARCHIVOS_ANALISIS
+    )
+
+def mostrar_analisis(id_analisis):
+    # Muestra el estado del análisis en segundo plano; retorna el trabajo para saber si hay que volver a consultar
+    cola = obtener_cola_analisis()
+    trabajo = cola.status(id_analisis)
+    st.subheader("Análisis Avanzado")
+    if trabajo is None:
+        st.warning("No se encontró el análisis solicitado.")
+    elif trabajo['estado'] in ('pendiente', 'procesando'):
+        st.info("⏳ Generando análisis avanzado para toma de decisiones... Los datos de detección ya se guardaron.")
+    elif trabajo['estado'] == 'completado':
+        st.success(trabajo['analisis'])
+        if trabajo.get('desde_cache'):
+            st.caption("Respuesta reutilizada de un análisis previo del sector con el mismo conteo.")
+    else:
+        error_msg = trabajo.get('error', '')
+        if trabajo.get('transitorio'):
+            st.warning("**Servidores de Gemini sobrecargados**\n\nLos servidores de Google están temporalmente saturados. El análisis avanzado estará disponible en unos minutos. Los datos de detección se guardaron correctamente.")
+        elif trabajo.get('codigo') == 400 or "INVALID_ARGUMENT" in error_msg:
+            st.error("❌ **Error de configuración**\n\nRevisa tu clave de API de Gemini. Puede estar expirada o ser inválida.")
+        elif trabajo.get('codigo') == 403 or "PERMISSION_DENIED" in error_msg:
+            st.error("🚫 **Acceso denegado**\n\nVerifica que tu clave de API tenga permisos para usar Gemini.")
+        else:
+            st.warning(f"⚠️ **Error en análisis avanzado**\n\n{error_msg}\n\nLos datos básicos de detección se guardaron correctamente.")
+    return trabajo
+
+def detectar_residuos(imagen):
+    # Ejecuta YOLO una sola vez con el umbral mínimo; retorna las cajas crudas o None si el modelo no cargó
+    # imagen: PreparedImage sin decodificar (el modelo recibe el buffer reducido, con draft en JPEG) o un arreglo/PIL
+    try:
+        return detector.detect_raw(imagen)
+    except Exception as e:
+        st.error(f"Error al cargar el modelo YOLO: {e}")
+        return None
 
-    peso_estimado_total = 0.0
+def mostrar_detecciones(crudo, umbral_confianza):
+    # Filtra las cajas crudas con el umbral y muestra la imagen anotada y el conteo; no ejecuta el modelo
+    imagen, arreglo, nombres = crudo['image'], crudo['image_array'], crudo['names']
+    detecciones = detector.filter_detections(crudo['detecciones'], umbral_confianza)
+    conteo_actual = detector.count_classes(detecciones, nombres)
+    total_detectado = len(detecciones)
+    st.subheader(f"Detección completada: {total_detectado} ítems encontrados (Conf > {umbral_confianza*100:.0f}%)")
 
-    imagen_salida = resultados.plot()
+    # Las cajas se dibujan a resolución de pantalla (sobre el original, decodificado solo a ese tamaño)
+    # y la imagen se entrega ya codificada, con el renderizador compartido con el flujo de src: los bytes
+    # quedan en caché por foto, versión del modelo y umbral, así que un rerun no vuelve a dibujar ni codificar
+    clave = (crudo['digest'], crudo['model_version'], round(umbral_confianza, 3))
+    imagen_salida = detector.plot_detections(imagen, arreglo, detecciones, nombres, clave)
     st.image(imagen_salida, caption=f"Imagen con {total_detectado} desechos detectados", width='stretch')
 
     df_conteo = pd.Series(conteo_actual).rename_axis('class').to_frame('count').sort_values('count', ascending=False)
     st.markdown("### Reporte de Cuantificación por Foto")
     st.dataframe(df_conteo, width='stretch')
+    return detecciones, conteo_actual, df_conteo, imagen_salida
 
-    st.markdown("---")
+def ejecutar_deteccion_analisis_gemini(imagen, tipo_fuente, nombre_archivo, sector, coordenadas, umbral_confianza, usar_gemini=True, marca_tiempo=None, crudo=None):
+    # Filtra las detecciones con el umbral, guarda los registros con GPS y encola el análisis de Gemini en segundo plano
+    # marca_tiempo: fecha de captura (EXIF) de la foto; sin ella se usa la hora de registro
+    # crudo: resultado previo de detectar_residuos, para registrar con otro umbral sin volver a inferir
+    crudo = crudo or detectar_residuos(imagen)
+    if crudo is None:
+        return
+    nombres = crudo['names']
+
+    detecciones, conteo_actual, df_conteo, imagen_salida = mostrar_detecciones(crudo, umbral_confianza)
+    total_detectado = len(detecciones)
+    registros_para_csv = [
+        {
+            'source': tipo_fuente, 'file_name': nombre_archivo, 'sector': sector,
+            'coordenadas': coordenadas, 'timestamp': marca_tiempo,
+            'class': nombres.get(id_clase, f"Clase ID {id_clase}"), 'confidence': float(confianza)
+        }
+        for id_clase, confianza in zip(detecciones[:, 5].astype(int), detecciones[:, 4])
+    ]
+
+    prompt_completo = None
     if cliente and total_detectado > 0 and usar_gemini:
-        st.subheader("Análisis Avanzado")
-        df_historial = pd.read_csv(CSV_REGISTROS) 
-        resumen_datos = obtener_resumen_datos(df_historial, categorias, df_conteo['count'])
-        
-        tarea = (
-            f"Analiza la composición de desechos encontrados en esta foto (Conteo de la FOTO ACTUAL en el sector '{sector}'). "
-            f"Responde en formato Markdown:\n"
-            f"1. **Peso Total Estimado (kg)**: Estima el peso total aproximado de *todos* los desechos detectados en esta foto basándote en conocimientos generales de pesos típicos de desechos. Muestra la estimación en kilogramos (kg). (Ej: 'Peso Total Estimado: 15.3 kg').\n"
-            f"2. **Prioridad de Reciclaje Inmediato**: Indica las 2-3 categorías más valiosas para el reciclaje detectadas en esta foto y sugiere la acción más inmediata para el municipio (ej: coordinar camión específico, notificar centro de acopio).\n"
-            f"3. **Riesgo Ambiental Clave**: Indica si la composición (Orgánico vs. Plástico, etc.) representa un problema de salud pública/contaminación del agua más urgente y por qué. "
-        )
-        prompt_completo = f"CONTEXTO DE DATOS:\n{resumen_datos}\n\nTAREA:\n{tarea}"
-        
-        try:
-            with st.spinner('Generando análisis avanzado para toma de decisiones...'):
-                respuesta = cliente.models.generate_content(
-                    model='gemini-2.5-flash', contents=prompt_completo
-                )
-            peso_estimado_total = extraer_peso_estimado(respuesta.text)
-            st.success(respuesta.text)
-        except Exception as e:
-            error_msg = str(e)
-            if "503" in error_msg or "UNAVAILABLE" in error_msg:
-                st.warning("**Servidores de Gemini sobrecargados**\n\nLos servidores de Google están temporalmente saturados. El análisis avanzado estará disponible en unos minutos. Los datos de detección se guardaron correctamente.")
-            elif "400" in error_msg or "INVALID_ARGUMENT" in error_msg:
-                st.error("❌ **Error de configuración**\n\nRevisa tu clave de API de Gemini. Puede estar expirada o ser inválida.")
-            elif "403" in error_msg or "PERMISSION_DENIED" in error_msg:
-                st.error("🚫 **Acceso denegado**\n\nVerifica que tu clave de API tenga permisos para usar Gemini.")
-            else:
-                st.warning(f"⚠️ **Error en análisis avanzado**\n\n{error_msg}\n\nLos datos básicos de detección se guardaron correctamente.")
-            peso_estimado_total = 0.0
-    else:
-        pass
+        prompt_completo = construir_prompt_analisis(sector, df_conteo['count'])
 
-    # Si no se obtuvo estimación de peso, calcular una aproximación simple
-    if peso_estimado_total == 0.0 and total_detectado > 0:
-        peso_estimado_total = total_detectado * 0.1  # Estimación de 100g por ítem promedio
-        st.info(f"Estimación simple de peso: {peso_estimado_total:.1f} kg (basado en {total_detectado} ítems a 100g cada uno)")
+    # Peso estimado localmente: masa típica de cada clase escalada por el área de su caja
+    pesos = estimador_peso.estimate(detecciones, nombres, crudo['image_array'].shape)
+    peso_estimado_total = float(pesos.sum())
+    if total_detectado > 0:
+        st.info(f"Peso estimado: {peso_estimado_total:.2f} kg (masa típica por clase según el tamaño de cada objeto)")
 
-    # Agregar registros con el peso estimado
+    gestor_datos = DataManager(CSV_REGISTROS)
+    ids_registros = []
     try:
-        for registro in registros_para_csv:
-             agregar_registro(CSV_REGISTROS, registro['source'], registro['file_name'], 
-                           registro['sector'], registro['coordenadas'], 
-                           registro['class'], registro['confidence'], peso_estimado_total)
+        # Cada registro guarda el peso de su caja, igual que en el flujo de src
+        for registro, peso in zip(registros_para_csv, pesos):
+            registro['peso_total_foto_kg'] = float(peso)
+        ids_registros = gestor_datos.add_records(registros_para_csv)
     except Exception as e:
         st.warning(f"Error al guardar registros en CSV: {e}. Los datos de detección se procesaron correctamente.")
 
+    st.markdown("---")
+    id_analisis = None
+    if prompt_completo and ids_registros:
+        cola = obtener_cola_analisis()
+        id_analisis = cola.submit(
+            prompt_completo, ids_registros,
+            cache_key=make_analysis_key(sector, conteo_actual, VERSION_PROMPT_GEMINI)
+        )
+        st.info("El análisis avanzado de Gemini se está generando en segundo plano.")
+
     # Retornar resultados para mostrar métricas
     return {
         'total_items': total_detectado,
         'peso_total': peso_estimado_total,
         'desglose': df_conteo.to_dict('records'),
-        'imagen_procesada': imagen_salida
+        'imagen_procesada': imagen_salida,
+        'analisis_id': id_analisis
     }
\ No newline at end of file
@@ -1,32 +1,20 @@
-import os
-import csv
-from datetime import datetime
-from pathlib import Path
-import pandas as pd
-import uuid
+from src.data.writer import RecordWriter
 
 def asegurar_archivo_registros(ruta_archivo):
     # Asegura que el archivo CSV de registros exista con los encabezados correctos
-    if not os.path.exists(ruta_archivo):
-        encabezado = ['id', 'timestamp', 'source', 'file_name', 'sector', 'coordenadas', 'class', 'confidence', 'peso_total_foto_kg']
-        df = pd.DataFrame(columns=encabezado)
-        df.to_csv(ruta_archivo, index=False)
+    RecordWriter(ruta_archivo).ensure_exists()
 
 def agregar_registro(ruta_archivo, fuente, nombre_archivo, sector, coordenadas, nombre_clase, confianza, peso_total_foto_kg):
-    # Añade un nuevo registro de detección al archivo CSV
-    nuevo_registro = {
-        'id': str(uuid.uuid4()),
-        'timestamp': datetime.now().isoformat(),
-        'source': fuente,
-        'file_name': nombre_archivo,
-        'sector': sector,
-        'coordenadas': coordenadas,
-        'class': nombre_clase,
-        'confidence': confianza,
-        'peso_total_foto_kg': peso_total_foto_kg
-    }
-    df_nuevo = pd.DataFrame([nuevo_registro])
-    df_nuevo.to_csv(ruta_archivo, mode='a', header=False, index=False)
+    # Añade un nuevo registro de detección al archivo CSV (para todas las detecciones de una foto, usar agregar_registros)
+    agregar_registros(ruta_archivo, [{
+        'source': fuente, 'file_name': nombre_archivo, 'sector': sector, 'coordenadas': coordenadas,
+        'class': nombre_clase, 'confidence': confianza, 'peso_total_foto_kg': peso_total_foto_kg
+    }])
+
+def agregar_registros(ruta_archivo, registros):
+    # Añade en una sola escritura los registros de una o varias fotos; retorna los ids asignados
+    filas = RecordWriter(ruta_archivo).append(registros)
+    return [fila['id'] for fila in filas]
 
 def obtener_categoria_valor_reciclaje(nombre_clase):
     # Clasifica el desecho como Alto Valor, Bajo Valor o Residual
@@ -120,8 +108,8 @@ def generar_resumen_reporte(df_filtrado, categorias):
     # Top 3 de Desechos
     top_3 = conteos.head(3).to_string()
 
-    # Cálculo de Peso Estimado Total
-    peso_total_kg = df_filtrado.drop_duplicates(subset=['file_name'])['peso_total_foto_kg'].sum()
+    # Cálculo de Peso Estimado Total (cada fila guarda el peso de su ítem)
+    peso_total_kg = df_filtrado['peso_total_foto_kg'].sum()
 
     # Conteo de Puntos Críticos
     puntos_criticos = df_filtrado.groupby(['file_name', 'sector', 'coordenadas']).size().reset_index(name='Total_Desechos').sort_values('Total_Desechos', ascending=False).head(3)